@@ -0,0 +1,133 @@
+"""Local-adaptive Otsu threshold from the bimodal cells of a grid over the ROI.
+
+A single histogram over a long river corridor is dominated by whichever of water or land covers
+more of it, so its Otsu split drifts. Following the split-based approach, the ROI is cut into a grid
+of cells, each cell's histogram is fetched in one grouped reduction (reduceRegions with a fixed-bin
+histogram, so cells can be summed), and only cells whose Otsu split separates two well-populated,
+well-separated classes are merged for the final threshold.
+"""
+import logging
+import os
+import tempfile
+import time
+
+import ee
+import numpy as np
+
+import local_engine
+import tiling
+from ee_client import get_info
+from result_cache import analysis_key
+
+logger = logging.getLogger(__name__)
+
+CELL_SIZE_M = 5000
+HIST_MIN = -30.0
+HIST_MAX = 5.0
+HIST_STEPS = 350
+# Bimodality test: Ashman's D between the two Otsu classes and the share of the smaller class. The
+# classes are truncated at the split, so a single Gaussian cut at its mean already scores D ~ 2.7;
+# hence 3 rather than the usual mixture-model cutoff of 2.
+MIN_ASHMAN_D = 3.0
+MIN_CLASS_FRACTION = 0.1
+MIN_CELL_PIXELS = 500
+
+
+def bucket_means():
+    width = (HIST_MAX - HIST_MIN) / HIST_STEPS
+    return HIST_MIN + (np.arange(HIST_STEPS) + 0.5) * width
+
+
+def split_quality(counts, means):
+    """(otsu threshold, Ashman's D, smaller class fraction) of one histogram; None if too sparse."""
+    total = counts.sum()
+    if total < MIN_CELL_PIXELS:
+        return None
+    threshold = local_engine.otsu_threshold({'histogram': counts, 'bucketMeans': means})
+    low = means <= threshold
+    classes = []
+    for part in (low, ~low):
+        n = counts[part].sum()
+        if n == 0:
+            return threshold, 0.0, 0.0
+        mean = (counts[part] * means[part]).sum() / n
+        classes.append((n, mean, (counts[part] * (means[part] - mean) ** 2).sum() / n))
+    (n1, m1, v1), (n2, m2, v2) = classes
+    ashman_d = np.sqrt(2) * abs(m1 - m2) / np.sqrt(v1 + v2) if v1 + v2 > 0 else np.inf
+    return threshold, float(ashman_d), float(min(n1, n2) / total)
+
+
+def threshold_from_cells(cell_counts):
+    """Merge the bimodal cells' histograms and Otsu-split them.
+
+    Returns dict(threshold, bimodal, quality, fallback); when no cell is bimodal all cells are merged
+    and ``fallback`` is True, so callers can tell instead of silently getting a default.
+    """
+    means = bucket_means()
+    quality = [split_quality(counts, means) for counts in cell_counts]
+    bimodal = [i for i, q in enumerate(quality)
+               if q is not None and q[1] >= MIN_ASHMAN_D and q[2] >= MIN_CLASS_FRACTION]
+    fallback = not bimodal
+    merged = cell_counts[bimodal if bimodal else slice(None)].sum(axis=0)
+    if merged.sum() == 0:
+        raise ValueError("No valid pixels in any threshold cell")
+    return {
+        'threshold': local_engine.otsu_threshold({'histogram': merged, 'bucketMeans': means}),
+        'bimodal': bimodal,
+        'quality': quality,
+        'fallback': fallback,
+    }
+
+
+def cell_histograms(image, cells, scale=30, polarisation='VV'):
+    """(n_cells, HIST_STEPS) pixel counts of every cell, from a single reduceRegions call."""
+    collection = ee.FeatureCollection([ee.Feature(ee.Geometry(cell.core), {'cell': cell.index}) for cell in cells])
+    reduced = get_info(image.select(polarisation).reduceRegions(
+        collection=collection, reducer=ee.Reducer.fixedHistogram(HIST_MIN, HIST_MAX, HIST_STEPS),
+        scale=scale, tileScale=4
+    ).select(['cell', 'histogram'], None, False))
+    counts = np.zeros((len(cells), HIST_STEPS))
+    for feature in reduced['features']:
+        histogram = feature['properties'].get('histogram')
+        if histogram:
+            counts[feature['properties']['cell']] = np.asarray(histogram, dtype=np.float64)[:, 1]
+    return counts
+
+
+def adaptive_threshold(image, roi_geojson, before_dates, cache, key_params=None, orbit_pass='ASCENDING',
+                       polarisation='VV', cell_size_m=CELL_SIZE_M, scale=30):
+    """Threshold of the pre-event image from its bimodal cells, with the cell histograms cached.
+
+    ``key_params`` must pin down the image (filter settings, planned scenes); the after-event dates do
+    not enter the key, so changing them reuses the histograms. Returns threshold_from_cells' dict plus
+    ``cells`` (GeoJSON features with bimodal/ashman_d/pixels), ``seconds`` and ``cached``.
+    """
+    cells = tiling.make_tiles(roi_geojson, cell_size_m, pad_m=0)
+    params = dict(key_params or {}, query='cell_histograms', cell_size_m=cell_size_m, scale=scale,
+                  bins=[HIST_MIN, HIST_MAX, HIST_STEPS])
+    key = analysis_key(roi_geojson, before_dates, orbit_pass, polarisation, params)
+    start = time.perf_counter()
+    cached = cache.get(key) is not None
+    if cached:
+        counts = np.load(cache.path(key, 'counts.npy'))
+    else:
+        counts = cell_histograms(image, cells, scale, polarisation)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'counts.npy')
+            np.save(path, counts)
+            cache.put(key, {'cells': len(cells)}, files={'counts.npy': path})
+    seconds = time.perf_counter() - start
+
+    result = threshold_from_cells(counts)
+    if result['fallback']:
+        logger.warning("no bimodal cell among %d; threshold from all cells", len(cells))
+    bimodal = set(result['bimodal'])
+    result['cells'] = [{
+        'type': 'Feature', 'geometry': cell.core,
+        'properties': {
+            'cell': cell.index, 'bimodal': cell.index in bimodal, 'pixels': int(counts[cell.index].sum()),
+            'ashman_d': round(quality[1], 2) if quality else None,
+        },
+    } for cell, quality in zip(cells, result.pop('quality'))]
+    result.update(seconds=seconds, cached=cached)
+    return result
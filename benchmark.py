@@ -0,0 +1,636 @@
+"""Offline benchmarks for the flood analysis building blocks (no Earth Engine access needed)."""
+import argparse
+import datetime
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+
+import numpy as np
+
+import local_engine
+import synthetic
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+# Differences below this are timer noise, whatever the ratio.
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def _timeit(fn, *args, repeat=5):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_otsu(bucket_sizes=(255, 1024, 4096)):
+    print(f"{'buckets':>8} {'per-bucket ms':>14} {'cumsum ms':>10} {'speedup':>8} {'threshold':>10}")
+    for buckets in bucket_sizes:
+        hist = synthetic.bimodal_histogram(buckets)
+        old_time, old_threshold = _timeit(synthetic.otsu_threshold_per_bucket, hist)
+        new_time, new_threshold = _timeit(local_engine.otsu_threshold, hist)
+        print(f"{buckets:>8} {old_time * 1e3:>14.3f} {new_time * 1e3:>10.3f} "
+              f"{old_time / new_time:>7.1f}x {new_threshold:>10.3f}")
+    low, high = local_engine.multi_otsu_threshold(synthetic.bimodal_histogram(1024))
+    print(f"multi-Otsu (1024 buckets): {low:.3f} / {high:.3f}")
+
+
+def _cold_import_time(module, repeat=3):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-c', code], cwd=here, capture_output=True, text=True)
+        if proc.returncode != 0:
+            return None
+        times.append(float(proc.stdout.strip().splitlines()[-1]))
+    return min(times)
+
+
+def bench_import(modules=('flood_core', 'flood_app_streamlit')):
+    for module in modules:
+        seconds = _cold_import_time(module)
+        if seconds is None:
+            print(f"{module}: import failed")
+            continue
+        print(f"{module + ' cold import:':<33} {seconds * 1e3:8.1f} ms")
+
+
+# Cold page start (importing the app's dependencies and its first script run) and per-rerun script
+# time of the Streamlit page, in seconds.
+STARTUP_BUDGET = 2.0
+RERUN_BUDGET = 0.25
+def _import_profile(module, top=12):
+    """(module, cumulative ms) of the slowest direct imports of ``module``, from ``python -X importtime``.
+
+    A dependency shared by several modules is charged to whichever imports it first.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"], cwd=here,
+                          capture_output=True, text=True)
+    # Lines come in post-order: a module's direct imports (depth 1) precede its own line (depth 0).
+    children = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), int(cumulative) / 1e3))
+        elif depth == 0:
+            if name.strip() == module:
+                return [(module, int(cumulative) / 1e3)] + sorted(children, key=lambda item: -item[1])[:top]
+            children = []
+    return []
+
+
+def bench_startup(top=12):
+    """Streamlit page cold start and rerun time against a budget, with a per-module import profile."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    print("slowest imports of flood_app_streamlit (cumulative ms, python -X importtime):")
+    for name, ms in _import_profile('flood_app_streamlit', top):
+        print(f"  {name:<32} {ms:8.1f}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        proc = subprocess.run(
+            [sys.executable, '-c', synthetic.APP_RUN.format(path=os.path.join(here, 'flood_app_streamlit.py'))],
+            cwd=here, capture_output=True, text=True, env=dict(os.environ, FLOOD_CACHE_DIR=tmpdir)
+        )
+    if proc.returncode != 0:
+        raise RuntimeError(f"page run failed:\n{proc.stderr}")
+    run = json.loads(proc.stdout.strip().splitlines()[-1])
+    print(f"cold page start: {run['cold'] * 1e3:8.1f} ms (budget {STARTUP_BUDGET * 1e3:.0f} ms)")
+    print(f"map stack ready: {run['prewarm'] * 1e3:8.1f} ms after start (background)")
+    print(f"rerun (median):  {run['rerun'] * 1e3:8.1f} ms (budget {RERUN_BUDGET * 1e3:.0f} ms)")
+    over = [f"{name} {run[name]:.2f}s > {budget:.2f}s" for name, budget in (('cold', STARTUP_BUDGET), ('rerun', RERUN_BUDGET))
+            if run[name] > budget]
+    if over:
+        raise AssertionError(f"startup budget exceeded: {', '.join(over)}")
+    return {'cold_start': run['cold'], 'rerun': run['rerun']}
+
+
+def bench_ingest(vertices=100_000, tolerance_m=10):
+    import roi_ingest
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'roi.geojson')
+        with open(path, 'w') as f:
+            json.dump(synthetic.jagged_roi(vertices), f)
+        size_mb = os.path.getsize(path) / 1024 ** 2
+
+        def _geopandas_roundtrip():
+            import geopandas as gpd
+            return json.loads(gpd.read_file(path).to_json())
+
+        old_time, old = _timeit(_geopandas_roundtrip, repeat=3)
+        new_time, result = _timeit(lambda: roi_ingest.ingest(path, tolerance_m), repeat=3)
+    old_payload = len(json.dumps(old)) / 1024
+    new_payload = len(json.dumps(result['geojson'])) / 1024
+    print(f"input: {vertices:,} vertices, {size_mb:.1f} MB GeoJSON")
+    print(f"geopandas round trip: {old_time * 1e3:8.1f} ms, payload {old_payload:8.1f} KiB")
+    print(f"streaming ingest:     {new_time * 1e3:8.1f} ms, payload {new_payload:8.1f} KiB, "
+          f"{result['vertices_before']:,} -> {result['vertices_after']:,} vertices at {tolerance_m} m")
+
+
+def bench_lee(size=10_000, crop=2048, windows=(3, 5, 7, 9)):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        scene = synthetic.speckled_scene(local_engine.scratch((size, size), tmpdir, 'scene'))
+        out = local_engine.scratch((size, size), tmpdir, 'filtered')
+        sample = np.asarray(scene[:crop, :crop])
+        print(f"{'window':>6} {f'sliding {crop}^2 s':>16} {f'SAT {crop}^2 s':>12} {'speedup':>8} "
+              f"{f'SAT {size}^2 s':>13} {'Mpx/s':>7}")
+        for window in windows:
+            radius = window // 2
+            old_time, _ = _timeit(synthetic.lee_sliding_window, sample, radius, repeat=1)
+            new_time, _ = _timeit(local_engine.refined_lee_filter, sample, radius, repeat=1)
+            fn = partial(local_engine.refined_lee_filter, radius=radius)
+            full_time, _ = _timeit(local_engine.map_blocks, fn, [scene], out, radius, repeat=1)
+            print(f"{window:>6} {old_time:>16.2f} {new_time:>12.2f} {old_time / new_time:>7.1f}x "
+                  f"{full_time:>13.1f} {size * size / full_time / 1e6:>7.1f}")
+
+
+def bench_mask(size=10_000):
+    import packed_mask
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        stack = synthetic.mask_stack(tmpdir, size)
+        rasters = {name: local_engine.LocalRaster(array, None, None) for name, array in stack.items()}
+        pack_time, packed = _timeit(
+            lambda: {name: packed_mask.PackedMask.from_raster(r) for name, r in rasters.items()}, repeat=1
+        )
+
+        def dense_flood():
+            count = 0
+            for rows, cols in local_engine.iter_blocks((size, size)):
+                water, permanent, slope = (np.asarray(stack[n][rows, cols]) for n in stack)
+                count += int(((water == 1) & np.isfinite(slope) & (permanent == 0)).sum())
+            return count
+
+        def packed_flood():
+            return packed['water_cleaned'].updateMask(packed['slope_mask']).And(packed['permanent_water'].Not())
+
+        dense_time, dense_count = _timeit(dense_flood, repeat=1)
+        ops_time, flood = _timeit(packed_flood, repeat=3)
+        rle_time, (value_runs, _) = _timeit(flood.to_runs, repeat=1)
+
+        with tempfile.TemporaryDirectory() as outdir:
+            path = os.path.join(outdir, 'flood.geojson')
+            poly_time, polygons = _timeit(packed_mask.write_polygons, flood, path, repeat=1)
+
+    dense_bytes = 3 * size * size * 4
+    packed_bytes = sum(m.nbytes for m in packed.values())
+    print(f"{size:,} x {size:,} mask stack (3 masks), {dense_count:,} flood pixels")
+    print(f"float32 stack:   {dense_bytes / 1024 ** 2:8.1f} MiB")
+    print(f"uint8 stack:     {dense_bytes / 4 / 1024 ** 2:8.1f} MiB")
+    print(f"packed stack:    {packed_bytes / 1024 ** 2:8.1f} MiB ({dense_bytes / packed_bytes:.0f}x smaller, "
+          f"packed in {pack_time:.1f}s)")
+    print(f"flood RLE:       {value_runs.nbytes / 1024 ** 2:8.1f} MiB ({len(value_runs):,} runs, {rle_time:.2f}s)")
+    print(f"flood = water.updateMask(slope).And(permanent.Not()): dense blocks {dense_time * 1e3:.0f} ms, "
+          f"packed {ops_time * 1e3:.0f} ms")
+    print(f"polygonize: {polygons:,} polygons in {poly_time:.1f}s")
+
+
+def _naive_write(raster, path):
+    import rasterio
+
+    import raster_writer
+
+    data = np.asarray(raster.array, dtype=np.float32)
+    with rasterio.open(path, 'w', driver='GTiff', dtype='float32', count=1, width=data.shape[1], height=data.shape[0],
+                       crs=raster.crs, transform=raster.transform, nodata=np.nan, compress='deflate',
+                       zlevel=raster_writer.ZLIB_LEVEL) as dst:
+        dst.write(data, 1)
+    return path
+
+
+def _peak_traced(fn, *args):
+    """(seconds, peak MiB of Python/NumPy allocations) of one call."""
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        seconds, _ = _timeit(fn, *args, repeat=1)
+        return seconds, tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    finally:
+        tracemalloc.stop()
+
+
+def bench_writer(size=4096, max_workers=4):
+    """Streaming COG / Zarr writers vs reading the whole raster and writing it with one call."""
+    from affine import Affine
+
+    import raster_writer
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        array = local_engine.scratch((size, size), tmpdir, 'sar')
+        rng = np.random.default_rng(0)
+        for rows, cols in local_engine.iter_blocks((size, size)):
+            array[rows, cols] = rng.normal(-12, 4, (rows.stop - rows.start, cols.stop - cols.start)).round(1)
+        array.flush()
+        raster = local_engine.LocalRaster(array, Affine(0.0001, 0, 30.5, 0, -0.0001, 30.9), 'EPSG:4326')
+        runs = {
+            'naive': (_naive_write, raster, os.path.join(tmpdir, 'naive.tif')),
+            'cog': (partial(raster_writer.write_cog, max_workers=max_workers), raster, os.path.join(tmpdir, 'sar.tif')),
+            'zarr': (partial(raster_writer.write_zarr, max_workers=max_workers), raster,
+                     os.path.join(tmpdir, 'sar.zarr'), 'sar'),
+        }
+        results = {name: _peak_traced(*run) for name, run in runs.items()}
+
+    megabytes = size * size * 4 / 1e6
+    print(f"{size:,} x {size:,} float32 raster ({megabytes:.0f} MB), {max_workers} workers")
+    print(f"{'writer':<8} {'seconds':>8} {'MB/s':>8} {'peak MiB':>9}")
+    for name, (seconds, peak) in results.items():
+        print(f"{name:<8} {seconds:>8.2f} {megabytes / seconds:>8.1f} {peak:>9.1f}")
+    if (os.cpu_count() or 1) < max_workers:
+        # Fewer CPUs than workers leaves the parallel writers nothing to gain; such timings gate nothing.
+        print(f"{os.cpu_count()} CPU(s) < {max_workers} workers: timings not used for the baseline")
+        return {}
+    return {f"write_{name}": seconds for name, (seconds, _) in results.items()}
+
+
+def _run_sessions(sessions, session):
+    """Run session(i) on one thread per session; returns (seconds, number that raised)."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        futures = [executor.submit(session, i) for i in range(sessions)]
+    failed = sum(f.exception() is not None for f in futures)
+    return time.perf_counter() - start, failed
+
+
+def bench_client(sessions=20, requests=10, shared=5, latency=0.05, quota=8):
+    """Concurrent sessions against a quota-limited, flaky fake backend: bare calls vs ee_client.EEClient.
+
+    Each session makes ``requests`` evaluations, ``shared`` of them identical across sessions (users
+    looking at the same ROI). Bare sessions call sequentially and abort on the first error, like the app
+    did; client sessions submit their evaluations together through one shared EEClient.
+    """
+    import ee_client
+
+    def keys(i):
+        return [f"shared-{j}" for j in range(shared)] + [f"session{i}-{j}" for j in range(requests - shared)]
+
+    bare_backend = synthetic.FakeBackend(latency, quota)
+
+    def bare_session(i):
+        return [bare_backend.request(key) for key in keys(i)]
+
+    backend = synthetic.FakeBackend(latency, quota)
+    client = ee_client.EEClient(rate=1000, burst=quota, max_workers=quota, backoff=latency)
+
+    def client_session(i):
+        futures = [client.submit(partial(backend.request, key), key=key) for key in keys(i)]
+        return [f.result() for f in futures]
+
+    bare_time, bare_failed = _run_sessions(sessions, bare_session)
+    client_logger = logging.getLogger('ee_client')
+    level = client_logger.level
+    client_logger.setLevel(logging.ERROR)  # the injected errors would log a retry warning each
+    try:
+        client_time, client_failed = _run_sessions(sessions, client_session)
+    finally:
+        client_logger.setLevel(level)
+    stats = client.stats()
+
+    total = sessions * requests
+    print(f"{sessions} sessions x {requests} requests ({shared} shared), {latency * 1e3:.0f} ms latency, "
+          f"quota {quota} concurrent, 5% transient errors")
+    print(f"{'':<8} {'seconds':>8} {'failed':>7} {'backend calls':>14} {'req/s':>7}")
+    for name, seconds, failed, calls in (('bare', bare_time, bare_failed, bare_backend.calls),
+                                         ('client', client_time, client_failed, backend.calls)):
+        served = (sessions - failed) * requests
+        print(f"{name:<8} {seconds:>8.2f} {failed:>4}/{sessions} {calls:>14} {served / seconds:>7.0f}")
+    print(f"client: {stats.get('coalesced', 0)} of {total} coalesced, {stats.get('retries', 0)} retries")
+    return {f"client_{sessions}": client_time}
+
+
+def bench_watcher(days=30, intervals=(900, 3600), size=128):
+    """Acquisition watcher against a fake catalog on a simulated clock: polling cost and latency.
+
+    Two ROIs are watched; one analysis fails once and must be retried, and the watcher is restarted
+    from its saved state halfway through without repeating any analysis.
+    """
+    import fake_ee
+    import flood_core
+    import watcher
+
+    t0 = datetime.datetime(2025, 10, 1, tzinfo=datetime.timezone.utc).timestamp()
+    feed = synthetic.scene_feed(t0, days)
+    catalog = fake_ee.synthetic_catalog(size)
+    fake_dates = ('2023-08-01', '2023-08-20', '2023-09-15', '2023-09-25')
+    sample = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'sample_roi.geojson')
+    print(f"{days} days, {len(feed) // 2} passes of 2 frames, 2 ROIs, catalog ingest 1-6 h after acquisition")
+    print(f"{'interval':>9} {'queries':>8} {'jobs':>5} {'failed':>7} {'median h':>9} {'p95 h':>6} {'max h':>6} "
+          f"{'work s':>7}")
+    for interval in intervals:
+        sim = {'now': t0, 'poll_start': time.perf_counter()}
+
+        def clock():
+            return sim['now'] + time.perf_counter() - sim['poll_start']
+
+        def query(roi_geojson, start_ms, end_ms, orbit_pass):
+            now = clock()
+            return [scene for scene, ingest in feed if ingest <= now and start_ms <= scene['time'] < end_ms]
+
+        failures = {'S1A_131_002_0'}
+
+        def analyse(roi_geojson, dates, job):
+            if failures & {s['id'] for s in job.scenes}:
+                failures.clear()
+                raise fake_ee.EEException("Computation timed out.")
+            return flood_core.run_flood_analysis(fake_ee.Geometry(catalog.roi()), *fake_dates)['stats'].getInfo()
+
+        with tempfile.TemporaryDirectory() as tmpdir, fake_ee.use_fake_ee(catalog):
+            registry = os.path.join(tmpdir, 'registry.json')
+            watcher.register_roi('sample', sample, path=registry)
+            paths = {'registry_path': registry, 'state_path': os.path.join(tmpdir, 'state.json'),
+                     'results_path': os.path.join(tmpdir, 'results.jsonl')}
+            polls = int(days * 86400 / interval)
+            queries = 0
+            watcher_logger = logging.getLogger('watcher')
+            level = watcher_logger.level
+            watcher_logger.setLevel(logging.CRITICAL)  # the injected failure is expected
+            instance = None
+            try:
+                for poll in range(polls + 1):
+                    if instance is None or poll == polls // 2:
+                        queries += instance.queries if instance else 0
+                        # A fresh instance on the same files is a restarted service.
+                        instance = watcher.AcquisitionWatcher(query_fn=query, analyze_fn=analyse, clock=clock,
+                                                              **paths)
+                    sim.update(now=t0 + poll * interval, poll_start=time.perf_counter())
+                    instance.poll_once()
+            finally:
+                watcher_logger.setLevel(level)
+            queries += instance.queries
+            with open(paths['results_path']) as f:
+                records = [json.loads(line) for line in f]
+
+        ok = [r for r in records if r['status'] == 'ok']
+        summary = watcher.latency_summary(records)
+        work = sum(r['processing_s'] for r in ok)
+        print(f"{interval / 60:>7.0f} m {queries:>8} {summary['jobs']:>5} {len(records) - len(ok):>7} "
+              f"{summary['median_s'] / 3600:>9.2f} {summary['p95_s'] / 3600:>6.2f} {summary['max_s'] / 3600:>6.2f} "
+              f"{work:>7.2f}")
+
+
+def bench_archive(counts=(10_000, 100_000, 1_000_000), events=1000, parcels=1000):
+    """Flood-polygon archive: ingest, index build and query latency as the archive grows."""
+    import shapely
+
+    import flood_archive
+
+    with open(os.path.join(os.path.dirname(BASELINE_PATH), 'data', 'menofia_3km.geojson')) as f:
+        district = json.load(f)
+    district_bounds = shapely.bounds(flood_archive._as_geometry(district))
+    west, south, east, north = district_bounds
+    area_bounds = (west - 0.2, south - 0.2, east + 0.2, north + 0.2)
+    cols = int(np.sqrt(parcels))
+    dx, dy = (east - west) / cols, (north - south) / (parcels // cols)
+    parcel_geoms = [shapely.box(west + (i % cols) * dx, south + (i // cols) * dy,
+                                west + (i % cols) * dx + 0.002, south + (i // cols) * dy + 0.002)
+                    for i in range(parcels)]
+    first = datetime.date(2015, 1, 1)
+    dates = [(first + datetime.timedelta(days=int(d))).isoformat()
+             for d in np.linspace(0, 3650, events)]
+    season = (dates[events // 2], dates[events // 2 + events // 10])
+    district_box = (30.9, 30.4, 31.0, 30.5)
+    timings = {}
+    print(f"{events} events; queries: 0.1 deg bbox, Menofia polygon, per-event area (all / clipped to Menofia), "
+          f"{parcels} parcels' flood frequency (all events / one season)")
+    print(f"{'polygons':>9} {'ingest s':>9} {'index s':>8} {'bbox ms':>8} {'roi ms':>7} {'areas ms':>9} "
+          f"{'clip ms':>8} {'freq ms':>8} {'season ms':>10} {'roi hits':>9} {'MB':>6}")
+    for count in counts:
+        rng = np.random.default_rng(0)
+        per_event = count // events
+        with tempfile.TemporaryDirectory() as tmpdir:
+            archive = flood_archive.FloodArchive(tmpdir)
+            ingest_time, _ = _timeit(lambda: [
+                archive.ingest(f"event_{i:04d}", date, synthetic.flood_polygons(rng, per_event, area_bounds))
+                for i, date in enumerate(dates)
+            ], repeat=1)
+            index_time, index = _timeit(archive.load, repeat=1)
+            size = sum(os.path.getsize(path) for _, _, path in archive._event_files()) / 1e6
+            bbox_time, _ = _timeit(index.query, district_box)
+            roi_time, roi_hits = _timeit(index.query, district)
+            areas_time, _ = _timeit(index.event_areas)
+            clip_time, _ = _timeit(index.event_areas, district)
+            freq_time, _ = _timeit(index.flood_frequency, parcel_geoms)
+            season_time, _ = _timeit(index.flood_frequency, parcel_geoms, *season)
+        row = {'ingest': ingest_time, 'index': index_time, 'bbox': bbox_time, 'roi': roi_time,
+               'areas': areas_time, 'clip': clip_time, 'frequency': freq_time, 'season': season_time}
+        timings.update({f"{name}_{count}": seconds for name, seconds in row.items()})
+        print(f"{count:>9,} {ingest_time:>9.2f} {index_time:>8.2f} {bbox_time * 1e3:>8.2f} {roi_time * 1e3:>7.1f} "
+              f"{areas_time * 1e3:>9.2f} {clip_time * 1e3:>8.1f} {freq_time * 1e3:>8.1f} {season_time * 1e3:>10.1f} "
+              f"{len(roi_hits):>9,} {size:>6.1f}")
+    return timings
+
+
+def bench_scenes(counts=(10, 100, 1000), orbits=6):
+    """Scene planning over synthetic footprints, and the catalog cache that replaces the query."""
+    import scene_planner
+    from result_cache import ResultCache
+
+    roi = {'type': 'Polygon', 'coordinates': [[[30.7, 30.3], [31.2, 30.3], [31.2, 30.8], [30.7, 30.8], [30.7, 30.3]]]}
+    rng = np.random.default_rng(0)
+    timings = {}
+    print(f"{'candidates':>10} {'orbit':>6} {'scenes':>7} {'coverage':>9} {'plan ms':>8} {'cache hit ms':>13}")
+    for count in counts:
+        before = synthetic.scene_footprints(rng, count, orbits, 0)
+        after = synthetic.scene_footprints(rng, count, orbits, 10 * count)
+        plan_time, plan = _timeit(scene_planner.plan_scenes, before, after, roi)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ResultCache(tmpdir)
+            key = 'scenes'
+            cache.put(key, {'scenes': before})
+            hit_time, _ = _timeit(lambda: cache.get(key)['stats']['scenes'])
+        timings[f"plan_{count}"] = plan_time
+        coverage = min(plan['coverage'].values())
+        print(f"{2 * count:>10} {plan['orbit']:>6} {len(plan['before']) + len(plan['after']):>7} "
+              f"{coverage:>9.3f} {plan_time * 1e3:>8.1f} {hit_time * 1e3:>13.2f}")
+    return timings
+
+
+def bench_features(counts=(10, 100, 1000), size=512, separate_max=100):
+    """Per-feature flood area: one shared pass + reduceRegions vs a separate analysis per feature."""
+    import fake_ee
+    import flood_core
+    from result_cache import ResultCache
+
+    dates = ('2023-08-01', '2023-08-20', '2023-09-15', '2023-09-25')
+    catalog = fake_ee.synthetic_catalog(size)
+    ring = catalog.roi()['coordinates'][0]
+    bounds = (ring[0][0], ring[0][1], ring[2][0], ring[2][1])
+    timings = {}
+    print(f"{'features':>8} {'shared ms':>10} {'separate ms':>12} {'speedup':>8} {'sum km2':>8} {'whole km2':>10}")
+    with fake_ee.use_fake_ee(catalog), \
+            tempfile.TemporaryDirectory() as tmpdir:
+        whole = flood_core.run_flood_analysis(fake_ee.Geometry(catalog.roi()), *dates)['stats'].getInfo()
+        for count in counts:
+            roi_geojson = synthetic.grid_features(bounds, count)
+            shared_time, (_, _, features) = _timeit(
+                lambda: flood_core.run_multi_roi_analysis(
+                    roi_geojson, dates, plan_scenes=False, max_workers=1, cache=ResultCache(tempfile.mkdtemp(dir=tmpdir))
+                ), repeat=1
+            )
+            timings[f"shared_{count}"] = shared_time
+            separate = '-'
+            speedup = '-'
+            if count <= separate_max:
+                def separate_runs():
+                    for feature in roi_geojson['features']:
+                        geometry = fake_ee.Geometry(feature['geometry'])
+                        flood_core.run_flood_analysis(geometry, *dates)['stats'].getInfo()
+                separate_time, _ = _timeit(separate_runs, repeat=1)
+                separate, speedup = f"{separate_time * 1e3:.0f}", f"{separate_time / shared_time:.1f}x"
+            total = sum(f['properties']['flood_area_km2'] for f in features)
+            print(f"{count:>8} {shared_time * 1e3:>10.0f} {separate:>12} {speedup:>8} {total:>8.3f} "
+                  f"{whole['flood_area'] / 1e6:>10.3f}")
+    return timings
+
+
+def bench_adaptive(size=1024, cell_size_m=1500):
+    """Adaptive (bimodal-cell) threshold vs the global Otsu threshold, cold and with cached histograms."""
+    import adaptive_threshold
+    import fake_ee
+    import flood_core
+    from result_cache import ResultCache
+
+    dates = ('2023-08-01', '2023-08-20', '2023-09-15', '2023-09-25')
+    catalog = fake_ee.synthetic_catalog(size)
+    roi_geojson = catalog.roi()
+    with fake_ee.use_fake_ee(catalog, modules=('flood_core', 'adaptive_threshold', 'ee_client')), \
+            tempfile.TemporaryDirectory() as tmpdir:
+        cache = ResultCache(tmpdir)
+        results = flood_core.run_flood_analysis(fake_ee.Geometry(roi_geojson), *dates)
+        global_threshold = results['threshold'].getInfo()
+        run = partial(adaptive_threshold.adaptive_threshold, results['before_filtered'], roi_geojson, dates[:2],
+                      cache, cell_size_m=cell_size_m)
+        cold_time, cold = _timeit(run, repeat=1)
+        cached_time, cached = _timeit(run, repeat=3)
+    print(f"{size} x {size} scene, {len(cold['cells'])} cells of {cell_size_m} m, "
+          f"{len(cold['bimodal'])} bimodal{' (fallback: all cells)' if cold['fallback'] else ''}")
+    print(f"global Otsu:   {global_threshold:7.2f} dB")
+    print(f"adaptive:      {cold['threshold']:7.2f} dB  (cell reduction {cold['seconds'] * 1e3:.0f} ms, "
+          f"{cold_time * 1e3:.0f} ms total)")
+    print(f"cached cells:  {cached['threshold']:7.2f} dB  ({cached_time * 1e3:.1f} ms)")
+    return {'adaptive_cold': cold_time, 'adaptive_cached': cached_time}
+
+
+def bench_pipeline(sizes=(256, 512, 1024, 2048)):
+    """flood_core functions evaluated offline by fake_ee; returns best times for the baseline gate."""
+    import fake_ee
+    import flood_core
+
+    dates = ('2023-08-01', '2023-08-20', '2023-09-15', '2023-09-25')
+    timings = {}
+    print(f"{'size':>6} {'geometry ms':>12} {'otsu ms':>8} {'lee ms':>8} {'pipeline ms':>12} {'flood km2':>10}")
+    for size in sizes:
+        catalog = fake_ee.synthetic_catalog(size)
+        roi_geojson = {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {}, 'geometry': catalog.roi()}
+        ]}
+        with fake_ee.use_fake_ee(catalog):
+            geometry_time, roi = _timeit(flood_core.geojson_to_ee_geometry, roi_geojson)
+            scene = fake_ee.ImageCollection(fake_ee.S1_COLLECTION).filterDate(*dates[:2]).mosaic().select('VV')
+            lee_time, filtered = _timeit(flood_core.refined_lee_filter, scene, repeat=3)
+            hist = filtered.reduceRegion(fake_ee.Reducer.histogram(255, 0.1), roi, 30).get('VV')
+            otsu_time, _ = _timeit(lambda: flood_core.otsu_threshold(hist).getInfo())
+            pipeline_time, stats = _timeit(
+                lambda: flood_core.run_flood_analysis(roi, *dates)['stats'].getInfo(), repeat=3
+            )
+        timings.update({
+            f"geometry_{size}": geometry_time, f"otsu_{size}": otsu_time,
+            f"lee_{size}": lee_time, f"pipeline_{size}": pipeline_time,
+        })
+        print(f"{size:>6} {geometry_time * 1e3:>12.3f} {otsu_time * 1e3:>8.3f} {lee_time * 1e3:>8.1f} "
+              f"{pipeline_time * 1e3:>12.1f} {stats['flood_area'] / 1e6:>10.3f}")
+    return timings
+
+
+BENCHMARKS = {
+    'ingest': bench_ingest,
+    'client': bench_client,
+    'import': bench_import,
+    'startup': bench_startup,
+    'lee': bench_lee,
+    'mask': bench_mask,
+    'writer': bench_writer,
+    'scenes': bench_scenes,
+    'watcher': bench_watcher,
+    'features': bench_features,
+    'archive': bench_archive,
+    'adaptive': bench_adaptive,
+    'pipeline': bench_pipeline,
+    'otsu': bench_otsu,
+}
+
+
+def _load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def check_regressions(results, baseline, tolerance):
+    """Timings slower than baseline * (1 + tolerance), as (benchmark, metric, baseline, now) tuples.
+
+    Baselines are machine-specific; record them with --save-baseline on the machine that runs --check.
+    """
+    slower = []
+    for name, timings in results.items():
+        for metric, seconds in timings.items():
+            reference = baseline.get(name, {}).get(metric)
+            if (reference is not None and seconds > reference * (1 + tolerance)
+                    and seconds - reference > MIN_REGRESSION_SECONDS):
+                slower.append((name, metric, reference, seconds))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run: {', '.join(sorted(BENCHMARKS))} (default: all)")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline timings file (default: %(default)s)")
+    parser.add_argument('--save-baseline', action='store_true', help="record this run's timings as the baseline")
+    parser.add_argument('--check', action='store_true', help="exit non-zero if a timing regresses past --tolerance")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown for --check (default: 0.25)")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name in args.names or sorted(BENCHMARKS):
+        print(f"\n== {name} ==")
+        timings = BENCHMARKS[name]()
+        if timings:
+            results[name] = timings
+
+    baseline = _load_baseline(args.baseline)
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print(f"\nbaseline written to {args.baseline}")
+    if args.check:
+        slower = check_regressions(results, baseline, args.tolerance)
+        for name, metric, reference, seconds in slower:
+            print(f"REGRESSION {name}/{metric}: {reference * 1e3:.1f} ms -> {seconds * 1e3:.1f} ms")
+        if slower:
+            sys.exit(1)
+        print(f"\nno regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
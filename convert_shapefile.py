@@ -1,28 +1,21 @@
 """Convert shapefile to GeoJSON for use with Streamlit app"""
-import os
 import sys
 
-try:
-    import geopandas as gpd
-except ImportError:
-    print("Installing geopandas...")
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "geopandas"])
-    import geopandas as gpd
+from roi_ingest import ingest, write_geojson
 
-shapefile_path = "d:/gee/menofia_3km/menofiariverselection_fiaalBuf_Intersect_ExportFeatures.shp"
-output_path = "d:/gee/menofia_3km.geojson"
+shapefile_path = sys.argv[1] if len(sys.argv) > 1 else "d:/gee/menofia_3km/menofiariverselection_fiaalBuf_Intersect_ExportFeatures.shp"
+output_path = sys.argv[2] if len(sys.argv) > 2 else "d:/gee/menofia_3km.geojson"
+tolerance_m = float(sys.argv[3]) if len(sys.argv) > 3 else 10
 
 print(f"Reading shapefile: {shapefile_path}")
-gdf = gpd.read_file(shapefile_path)
+result = ingest(shapefile_path, tolerance_m=tolerance_m, dissolve=False)
 
 print(f"Shapefile info:")
-print(f"  - Features: {len(gdf)}")
-print(f"  - CRS: {gdf.crs}")
-print(f"  - Bounds: {gdf.total_bounds}")
+print(f"  - Features: {result['features']}")
+print(f"  - Vertices: {result['vertices_before']} -> {result['vertices_after']} (tolerance {tolerance_m} m)")
 
 print(f"\nConverting to GeoJSON: {output_path}")
-gdf.to_file(output_path, driver='GeoJSON')
+write_geojson(result, output_path)
 
 print(f"SUCCESS: GeoJSON created at {output_path}")
 print(f"You can now upload this file in the Streamlit app!")
@@ -0,0 +1,211 @@
+"""Shared Earth Engine request layer: rate limiting, retries and coalescing of identical requests.
+
+Every getInfo, getMapId, task start, task status, asset lookup and download URL goes through one
+process-wide EEClient, which all Streamlit sessions share:
+
+- a token bucket keeps the request rate under the project's quota, and a 429 empties it so every
+  caller slows down, not just the one that was refused;
+- rate-limit and transient errors (429, quota, 5xx, deadlines, dropped connections) are retried
+  with exponential backoff and jitter; computation errors and computation timeouts are not;
+- an evaluation whose serialized graph is already in flight is not sent again: the caller waits for
+  the first request's result (single flight);
+- requests run on a bounded thread pool, so independent evaluations overlap while the number of
+  concurrent EE requests stays bounded however many sessions are active.
+"""
+import collections
+import contextvars
+import copy
+import functools
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ee
+
+logger = logging.getLogger(__name__)
+
+RATE = 10.0
+BURST = 20
+MAX_WORKERS = 8
+RETRIES = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+_RATE_LIMITED = re.compile(r'\b429\b|too many requests|quota exceeded|rate limit|resource.?exhausted', re.I)
+_TRANSIENT = re.compile(
+    r'\b50[0234]\b|service unavailable|internal error|deadline exceeded|timed out|connection (reset|aborted|refused)',
+    re.I
+)
+# Server-side limits that a retry would hit again.
+_PERMANENT = re.compile(r'computation timed out|memory limit exceeded|too many concurrent aggregations', re.I)
+
+
+def is_rate_limited(error):
+    return bool(_RATE_LIMITED.search(str(error)))
+
+
+def is_retryable(error):
+    """Whether a failed request may succeed if sent again unchanged."""
+    message = str(error)
+    if _PERMANENT.search(message):
+        return False
+    return isinstance(error, (TimeoutError, ConnectionError)) or is_rate_limited(error) \
+        or bool(_TRANSIENT.search(message))
+
+
+def graph_key(ee_object):
+    """SHA-256 of an Earth Engine object's serialized graph."""
+    return hashlib.sha256(ee.serializer.toJSON(ee_object).encode()).hexdigest()
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens per second, holding at most ``capacity``."""
+
+    def __init__(self, rate=RATE, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Take a token, sleeping until one is available; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self):
+        """Drop saved-up tokens, e.g. after the server refused a request for exceeding the quota."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+
+
+class EEClient:
+    """Rate-limited, retrying, coalescing executor for Earth Engine requests.
+
+    ``submit(fn, key)`` runs ``fn()`` on the pool and returns its Future; a call whose ``key`` is
+    already in flight gets that request's Future instead. Calls with ``idempotent=False`` (task
+    starts) are only retried on rate-limit errors, where the server refused the request outright.
+    """
+
+    def __init__(self, rate=RATE, burst=BURST, max_workers=MAX_WORKERS, retries=RETRIES, backoff=BACKOFF,
+                 max_backoff=MAX_BACKOFF):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._bucket = TokenBucket(rate, burst)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ee-client')
+        self._inflight = {}
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def _run(self, fn, idempotent):
+        attempt = 0
+        while True:
+            waited = self._bucket.acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                retryable = is_retryable(e) if idempotent else is_rate_limited(e)
+                with self._lock:
+                    self._counts['throttled_seconds'] += waited
+                    self._counts['failures' if attempt >= self.retries or not retryable else 'retries'] += 1
+                if attempt >= self.retries or not retryable:
+                    raise
+                if is_rate_limited(e):
+                    self._bucket.drain()
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                logger.warning("EE request failed (%s), retry %d/%d in %.1fs", e, attempt, self.retries, delay)
+                time.sleep(delay)
+            else:
+                with self._lock:
+                    self._counts['throttled_seconds'] += waited
+                return result
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def submit(self, fn, key=None, idempotent=True):
+        """Future of ``fn()``; runs in a copy of the caller's context so instrumentation attributes it."""
+        with self._lock:
+            future = self._inflight.get(key) if key is not None else None
+            if future is not None:
+                self._counts['coalesced'] += 1
+                return future
+            self._counts['requests'] += 1
+            future = self._executor.submit(contextvars.copy_context().run, self._run, fn, idempotent)
+            if key is not None:
+                self._inflight[key] = future
+        if key is not None:
+            future.add_done_callback(functools.partial(self._forget, key))
+        return future
+
+    def call(self, fn, key=None, idempotent=True):
+        return self.submit(fn, key, idempotent).result()
+
+    def get_info(self, ee_object):
+        """ee_object.getInfo(), shared with any identical evaluation already in flight.
+
+        Callers get their own copy, since coalesced callers may belong to different sessions.
+        """
+        return copy.deepcopy(self.call(ee_object.getInfo, key=('getInfo', graph_key(ee_object))))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, inflight=len(self._inflight))
+
+
+@functools.lru_cache(maxsize=None)
+def get_client():
+    return EEClient()
+
+
+def get_info(ee_object):
+    """getInfo through the shared client."""
+    return get_client().get_info(ee_object)
+
+
+def evaluate(ee_object, callback):
+    """Asynchronous get_info through the shared client: ``callback(value, error)`` runs when it completes.
+
+    Like ``ee_object.evaluate``, but rate-limited, retried, coalesced and attributed to the caller's run.
+    """
+    def done(future):
+        error = future.exception()
+        if error is not None:
+            callback(None, str(error))
+        else:
+            callback(copy.deepcopy(future.result()), None)
+
+    future = get_client().submit(ee_object.getInfo, key=('getInfo', graph_key(ee_object)))
+    future.add_done_callback(done)
+    return future
+
+
+def call(fn, *args, **kwargs):
+    """fn(*args, **kwargs) through the shared client, for read-only ee.data calls and URL requests."""
+    return get_client().call(functools.partial(fn, *args, **kwargs))
+
+
+def start_task(task):
+    """task.start() through the shared client, retried only if the server refused it for quota."""
+    return get_client().call(task.start, idempotent=False)
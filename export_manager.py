@@ -0,0 +1,180 @@
+"""Track Earth Engine export tasks: persistent registry, background polling and request dedupe."""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import urllib.request
+
+from result_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_PATH = os.path.join(CACHE_DIR, 'exports.json')
+POLL_INTERVAL = 5
+MAX_POLL_INTERVAL = 60
+TERMINAL_STATES = {'COMPLETED', 'FAILED', 'CANCELLED'}
+RETRYABLE_STATES = {'FAILED', 'CANCELLED'}
+# getDownloadURL serves at most ~32 MB; a 1-byte mask at this many pixels stays well inside it.
+MAX_DOWNLOAD_PIXELS = 2e7
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def export_key(kind, description, folder, graph, **params):
+    """SHA-256 identifying an export request by its kind, target, serialized EE graph and params."""
+    payload = {'kind': kind, 'description': description, 'folder': folder, 'graph': graph, 'params': params}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _ee_task_status(task_id):
+    import ee
+
+    from ee_client import call
+
+    return call(ee.data.getTaskStatus, task_id)[0]
+
+
+class ExportManager:
+    """Registry of submitted export tasks, persisted as JSON and polled from a background thread.
+
+    ``submit`` starts a task only if no identical request is pending, running or completed.
+    Polling backs off exponentially while nothing changes and stops once every task is finished.
+    ``status_fn(task_id)`` is used for tasks from earlier processes (defaults to ee.data.getTaskStatus).
+    """
+
+    def __init__(self, registry_path=REGISTRY_PATH, poll_interval=POLL_INTERVAL,
+                 max_poll_interval=MAX_POLL_INTERVAL, status_fn=None):
+        self.registry_path = registry_path
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._status_fn = status_fn or _ee_task_status
+        self._tasks = {}
+        self._submitting = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.registry_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.registry_path) or '.', exist_ok=True)
+        tmp = self.registry_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._entries, f, indent=1)
+        os.replace(tmp, self.registry_path)
+
+    def submit(self, key, start_fn, description='', **info):
+        """Run start_fn() (which must start and return a task) unless key is already tracked.
+
+        Returns (entry, started). Failed or cancelled requests are resubmitted. The key is reserved
+        under the lock and the task started outside it, so a slow start does not block other callers;
+        a concurrent submit of the same key gets the reservation back with started False.
+        """
+        with self._lock:
+            entry = self._entries.get(key) or self._submitting.get(key)
+            if entry is not None and entry['state'] not in RETRYABLE_STATES:
+                return dict(entry), False
+            now = time.time()
+            entry = dict(info, key=key, task_id=None, description=description, state='SUBMITTING',
+                         progress=0.0, error=None, submitted=now, updated=now)
+            self._submitting[key] = entry
+        try:
+            task = start_fn()
+        except BaseException:
+            with self._lock:
+                self._submitting.pop(key, None)
+            raise
+        with self._lock:
+            self._submitting.pop(key, None)
+            entry = dict(entry, task_id=task.id, state='READY', updated=time.time())
+            self._entries[key] = entry
+            self._tasks[key] = task
+            self._save()
+        self.start_polling()
+        return dict(entry), True
+
+    def _status(self, key, entry):
+        from ee_client import call
+
+        task = self._tasks.get(key)
+        return call(task.status) if task is not None else self._status_fn(entry['task_id'])
+
+    def poll_once(self):
+        """Refresh every unfinished task; returns True if any state or progress changed."""
+        changed = False
+        with self._lock:
+            active = {k: dict(e) for k, e in self._entries.items() if e['state'] not in TERMINAL_STATES}
+        for key, entry in active.items():
+            try:
+                status = self._status(key, entry)
+            except Exception as e:
+                logger.warning("status check for %s failed: %s", entry['description'], e)
+                continue
+            state = status.get('state', entry['state'])
+            progress = 1.0 if state == 'COMPLETED' else float(status.get('progress', entry['progress']) or 0)
+            if state != entry['state'] or progress != entry['progress']:
+                changed = True
+                with self._lock:
+                    self._entries[key].update(
+                        state=state, progress=progress, error=status.get('error_message'), updated=time.time()
+                    )
+        if changed:
+            with self._lock:
+                self._save()
+        return changed
+
+    def _poll_loop(self):
+        interval = self.poll_interval
+        while not self._stop.is_set():
+            changed = self.poll_once()
+            if not self.active():
+                break
+            interval = self.poll_interval if changed else min(interval * 2, self.max_poll_interval)
+            self._stop.wait(interval)
+
+    def start_polling(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._poll_loop, name='export-poller', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def active(self):
+        with self._lock:
+            return [dict(e) for e in self._entries.values() if e['state'] not in TERMINAL_STATES]
+
+    def entries(self):
+        """All tracked exports, newest first."""
+        with self._lock:
+            return sorted((dict(e) for e in self._entries.values()), key=lambda e: e['submitted'], reverse=True)
+
+
+def can_download(region_area_m2, scale=10):
+    """Whether an image over the region is small enough for a direct download at scale."""
+    return region_area_m2 / (scale * scale) <= MAX_DOWNLOAD_PIXELS
+
+
+def download_image(image, region, path, scale=10, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Download image over region as a GeoTIFF via getDownloadURL, streaming it to path in chunks."""
+    from ee_client import call
+
+    url = call(image.getDownloadURL, {'region': region, 'scale': scale, 'format': 'GEO_TIFF'})
+    tmp = path + '.part'
+    with urllib.request.urlopen(url) as response, open(tmp, 'wb') as out:
+        shutil.copyfileobj(response, out, chunk_size)
+    os.replace(tmp, path)
+    return path
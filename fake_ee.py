@@ -0,0 +1,786 @@
+"""Offline stand-in for the parts of the Earth Engine API the flood pipeline uses.
+
+Objects evaluate eagerly over NumPy rasters that share one grid: images are dicts of float64 bands
+with NaN marking masked pixels, and numbers, arrays, lists and dictionaries are wrapped Python/NumPy
+values. ``use_fake_ee(catalog)`` swaps the ``ee`` module of flood_core (or other modules) for this
+one, so run_flood_analysis, otsu_threshold and friends run unchanged against a synthetic catalog.
+
+Covered: ImageCollection filter/filterDate/filterBounds/select/mosaic/aggregate_array, Date
+advance/format, Image arithmetic, addBands and comparisons, And/Or/Not, clip, updateMask,
+reduceNeighborhood over square kernels (mean, variance and their combination), focalMode,
+reduceRegion with histogram/sum/mean, pixelArea, Terrain.slope, reduceRegions with sum or
+fixedHistogram, FeatureCollection select/getInfo, serializer round trips within the process,
+profilePrinting, batch.Export.image.toAsset (completing on start), and the ee.Array / ee.List calls
+of the Otsu thresholds. Anything else raises NotImplementedError.
+"""
+import contextlib
+import datetime
+import math
+import re
+import sys
+
+import numpy as np
+
+import local_engine
+
+PIXEL_DEGREES = 0.0001
+ORIGIN = (30.90, 30.50)
+S1_COLLECTION = 'COPERNICUS/S1_GRD'
+DEM_IMAGE = 'USGS/SRTMGL1_003'
+
+_catalog = None
+
+
+class EEException(Exception):
+    pass
+
+
+def _unwrap(value):
+    if isinstance(value, Computed):
+        return value.value
+    if isinstance(value, list):
+        return [_unwrap(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _unwrap(v) for k, v in value.items()}
+    return value
+
+
+def _info(value):
+    value = _unwrap(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, list):
+        return [_info(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _info(v) for k, v in value.items()}
+    if isinstance(value, (Feature, FeatureCollection)):
+        return value.getInfo()
+    return value
+
+
+def _divide(a, b):
+    # Earth Engine numbers and arrays return 0 for division by zero.
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(b == 0, 0.0, a / np.where(b == 0, 1, b))
+
+
+def _nullable(method):
+    # A missing dictionary entry stays None through later calls, as an unevaluated branch would.
+    def wrapper(self, *args, **kwargs):
+        return Computed(None) if self.value is None else method(self, *args, **kwargs)
+    return wrapper
+
+
+class Computed:
+    """An eagerly evaluated ee.Number / ee.Array / ee.List / ee.Dictionary."""
+
+    def __init__(self, value):
+        self.value = _unwrap(value)
+
+    def _op(self, other, fn):
+        other = _unwrap(other)
+        if self.value is None or other is None:
+            return Computed(None)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return Computed(fn(np.asarray(self.value, dtype=np.float64), np.asarray(other, dtype=np.float64)))
+
+    def add(self, other):
+        return self._op(other, np.add)
+
+    def subtract(self, other):
+        return self._op(other, np.subtract)
+
+    def multiply(self, other):
+        return self._op(other, np.multiply)
+
+    def divide(self, other):
+        return self._op(other, _divide)
+
+    def pow(self, other):
+        return self._op(other, np.power)
+
+    def eq(self, other):
+        return self._op(other, lambda a, b: (a == b).astype(np.float64))
+
+    def lt(self, other):
+        return self._op(other, lambda a, b: (a < b).astype(np.float64))
+
+    def gt(self, other):
+        return self._op(other, lambda a, b: (a > b).astype(np.float64))
+
+    @_nullable
+    def Not(self):
+        return Computed((np.asarray(self.value) == 0).astype(np.float64))
+
+    @_nullable
+    def accum(self, axis):
+        return Computed(np.cumsum(np.asarray(self.value, dtype=np.float64), axis=axis))
+
+    @_nullable
+    def reduce(self, reducer, axes):
+        return Computed(reducer.reduce_array(np.asarray(self.value, dtype=np.float64), tuple(axes)))
+
+    @_nullable
+    def sort(self, keys=None):
+        values = np.asarray(self.value)
+        order = np.argsort(np.asarray(_unwrap(keys) if keys is not None else values), kind='stable')
+        return Computed(values[order])
+
+    @_nullable
+    def ceil(self):
+        return Computed(np.ceil(np.asarray(self.value, dtype=np.float64)))
+
+    @_nullable
+    def slice(self, axis=0, start=0, end=None, step=1):
+        index = [slice(None)] * np.ndim(self.value)
+        end = _unwrap(end)
+        index[axis] = slice(int(_unwrap(start)), None if end is None else int(end), int(_unwrap(step)))
+        return Computed(np.asarray(self.value)[tuple(index)])
+
+    @_nullable
+    def map(self, fn):
+        return Computed([_unwrap(fn(Computed(v))) for v in self.value])
+
+    @_nullable
+    def distinct(self):
+        return Computed(list(dict.fromkeys(self.value)))
+
+    @_nullable
+    def set(self, key, value):
+        return Computed(dict(self.value, **{_unwrap(key): _unwrap(value)}))
+
+    @_nullable
+    def length(self):
+        return Computed(np.asarray(np.shape(self.value)))
+
+    @_nullable
+    def reshape(self, shape):
+        return Computed(np.reshape(self.value, _unwrap(shape)))
+
+    @_nullable
+    def repeat(self, axis, copies):
+        return Computed(np.repeat(np.asarray(self.value), int(_unwrap(copies)), axis=axis))
+
+    @_nullable
+    def argmax(self):
+        return Computed(list(np.unravel_index(np.argmax(self.value), np.shape(self.value))))
+
+    @_nullable
+    def get(self, key):
+        key = _unwrap(key)
+        if isinstance(self.value, dict):
+            return Computed(self.value.get(key))
+        if isinstance(key, list):
+            return Computed(np.asarray(self.value)[tuple(int(k) for k in key)])
+        return Computed(self.value[int(key)])
+
+    def contains(self, key):
+        return Computed(self.value is not None and _unwrap(key) in self.value)
+
+    def getInfo(self):
+        return _info(self.value)
+
+
+def Number(value):
+    return Computed(value)
+
+
+def Array(value):
+    return Computed(None if _unwrap(value) is None else np.asarray(_unwrap(value), dtype=np.float64))
+
+
+def List(value):
+    return Computed(list(_unwrap(value)))
+
+
+List.sequence = lambda start, end, step=1: Computed(np.arange(_unwrap(start), _unwrap(end) + step, step))
+List.repeat = lambda value, count: Computed([_unwrap(value)] * int(_unwrap(count)))
+
+
+def Dictionary(value=None):
+    return Computed(dict(_unwrap(value) or {}))
+
+
+class Algorithms:
+    @staticmethod
+    def If(condition, true_case, false_case):
+        return Computed(true_case if _unwrap(condition) else false_case)
+
+
+class Reducer:
+    def __init__(self, outputs, **args):
+        self.outputs = outputs
+        self.args = args
+
+    @classmethod
+    def mean(cls):
+        return cls(['mean'])
+
+    @classmethod
+    def variance(cls):
+        return cls(['variance'])
+
+    @classmethod
+    def sum(cls):
+        return cls(['sum'])
+
+    @classmethod
+    def max(cls):
+        return cls(['max'])
+
+    @classmethod
+    def histogram(cls, maxBuckets=255, minBucketWidth=0.1):
+        return cls(['histogram'], max_buckets=maxBuckets, min_bucket_width=minBucketWidth)
+
+    @classmethod
+    def fixedHistogram(cls, min, max, steps):
+        return cls(['histogram'], fixed=(min, max, steps))
+
+    def combine(self, reducer2, outputPrefix='', sharedInputs=False):
+        return Reducer(self.outputs + reducer2.outputs, **dict(self.args, **reducer2.args))
+
+    def reduce_array(self, values, axes):
+        fn = {'sum': np.sum, 'mean': np.mean, 'max': np.max}[self.outputs[0]]
+        return fn(values, axis=axes, keepdims=True)
+
+
+class Kernel:
+    def __init__(self, radius):
+        self.radius = radius
+
+    @classmethod
+    def square(cls, radius, units='pixels', normalize=True, magnitude=1):
+        if units != 'pixels':
+            raise NotImplementedError("fake Kernel.square only supports pixel units")
+        return cls(int(radius))
+
+    @classmethod
+    def fixed(cls, *args, **kwargs):
+        raise NotImplementedError("fake ee has no fixed kernels (the directional Lee filter)")
+
+
+class Filter:
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    @classmethod
+    def eq(cls, name, value):
+        return cls(lambda props: props.get(name) == value)
+
+    @classmethod
+    def listContains(cls, name, value):
+        return cls(lambda props: value in props.get(name, ()))
+
+
+class Geometry:
+    def __init__(self, geojson, proj=None, geodesic=None):
+        self.geojson = geojson.geojson if isinstance(geojson, Geometry) else geojson
+
+    def geometries(self):
+        return local_engine.roi_geometries(self.geojson)
+
+    def area(self, maxError=None, proj=None):
+        return Computed(local_engine.geodesic_area(self.geometries()))
+
+    def getInfo(self):
+        return self.geojson
+
+
+class Feature:
+    def __init__(self, geometry, properties=None):
+        if isinstance(geometry, dict) and geometry.get('type') == 'Feature':
+            properties = dict(geometry.get('properties') or {}, **(properties or {}))
+            geometry = geometry['geometry']
+        self._geometry = Geometry(geometry) if geometry is not None else None
+        self.properties = dict(properties or {})
+
+    def geometry(self):
+        return self._geometry
+
+    def set(self, name, value):
+        return Feature(self._geometry, dict(self.properties, **{name: _unwrap(value)}))
+
+    def get(self, name):
+        return Computed(self.properties.get(name))
+
+    def getInfo(self):
+        return {
+            'type': 'Feature', 'geometry': self._geometry.geojson if self._geometry else None,
+            'properties': _info(self.properties),
+        }
+
+
+class FeatureCollection:
+    def __init__(self, features):
+        self.features = features
+
+    def geometry(self):
+        return Geometry({'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {}, 'geometry': f.geometry().geojson} for f in self.features
+        ]})
+
+    def select(self, propertySelectors, newProperties=None, retainGeometry=True):
+        names = newProperties or propertySelectors
+        return FeatureCollection([
+            Feature(f.geometry() if retainGeometry else None,
+                    {new: f.properties[old] for old, new in zip(propertySelectors, names) if old in f.properties})
+            for f in self.features
+        ])
+
+    def size(self):
+        return Computed(len(self.features))
+
+    def getInfo(self):
+        return {'type': 'FeatureCollection', 'features': [f.getInfo() for f in self.features]}
+
+
+class Image:
+    """Named float64 bands on the catalog grid; 0-d or broadcastable bands stand for constants."""
+
+    def __init__(self, source=None, bands=None):
+        if bands is not None:
+            self.bands = bands
+        elif isinstance(source, Image):
+            self.bands = dict(source.bands)
+        elif isinstance(source, str):
+            self.bands = dict(_require_catalog().images[source])
+        else:
+            self.bands = {'constant': np.asarray(_unwrap(source) if source is not None else 0, dtype=np.float64)}
+
+    @staticmethod
+    def pixelArea():
+        grid = _require_catalog().grid
+        crs, transform, _, height = grid
+        areas = local_engine.LocalRaster(None, transform, crs).row_pixel_areas(0, height)
+        return Image(bands={'area': areas[:, None]})
+
+    def _full(self, values):
+        return np.broadcast_to(values, _require_catalog().shape)
+
+    def _map(self, fn):
+        return Image(bands={name: fn(values) for name, values in self.bands.items()})
+
+    def _binary(self, other, fn):
+        other = other if isinstance(other, Image) else Image(other)
+        left, right = list(self.bands.items()), list(other.bands.values())
+        if len(right) == 1:
+            right = right * len(left)
+        elif len(left) == 1:
+            left = [(name, left[0][1]) for name in other.bands]
+        if len(left) != len(right):
+            raise EEException(f"Images must have the same number of bands: {len(left)} vs {len(right)}")
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return Image(bands={name: fn(a, b) for (name, a), b in zip(left, right)})
+
+    def bandNames(self):
+        return Computed(list(self.bands))
+
+    def select(self, selectors, names=None):
+        if not isinstance(selectors, (list, tuple)):
+            selectors = [selectors]
+        picked = {}
+        band_names = list(self.bands)
+        for selector in selectors:
+            if isinstance(selector, int):
+                picked[band_names[selector]] = self.bands[band_names[selector]]
+            else:
+                for name in band_names:
+                    if re.fullmatch(selector, name):
+                        picked[name] = self.bands[name]
+        if not picked:
+            raise EEException(f"Band pattern {selectors} matched no bands of {band_names}")
+        return Image(bands=picked).rename(names) if names else Image(bands=picked)
+
+    def addBands(self, srcImg):
+        return Image(bands=dict(self.bands, **srcImg.bands))
+
+    def rename(self, names):
+        names = _unwrap(names)
+        names = [names] if isinstance(names, str) else list(names)
+        return Image(bands=dict(zip(names, self.bands.values())))
+
+    def toFloat(self):
+        return self
+
+    def toByte(self):
+        return self
+
+    def add(self, other):
+        return self._binary(other, np.add)
+
+    def subtract(self, other):
+        return self._binary(other, np.subtract)
+
+    def multiply(self, other):
+        return self._binary(other, np.multiply)
+
+    def divide(self, other):
+        # Image division masks pixels where the divisor is zero.
+        return self._binary(other, lambda a, b: np.where(b == 0, np.nan, a / np.where(b == 0, 1, b)))
+
+    def pow(self, other):
+        return self._binary(other, np.power)
+
+    def min(self, other):
+        return self._binary(other, np.minimum)
+
+    def max(self, other):
+        return self._binary(other, np.maximum)
+
+    def _compare(self, other, fn):
+        return self._binary(other, lambda a, b: np.where(np.isnan(a) | np.isnan(b), np.nan, fn(a, b)))
+
+    def lt(self, other):
+        return self._compare(other, np.less)
+
+    def gt(self, other):
+        return self._compare(other, np.greater)
+
+    def eq(self, other):
+        return self._compare(other, np.equal)
+
+    def And(self, other):
+        return self._compare(other, lambda a, b: (a != 0) & (b != 0))
+
+    def Or(self, other):
+        return self._compare(other, lambda a, b: (a != 0) | (b != 0))
+
+    def Not(self):
+        return self._map(lambda a: np.where(np.isnan(a), np.nan, a == 0))
+
+    def log10(self):
+        return self._map(np.log10)
+
+    def updateMask(self, mask):
+        return self._binary(mask, lambda a, m: np.where(np.isfinite(m) & (m != 0), a, np.nan))
+
+    def selfMask(self):
+        return self.updateMask(self)
+
+    def unmask(self, value=0):
+        return self._map(lambda a: np.where(np.isnan(a), value, a))
+
+    def clip(self, geometry):
+        inside = _require_catalog().inside(geometry)
+        return self._map(lambda a: np.where(inside, self._full(a), np.nan))
+
+    def reduceNeighborhood(self, reducer, kernel):
+        if not isinstance(kernel, Kernel):
+            raise NotImplementedError("fake reduceNeighborhood only supports square kernels")
+        bands = {}
+        for name, values in self.bands.items():
+            values = self._full(values)
+            valid = np.isfinite(values)
+            filled = np.where(valid, values, 0)
+            count, total, total_sq = local_engine._box_sum(np.stack([valid, filled, filled * filled]), kernel.radius)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.where(count > 0, total / count, np.nan)
+                moments = {'mean': mean, 'variance': total_sq / count - mean * mean}
+            for output in reducer.outputs:
+                bands[f"{name}_{output}"] = moments[output]
+        return Image(bands=bands)
+
+    def focalMode(self, radius=1, kernelType='circle', units='pixels', iterations=1):
+        # A 1.5 px circle covers the full 3x3 neighbourhood, like local_engine.FOCAL_RADIUS.
+        return self._map(lambda a: local_engine.focal_mode(self._full(a), int(radius), iterations).astype(np.float64))
+
+    def reduceRegion(self, reducer, geometry=None, scale=None, bestEffort=False, maxPixels=None, **kwargs):
+        catalog = _require_catalog()
+        inside = catalog.inside(geometry) if geometry is not None else True
+        stride = max(1, round(scale / catalog.pixel_size())) if scale else 1
+        result = {}
+        for name, values in self.bands.items():
+            values = np.where(inside, self._full(values), np.nan)
+            output = reducer.outputs[0]
+            if output == 'histogram':
+                hist = local_engine.histogram(
+                    values, reducer.args['max_buckets'], reducer.args['min_bucket_width'], stride=stride
+                )
+                if hist is not None:
+                    result[name] = hist
+            elif output == 'sum':
+                result[name] = float(np.nansum(values))
+            elif output == 'mean':
+                result[name] = float(np.nanmean(values)) if np.isfinite(values).any() else None
+            else:
+                raise NotImplementedError(f"fake reduceRegion does not support {output}")
+        return Computed(result)
+
+    def reduceRegions(self, collection, reducer, scale=None, tileScale=1, **kwargs):
+        """Per-feature reduceRegion, rasterizing each feature over its bounding window only."""
+        catalog = _require_catalog()
+        _, transform, width, height = catalog.grid
+        inverse = ~transform
+        output = reducer.outputs[0]
+        if output == 'sum':
+            reduce = np.nansum
+        elif output == 'histogram' and 'fixed' in reducer.args:
+            lo, hi, steps = reducer.args['fixed']
+            edges = np.linspace(lo, hi, steps + 1)[:-1]
+
+            def reduce(values):
+                counts, _ = np.histogram(values[np.isfinite(values)], bins=steps, range=(lo, hi))
+                return np.column_stack([edges, counts]).tolist()
+        else:
+            raise NotImplementedError(f"fake reduceRegions does not support {output}")
+        bands = {name: self._full(values) for name, values in self.bands.items()}
+        features = []
+        for feature in collection.features:
+            geoms = feature.geometry().geometries()
+            coords = np.array([xy for ring in _rings(geoms) for xy in ring], dtype=np.float64)
+            cols, rows = inverse * (coords[:, 0], coords[:, 1])
+            r0, r1 = max(0, int(np.floor(rows.min()))), min(height, int(np.ceil(rows.max())) + 1)
+            c0, c1 = max(0, int(np.floor(cols.min()))), min(width, int(np.ceil(cols.max())) + 1)
+            values = {}
+            if r0 < r1 and c0 < c1:
+                inside = local_engine.roi_mask(geoms, catalog.grid, slice(r0, r1), slice(c0, c1))
+                for name, band in bands.items():
+                    values[name] = reduce(np.where(inside, band[r0:r1, c0:c1], np.nan))
+            else:
+                values = {name: reduce(np.array([np.nan])) for name in bands}
+            # A single band reduces to the reducer's output name, several to the band names.
+            properties = {output: values[next(iter(values))]} if len(values) == 1 else values
+            features.append(Feature(feature.geometry(), dict(feature.properties, **properties)))
+        return FeatureCollection(features)
+
+    def getInfo(self):
+        return {'type': 'Image', 'bands': [{'id': name} for name in self.bands]}
+
+
+def _rings(geoms):
+    for geom in geoms:
+        polygons = geom['coordinates'] if geom['type'] == 'MultiPolygon' else [geom['coordinates']]
+        for polygon in polygons:
+            yield from polygon
+
+
+class serializer:
+    """ee.serializer / ee.deserializer: graphs stay in-process and are referred to by a token."""
+
+    _objects = {}
+
+    @classmethod
+    def toJSON(cls, obj):
+        token = f'{{"fake_ee": {id(obj)}}}'
+        cls._objects[token] = obj
+        return token
+
+    @classmethod
+    def fromJSON(cls, token):
+        return cls._objects[token]
+
+
+deserializer = serializer
+
+
+@contextlib.contextmanager
+def profilePrinting(destination=sys.stderr):
+    """ee.profilePrinting: the profile is an empty table, since nothing runs on a server."""
+    yield
+    destination.write('EECU-s PeakMem Count Description\n')
+
+
+class _ExportTask:
+    """An export that completes on start(): the image becomes readable as ee.Image(asset_id)."""
+
+    def __init__(self, image, asset_id, description):
+        self.id = f"FAKE_{description}_{len(_require_catalog().images)}"
+        self.image = image
+        self.asset_id = asset_id
+
+    def start(self):
+        _require_catalog().images[self.asset_id] = {name: self.image._full(b) for name, b in self.image.bands.items()}
+
+
+class batch:
+    class Export:
+        class image:
+            @staticmethod
+            def toAsset(image, description='', assetId=None, **kwargs):
+                return _ExportTask(image, assetId, description)
+
+
+class Terrain:
+    @staticmethod
+    def slope(image):
+        catalog = _require_catalog()
+        crs, transform, _, _ = catalog.grid
+        dx = local_engine.LocalRaster(np.empty(catalog.shape), transform, crs).pixel_size()
+        dy = abs(transform.e) * math.pi / 180 * local_engine.EARTH_RADIUS
+
+        def slope(z):
+            gy, gx = np.gradient(image._full(z), dy, dx)
+            return np.degrees(np.arctan(np.hypot(gx, gy)))
+
+        return image._map(slope).rename('slope')
+
+
+class ImageCollection:
+    def __init__(self, source):
+        if isinstance(source, str):
+            self.entries = list(_require_catalog().collections[source])
+        else:
+            self.entries = list(source)
+        self.entries = [e if isinstance(e, tuple) else ({}, e) for e in self.entries]
+
+    def filter(self, ee_filter):
+        return ImageCollection([(p, i) for p, i in self.entries if ee_filter.predicate(p)])
+
+    def filterDate(self, start, end=None):
+        start_ms = _millis(start)
+        end_ms = _millis(end) if end is not None else start_ms + 86400000
+        return ImageCollection([(p, i) for p, i in self.entries if start_ms <= p['system:time_start'] < end_ms])
+
+    def filterBounds(self, geometry):
+        return self
+
+    def select(self, *selectors):
+        return ImageCollection([(p, i.select(*selectors)) for p, i in self.entries])
+
+    def size(self):
+        return Computed(len(self.entries))
+
+    def aggregate_array(self, name):
+        return Computed([p[name] for p, _ in self.entries])
+
+    def mosaic(self):
+        if not self.entries:
+            return Image(bands={})
+        # Later images are drawn on top, as in Earth Engine.
+        names = list(self.entries[0][1].bands)
+        bands = {}
+        for name in names:
+            out = np.full(_require_catalog().shape, np.nan)
+            for _, image in self.entries:
+                values = image._full(image.bands[name])
+                out = np.where(np.isfinite(values), values, out)
+            bands[name] = out
+        return Image(bands=bands)
+
+    def max(self):
+        return self._reduce(np.fmax)
+
+    def mean(self):
+        stack = [i for _, i in self.entries]
+        return Image(bands={name: np.nanmean([i._full(i.bands[name]) for i in stack], axis=0)
+                            for name in stack[0].bands})
+
+    def _reduce(self, fn):
+        stack = [i for _, i in self.entries]
+        return Image(bands={name: fn.reduce([i._full(i.bands[name]) for i in stack])
+                            for name in stack[0].bands})
+
+
+class Date:
+    def __init__(self, value):
+        self.millis = _millis(value)
+
+    def advance(self, delta, unit):
+        seconds = {'day': 86400, 'hour': 3600, 'minute': 60, 'second': 1}[unit]
+        return Date(self.millis + int(delta * seconds * 1000))
+
+    def format(self, pattern=None):
+        if pattern not in (None, 'YYYY-MM-dd'):
+            raise NotImplementedError(f"fake Date.format does not support {pattern!r}")
+        day = datetime.datetime.fromtimestamp(self.millis / 1000, datetime.timezone.utc)
+        return Computed(day.strftime('%Y-%m-%d'))
+
+
+def _millis(value):
+    value = _unwrap(value)
+    if isinstance(value, Date):
+        return value.millis
+    if isinstance(value, (int, float, np.number)):
+        return int(value)
+    parsed = datetime.datetime.fromisoformat(str(value))
+    return int(parsed.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+
+class Catalog:
+    """Synthetic images on one EPSG:4326 grid, served to the fake ee.Image / ee.ImageCollection."""
+
+    def __init__(self, grid, collections, images):
+        self.grid = grid
+        self.collections = collections
+        self.images = images
+        self._inside = {}
+
+    @property
+    def shape(self):
+        return self.grid[3], self.grid[2]
+
+    def pixel_size(self):
+        crs, transform, _, _ = self.grid
+        return local_engine.LocalRaster(np.empty(self.shape), transform, crs).pixel_size()
+
+    def inside(self, geometry):
+        geojson = geometry.geojson if isinstance(geometry, Geometry) else geometry
+        key = repr(geojson)
+        if key not in self._inside:
+            height, width = self.shape
+            self._inside[key] = local_engine.roi_mask(
+                local_engine.roi_geometries(geojson), self.grid, slice(0, height), slice(0, width)
+            )
+        return self._inside[key]
+
+    def roi(self):
+        """GeoJSON polygon covering the whole grid."""
+        _, transform, width, height = self.grid
+        west, north = transform.c, transform.f
+        east, south = west + transform.a * width, north + transform.e * height
+        return {'type': 'Polygon', 'coordinates': [[[west, south], [east, south], [east, north], [west, north], [west, south]]]}
+
+
+def synthetic_catalog(size=1024, seed=0, before_dates=('2023-08-01', '2023-08-13'), after_dates=('2023-09-18',)):
+    """A size x size ~10 m scene: a meandering river, flood blobs after the event and a steep corner."""
+    from affine import Affine
+    from rasterio.crs import CRS
+
+    rng = np.random.default_rng(seed)
+    transform = Affine(PIXEL_DEGREES, 0, ORIGIN[0], 0, -PIXEL_DEGREES, ORIGIN[1])
+    grid = (CRS.from_epsg(4326), transform, size, size)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float64)
+    river = np.abs(x - size / 2 - size / 8 * np.sin(y / (size / 6))) < size / 40
+    flood = (np.sin(x / (size / 10)) * np.cos(y / (size / 13)) > 0.7) & ~river
+
+    def scene(water):
+        power = 10 ** (np.where(water, -21.0, -8.0) / 10) * rng.gamma(4, 1 / 4, water.shape)
+        return 10 * np.log10(power)
+
+    props = {
+        'instrumentMode': 'IW', 'transmitterReceiverPolarisation': ['VV', 'VH'], 'orbitProperties_pass': 'ASCENDING'
+    }
+    entries = [(dict(props, **{'system:time_start': _millis(d)}), Image(bands={'VV': scene(river)}))
+               for d in before_dates]
+    entries += [(dict(props, **{'system:time_start': _millis(d)}), Image(bands={'VV': scene(river | flood)}))
+                for d in after_dates]
+    dem = 10 + 0.002 * x + np.where((x > 0.8 * size) & (y < 0.2 * size), 0.5 * (x - 0.8 * size), 0)
+    return Catalog(grid, {S1_COLLECTION: entries}, {DEM_IMAGE: {'elevation': dem}})
+
+
+def _require_catalog():
+    if _catalog is None:
+        raise EEException("No fake catalog installed; use fake_ee.use_fake_ee(catalog)")
+    return _catalog
+
+
+@contextlib.contextmanager
+def use_fake_ee(catalog, modules=('flood_core', 'ee_client')):
+    """Evaluate the given modules' ``ee`` calls against catalog for the duration of the block."""
+    global _catalog
+    previous_catalog, _catalog = _catalog, catalog
+    fake = sys.modules[__name__]
+    swapped = []
+    try:
+        for name in modules:
+            module = sys.modules.get(name) or __import__(name)
+            swapped.append((module, module.ee))
+            module.ee = fake
+        yield catalog
+    finally:
+        for module, original in swapped:
+            module.ee = original
+        _catalog = previous_catalog
@@ -1,16 +1,21 @@
 import streamlit as st
 import ee
 
-try:
-    import geemap.foliumap as geemap
-except Exception:
-    import geemap
-    
-import pandas as pd
-import numpy as np
+import functools
+import importlib
+import threading
 from datetime import datetime, date
 import json
-from google.oauth2 import service_account
+
+from flood_core import (
+    EE_SCOPES, geojson_to_ee_geometry, run_cached_analysis, run_flood_time_series,
+    get_result_cache, export_to_drive, export_vector_to_drive, result_handle, handle_objects, ORBIT_PASSES,
+    get_static_store, run_multi_roi_analysis
+)
+from ee_client import get_client
+from export_manager import ExportManager, can_download, download_image, export_key
+from instrumentation import begin_run, end_run, stage, track_run
+from map_layers import Layer, TileUrlCache, add_choropleth, add_layers, add_roi_outline, fit_roi
 
 st.set_page_config(
     page_title="Sentinel-1 Flood Mapper",
@@ -30,6 +35,40 @@ st.markdown("""
 
 _MAP_HEIGHT = 600
 _MAP_WIDTH = 1000
+SAR_VIS = {'min': -18.54, 'max': 1.335, 'gamma': 1.26}
+SPINNER_TEXT = {
+    "Single event": "Running flood analysis... This may take a few minutes.",
+    "Time series": "Running flood time series...",
+    "Per feature": "Running flood analysis for every feature...",
+}
+# Rerun timings kept per session for the Performance panel.
+RERUN_HISTORY = 20
+
+# geemap (with folium, ipyleaflet and their dependencies) takes seconds to import, so the page loads
+# without it and it is imported when a map is first drawn, or earlier by prewarm().
+@functools.lru_cache(maxsize=None)
+def _geemap():
+    try:
+        import geemap.foliumap as geemap
+    except Exception:
+        import geemap
+    return geemap
+
+def _import_map_stack():
+    _geemap()
+    importlib.import_module('pandas')
+
+@st.cache_resource
+def prewarm():
+    """Import the map stack on a background thread, once per server process.
+
+    Started once Earth Engine is initialized and the controls are drawn, so the import overlaps the
+    user setting up (or the server computing) the first analysis instead of delaying the page; later
+    sessions and reruns find it loaded.
+    """
+    thread = threading.Thread(target=_import_map_stack, name='prewarm', daemon=True)
+    thread.start()
+    return thread
 
 @st.cache_resource
 def initialize_ee(project=None):
@@ -55,11 +94,11 @@ def initialize_ee(project=None):
                 if not isinstance(service_account_info, dict):
                     return False, f"Service account info is {type(service_account_info)}, expected dict. Check TOML format."
                     
-                SCOPES = ['https://www.googleapis.com/auth/earthengine']
+                from google.oauth2 import service_account
                 
                 creds = service_account.Credentials.from_service_account_info(
                     service_account_info,
-                    scopes=SCOPES
+                    scopes=EE_SCOPES
                 )
                 ee.Initialize(credentials=creds)
                 return True, None
@@ -88,126 +127,325 @@ def initialize_ee(project=None):
         else:
             return False, error_msg
 
-def geojson_to_ee_geometry(geojson_data):
-    """Convert GeoJSON dict to ee.Geometry, supporting Geometry/Feature/FeatureCollection."""
-    gtype = geojson_data.get('type') if isinstance(geojson_data, dict) else None
-
-    if gtype == 'FeatureCollection':
-        features = geojson_data.get('features', [])
-        if not features:
-            raise ValueError("GeoJSON FeatureCollection contains no features")
-        geoms = [
-            ee.Feature(f).geometry()
-            for f in features
-            if isinstance(f, dict) and f.get('geometry')
-        ]
-        if not geoms:
-            raise ValueError("GeoJSON FeatureCollection has no valid geometries")
-        return ee.FeatureCollection([ee.Feature(g) for g in geoms]).geometry()
-
-    if gtype == 'Feature':
-        return ee.Feature(geojson_data).geometry()
-
-    if gtype in {'Point', 'MultiPoint', 'LineString', 'MultiLineString', 'Polygon', 'MultiPolygon', 'GeometryCollection'}:
-        return ee.Geometry(geojson_data)
-
-    raise ValueError(f"Unsupported GeoJSON type: {gtype}")
-
-def refined_lee_filter(image):
-    bandNames = image.bandNames()
-    img = ee.Image(image).toFloat()
-    weights = ee.List.repeat(ee.List.repeat(1, 3), 3)
-    kernel = ee.Kernel.fixed(3, 3, weights, 1, 1, False)
-    mean = img.reduceNeighborhood(reducer=ee.Reducer.mean(), kernel=kernel)
-    variance = img.reduceNeighborhood(reducer=ee.Reducer.variance(), kernel=kernel)
-    variance_mean_sq = variance.divide(mean.multiply(mean))
-    sigma_v = ee.Image(0.05)
-    b = variance_mean_sq.subtract(sigma_v).divide(variance_mean_sq.multiply(ee.Image(1).add(sigma_v)))
-    b = b.min(1).max(0)
-    return mean.add(b.multiply(img.subtract(mean))).rename(bandNames)
-
-def otsu_threshold(histogram):
-    counts = ee.Array(ee.Dictionary(histogram).get('histogram'))
-    means = ee.Array(ee.Dictionary(histogram).get('bucketMeans'))
-    size = means.length().get([0])
-    total = counts.reduce(ee.Reducer.sum(), [0]).get([0])
-    sum_val = means.multiply(counts).reduce(ee.Reducer.sum(), [0]).get([0])
-    mean = sum_val.divide(total)
-    indices = ee.List.sequence(1, size)
-    
-    def calculate_bss(i):
-        aCounts = counts.slice(0, 0, i)
-        aCount = aCounts.reduce(ee.Reducer.sum(), [0]).get([0])
-        aMeans = means.slice(0, 0, i)
-        aMean = aMeans.multiply(aCounts).reduce(ee.Reducer.sum(), [0]).get([0]).divide(aCount)
-        bCount = total.subtract(aCount)
-        bMean = sum_val.subtract(aCount.multiply(aMean)).divide(bCount)
-        return aCount.multiply(aMean.subtract(mean).pow(2)).add(bCount.multiply(bMean.subtract(mean).pow(2)))
-    
-    bss = indices.map(calculate_bss)
-    return means.sort(bss).get([-1])
-
-def run_flood_analysis(roi, before_start, before_end, after_start, after_end):
-    collection = ee.ImageCollection('COPERNICUS/S1_GRD') \
-        .filter(ee.Filter.eq('instrumentMode', 'IW')) \
-        .filter(ee.Filter.listContains('transmitterReceiverPolarisation', 'VV')) \
-        .filter(ee.Filter.eq('orbitProperties_pass', 'ASCENDING')) \
-        .filterBounds(roi).select('VV')
-    
-    before = collection.filterDate(before_start, before_end).mosaic().clip(roi)
-    after = collection.filterDate(after_start, after_end).mosaic().clip(roi)
-    
-    before_filtered = refined_lee_filter(before)
-    after_filtered = refined_lee_filter(after)
-    
-    histogram = before_filtered.reduceRegion(
-        reducer=ee.Reducer.histogram(255, 0.1),
-        geometry=roi, scale=30, bestEffort=True
-    )
+@st.cache_resource
+def get_export_manager():
+    manager = ExportManager()
+    if manager.active():
+        manager.start_polling()
+    return manager
+
+@st.cache_resource
+def get_tile_cache():
+    return TileUrlCache()
+
+def render_tile_cache_stats():
+    tile_stats = get_tile_cache().stats()
+    st.caption(f"Map tile URLs: {tile_stats['hits']} reused / {tile_stats['misses']} requested from Earth Engine")
+
+def submit_export(kind, data, description, folder, roi=None):
+    """Start a Drive export through the shared manager unless an identical one is pending or done."""
+    key = export_key(kind, description, folder, ee.serializer.toJSON(data))
     
-    threshold = ee.Number(ee.Algorithms.If(
-        histogram.contains('VV'),
-        otsu_threshold(histogram.get('VV')), -15
-    ))
-    
-    water_mask = after_filtered.lt(threshold)
-    srtm = ee.Image("USGS/SRTMGL1_003")
-    slope = ee.Terrain.slope(srtm)
-    slope_mask = slope.lt(5)
-    water_cleaned = water_mask.updateMask(slope_mask).focalMode(1.5, 'circle', 'pixels', 5)
-    permanent_water = before_filtered.lt(threshold)
-    flood_only = water_cleaned.And(permanent_water.Not())
-    
-    flood_area = flood_only.multiply(ee.Image.pixelArea()).reduceRegion(
-        reducer=ee.Reducer.sum(), geometry=roi, scale=30, bestEffort=True
-    ).get('VV')
-    
-    roi_area = roi.area(maxError=1)
-    
-    return {
-        'before_filtered': before_filtered,
-        'after_filtered': after_filtered,
-        'flood_mask': flood_only,
-        'threshold': threshold,
-        'flood_area': flood_area,
-        'roi_area': roi_area
-    }
-
-def export_to_drive(image, description, folder, roi, scale=10):
-    task = ee.batch.Export.image.toDrive(
-        image=image, description=description, folder=folder,
-        scale=scale, region=roi, maxPixels=1e10
+    def start():
+        if kind == 'image':
+            return export_to_drive(data, description, folder, roi)
+        return export_vector_to_drive(data, description, folder)
+    
+    with track_run('export'), stage(f"export_{kind}"):
+        entry, started = get_export_manager().submit(key, start, description)
+    if started:
+        st.success(f"Export task {description} started!")
+    else:
+        st.info(f"{description} is already {entry['state'].lower()}; not starting it again.")
+
+def render_export_status():
+    entries = get_export_manager().entries()
+    if not entries:
+        return
+    import pandas as pd
+    
+    table = pd.DataFrame([{
+        'Export': e['description'],
+        'State': e['state'],
+        'Progress': e['progress'],
+        'Submitted': datetime.fromtimestamp(e['submitted']).strftime('%Y-%m-%d %H:%M'),
+        'Error': e['error'] or ''
+    } for e in entries])
+    st.dataframe(
+        table, use_container_width=True, hide_index=True,
+        column_config={'Progress': st.column_config.ProgressColumn(min_value=0.0, max_value=1.0)}
     )
-    task.start()
-    return task
 
-def export_vector_to_drive(vectors, description, folder):
-    task = ee.batch.Export.table.toDrive(
-        collection=vectors, description=description,
-        folder=folder, fileFormat='SHP'
+if hasattr(st, 'fragment'):
+    # Re-render just the task table every few seconds without rerunning the whole script.
+    render_export_status = st.fragment(run_every=5)(render_export_status)
+
+def render_performance(metrics, rerun_seconds=None):
+    """Expandable per-stage timings and Earth Engine traffic for one run, plus recent rerun times."""
+    import pandas as pd
+    
+    totals = metrics.totals()
+    with st.expander("Performance", expanded=False):
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Wall time", f"{metrics.seconds:.1f} s")
+        col2.metric("EE API calls", totals['ee_calls'])
+        col3.metric("Sent", f"{totals['request_bytes'] / 1024:.1f} KiB")
+        col4.metric("Received", f"{totals['response_bytes'] / 1024:.1f} KiB")
+        table = pd.DataFrame(metrics.stages + [metrics.outside])
+        table['request_kib'] = table.pop('request_bytes') / 1024
+        table['response_kib'] = table.pop('response_bytes') / 1024
+        st.dataframe(table, use_container_width=True, hide_index=True)
+        client = get_client().stats()
+        st.caption(
+            f"Shared EE client: {client.get('requests', 0)} requests, {client.get('coalesced', 0)} coalesced "
+            f"with identical in-flight ones, {client.get('retries', 0)} retries, "
+            f"{client.get('throttled_seconds', 0):.1f} s rate-limited"
+        )
+        if metrics.server_profile:
+            st.caption("Earth Engine server profile")
+            st.text(metrics.server_profile)
+        if rerun_seconds:
+            st.caption(
+                f"Redraws from the stored result: {len(rerun_seconds)}, last {rerun_seconds[-1]:.2f} s, "
+                f"slowest {max(rerun_seconds):.2f} s"
+            )
+            st.line_chart(pd.Series(rerun_seconds, name='seconds'))
+
+def analyze(analysis_mode, roi, roi_geojson, dates, tiled, directional_lee, orbit_pass, plan_scenes,
+            threshold_mode='global', progressive=False, on_preview=None):
+    """Run the pipeline once and reduce it to a result handle for st.session_state."""
+    if analysis_mode == "Time series":
+        series = run_flood_time_series(
+            roi, roi_geojson, *dates, directional_lee=directional_lee, orbit_pass=orbit_pass,
+            plan_scenes=plan_scenes, threshold_mode=threshold_mode
+        )
+        return result_handle(
+            analysis_mode, roi,
+            {name: series[name] for name in ('before_filtered', 'frequency', 'max_extent')},
+            roi_geojson=roi_geojson, table=series['table'], threshold=series['threshold']
+        )
+    if analysis_mode == "Per feature":
+        stats, images, features = run_multi_roi_analysis(
+            roi_geojson, dates, orbit_pass=orbit_pass, plan_scenes=plan_scenes, directional_lee=directional_lee,
+            slope_mask=get_static_store().slope_mask(roi, roi_geojson)
+        )
+        return result_handle(analysis_mode, roi, images, roi_geojson=roi_geojson, stats=stats, features=features)
+    stats, images = run_cached_analysis(
+        roi, roi_geojson, dates, tiled=tiled, directional_lee=directional_lee,
+        orbit_pass=orbit_pass, plan_scenes=plan_scenes, threshold_mode=threshold_mode,
+        progressive=progressive, on_preview=on_preview
     )
-    task.start()
-    return task
+    return result_handle(analysis_mode, roi, images, roi_geojson=roi_geojson, stats=stats)
+
+def render_time_series(handle, selected_layers, view):
+    roi, images = handle_objects(handle)
+    table = handle['table']
+    
+    with view['stats'].container():
+        st.metric("Otsu Threshold", f"{handle['threshold']:.2f}")
+        st.metric("Acquisitions", f"{len(table)} ({int(table['cached'].sum())} cached)")
+        st.markdown(f'<div class="flood-area">Peak Flooded Area: {table["flood_area_km2"].max():.2f} km²</div>', unsafe_allow_html=True)
+        st.line_chart(table.set_index('date')['flood_area_km2'])
+        st.dataframe(table, use_container_width=True)
+    
+    with stage('map_layers'):
+        Map = _geemap().Map()
+        fit_roi(Map, handle['roi_geojson'])
+        add_layers(Map, [
+            Layer('Before (Filtered)', images['before_filtered'], SAR_VIS, True),
+            Layer('Flood Frequency', images['frequency'].selfMask(), {'min': 0, 'max': 1, 'palette': ['yellow', 'orange', 'red']}, True),
+            Layer('Maximum Extent', images['max_extent'].selfMask(), {'palette': ['blue'], 'opacity': 0.5}, False),
+        ], get_tile_cache(), selected_layers)
+        add_roi_outline(Map, handle['roi_geojson'])
+    with view['map']:
+        Map.to_streamlit(height=_MAP_HEIGHT, width=_MAP_WIDTH)
+    with view['map_column']:
+        render_tile_cache_stats()
+
+def render_single_event(handle, selected_layers, view):
+    roi, results = handle_objects(handle)
+    stats = handle['stats']
+    threshold_val = stats['threshold']
+    flood_area_val = stats['flood_area'] / 1e6
+    roi_area_val = stats['roi_area'] / 1e6
+    cache_stats = get_result_cache().stats()
+    
+    with view['stats'].container():
+        st.markdown('<div class="stat-box">', unsafe_allow_html=True)
+        st.metric("ROI Area", f"{roi_area_val:.2f} km²")
+        st.metric("Otsu Threshold", f"{threshold_val:.2f}")
+        st.markdown(f'<div class="flood-area">Flooded Area: {flood_area_val:.2f} km²</div>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+        if 'shallow_area' in stats:
+            st.metric("Shallow/Mixed Water", f"{(stats['shallow_area'] or 0) / 1e6:.2f} km²",
+                      help=f"New water between {threshold_val:.2f} and {stats['shallow_threshold']:.2f} dB")
+        adaptive = stats.get('adaptive')
+        if adaptive:
+            source = "all cells (none bimodal)" if adaptive['fallback'] else \
+                f"{len(adaptive['bimodal'])} bimodal of {len(adaptive['cells'])} cells"
+            st.caption(
+                f"Adaptive threshold from {source}; cell histograms "
+                f"{'cached' if adaptive['cached'] else 'reduced'} in {adaptive['seconds']:.1f} s"
+            )
+        progressive = stats.get('progressive')
+        if progressive:
+            st.caption(
+                f"Progressive: {progressive['scale']} m preview in {progressive['first_seconds']:.1f} s, "
+                f"{progressive['refined']} of {progressive['tiles']} tiles refined at 30 m, final in "
+                f"{progressive['final_seconds']:.1f} s; full resolution could add at most "
+                f"{progressive['bound'] / 1e6:.2f} km²"
+            )
+        plan = stats.get('scenes')
+        if plan:
+            st.caption(
+                f"Scenes: {len(plan['before'])} before + {len(plan['after'])} after of "
+                f"{plan['candidates']['before'] + plan['candidates']['after']} candidates "
+                f"(relative orbit {plan['orbit']}, {plan['pass'].lower()}, "
+                f"{min(plan['coverage'].values()):.0%} ROI coverage)"
+            )
+        st.caption(
+            f"Result cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+            f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 1024:.0f} KiB)"
+        )
+    
+    # Keep key layers visible by default; prefer Esri imagery and fall back if basemap tiles fail.
+    Map = _geemap().Map()
+    fit_roi(Map, handle['roi_geojson'])
+    try:
+        Map.add_basemap("Esri.WorldImagery")
+    except Exception:
+        try:
+            Map.add_basemap("HYBRID")
+        except Exception:
+            pass
+    
+    with stage('map_layers'):
+        flood_layer = results['flood_mask'].updateMask(results['flood_mask'])
+        # Keep flood overlay slightly transparent so basemap and SAR imagery remain visible.
+        layers = [
+            Layer('Before (Filtered)', results['before_filtered'], SAR_VIS, True),
+            Layer('After (Filtered)', results['after_filtered'], SAR_VIS, True),
+            Layer('Flooded Areas', flood_layer, {'palette': ['red'], 'opacity': 0.6}, True),
+        ]
+        if 'shallow_mask' in results:
+            layers.append(Layer('Shallow Water', results['shallow_mask'].selfMask(),
+                                {'palette': ['orange'], 'opacity': 0.6}, True))
+        add_layers(Map, layers, get_tile_cache(), selected_layers)
+        add_roi_outline(Map, handle['roi_geojson'])
+        if stats.get('adaptive'):
+            cells = [dict(cell, properties=dict(cell['properties'], bimodal=int(cell['properties']['bimodal'])))
+                     for cell in stats['adaptive']['cells']]
+            add_choropleth(Map, cells, 'bimodal', 'Threshold cells', 'Used for the threshold (1 = bimodal)',
+                           colormap='Blues_03')
+    try:
+        import folium
+        # Support both folium-backed geemap variants when adding layer controls.
+        if hasattr(Map, "folium_map"):
+            Map.folium_map.add_child(folium.LayerControl())
+        elif hasattr(Map, "add_child"):
+            Map.add_child(folium.LayerControl())
+    except Exception:
+        pass
+    
+    with view['map']:
+        try:
+            Map.to_streamlit(height=_MAP_HEIGHT, width=_MAP_WIDTH)
+        except (RuntimeError, ConnectionError, TimeoutError) as e:
+            st.error(
+                f"Map rendering failed ({type(e).__name__}). "
+                "Please refresh the page and rerun the analysis. "
+                "If the issue persists, verify Earth Engine authentication and network connectivity."
+            )
+    with view['map_column']:
+        render_tile_cache_stats()
+    
+    render_exports(roi, results, stats, view)
+
+def render_per_feature(handle, selected_layers, view):
+    import pandas as pd
+    
+    roi, results = handle_objects(handle)
+    stats = handle['stats']
+    table = pd.DataFrame([f['properties'] for f in handle['features']]).drop(columns='feature_id')
+    table = table.sort_values('flood_area_km2', ascending=False)
+    
+    with view['stats'].container():
+        st.metric("Otsu Threshold", f"{stats['threshold']:.2f}")
+        st.metric("Features", len(table))
+        st.markdown(f'<div class="flood-area">Flooded Area: {table["flood_area_km2"].sum():.2f} km²</div>', unsafe_allow_html=True)
+        st.dataframe(
+            table, use_container_width=True, hide_index=True,
+            column_config={'flood_pct': st.column_config.NumberColumn("Flooded %", format="%.1f")}
+        )
+        st.download_button("Download table (CSV)", table.to_csv(index=False), file_name='flood_by_feature.csv', mime='text/csv')
+    
+    Map = _geemap().Map()
+    fit_roi(Map, handle['roi_geojson'])
+    with stage('map_layers'):
+        flood_layer = results['flood_mask'].updateMask(results['flood_mask'])
+        add_layers(Map, [
+            Layer('Before (Filtered)', results['before_filtered'], SAR_VIS, True),
+            Layer('After (Filtered)', results['after_filtered'], SAR_VIS, True),
+            Layer('Flooded Areas', flood_layer, {'palette': ['red'], 'opacity': 0.6}, True),
+        ], get_tile_cache(), selected_layers)
+        add_choropleth(Map, handle['features'], 'flood_pct', 'Flooded share by feature', 'Flooded % of feature')
+    try:
+        import folium
+        Map.add_child(folium.LayerControl())
+    except Exception:
+        pass
+    with view['map']:
+        Map.to_streamlit(height=_MAP_HEIGHT, width=_MAP_WIDTH)
+    with view['map_column']:
+        render_tile_cache_stats()
+    render_exports(roi, results, stats, view)
+
+def render_exports(roi, results, stats, view):
+    with view['exports'].container():
+        st.info("Click the buttons below to start export tasks")
+        export_folder = st.text_input("Google Drive Folder", value="Flood_Exports", key='export_folder')
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            if st.button("Export Flood Mask (Raster)"):
+                submit_export('image', results['flood_mask'].toByte(), 'Flood_Mask_Raster', export_folder, roi)
+        
+        with col2:
+            if st.button("Export Before Image"):
+                submit_export('image', results['before_filtered'].visualize(SAR_VIS), 'Before_Image_Visualized', export_folder, roi)
+        
+        with col3:
+            if st.button("Export After Image"):
+                submit_export('image', results['after_filtered'].visualize(SAR_VIS), 'After_Image_Visualized', export_folder, roi)
+        
+        if st.button("Export Flood Polygons (Shapefile)"):
+            flood_vectors = results['flood_mask'].reduceToVectors(
+                geometry=roi, scale=10, geometryType='polygon',
+                eightConnected=False, labelProperty='zone',
+                reducer=ee.Reducer.countEvery()
+            )
+            submit_export('table', flood_vectors, 'Flood_Mask_Vectors', export_folder)
+        
+        if can_download(stats['roi_area']) and st.button("Download Flood Mask (GeoTIFF, skip Drive)"):
+            import tempfile
+            import os
+            
+            path = os.path.join(tempfile.mkdtemp(), 'flood_mask.tif')
+            download_image(results['flood_mask'].toByte(), roi, path)
+            with open(path, 'rb') as f:
+                st.download_button("Save flood_mask.tif", f.read(), file_name='flood_mask.tif', mime='image/tiff')
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def load_upload(file_id, filename, tolerance_m, dissolve, _uploaded_file):
+    """Ingest an uploaded ROI once per file and tolerance instead of on every rerun.
+    
+    Without ``dissolve`` each feature is kept with its properties (per-feature mode).
+    """
+    from roi_ingest import ingest_upload
+    
+    _uploaded_file.seek(0)
+    return ingest_upload(_uploaded_file, filename, tolerance_m=tolerance_m, dissolve=dissolve)
 
 def check_password():
     password_set = False
@@ -301,6 +539,13 @@ def main():
     before_start = st.sidebar.date_input("Before Start Date", value=date(2025, 9, 29), disabled=ui_disabled)
     before_end = st.sidebar.date_input("Before End Date", value=date(2025, 9, 30), disabled=ui_disabled)
     
+    analysis_mode = st.sidebar.radio(
+        "Analysis Mode", ["Single event", "Time series", "Per feature"],
+        help="Time series maps every acquisition between the post-event dates against the pre-event baseline. "
+             "Per feature keeps the features of an uploaded file separate and reports flood area for each.",
+        disabled=ui_disabled
+    )
+    
     st.sidebar.subheader("Post-Event (After Flood)")
     after_start = st.sidebar.date_input("After Start Date", value=date(2025, 10, 5), disabled=ui_disabled)
     after_end = st.sidebar.date_input("After End Date", value=date(2025, 10, 6), disabled=ui_disabled)
@@ -309,6 +554,7 @@ def main():
     roi_method = st.sidebar.radio("Select ROI Method:", ["Upload File (GeoJSON/Shapefile)", "Use Coordinates"], disabled=ui_disabled)
     
     roi = None
+    roi_geojson = None
     
     if roi_method == "Upload File (GeoJSON/Shapefile)":
         uploaded_file = st.sidebar.file_uploader(
@@ -316,54 +562,22 @@ def main():
             type=['geojson', 'json', 'shp', 'zip'],
             disabled=ui_disabled
         )
+        simplify_tolerance = st.sidebar.number_input(
+            "Simplification tolerance (m)", min_value=0.0, value=10.0, step=5.0,
+            help="Topology-preserving simplification applied to uploaded boundaries before they are sent to Earth Engine.",
+            disabled=ui_disabled
+        )
         if uploaded_file and not ui_disabled:
             try:
-                file_type = uploaded_file.name.split('.')[-1].lower()
-                
-                if file_type in ['geojson', 'json']:
-                    geojson_data = json.load(uploaded_file)
-                    roi = geojson_to_ee_geometry(geojson_data)
-                    st.sidebar.success(f"Loaded {uploaded_file.name}")
-                
-                elif file_type == 'shp':
-                    import tempfile
-                    import geopandas as gpd
-                    
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.shp') as tmp:
-                        tmp.write(uploaded_file.read())
-                        tmp_path = tmp.name
-                    
-                    gdf = gpd.read_file(tmp_path)
-                    geojson_data = json.loads(gdf.to_json())
-                    roi = geojson_to_ee_geometry(geojson_data)
-                    st.sidebar.success(f"Loaded {uploaded_file.name}")
-                    
-                    import os
-                    os.unlink(tmp_path)
-                
-                elif file_type == 'zip':
-                    import tempfile
-                    import zipfile
-                    import geopandas as gpd
-                    import os
-                    
-                    with tempfile.TemporaryDirectory() as tmpdir:
-                        zip_path = os.path.join(tmpdir, 'upload.zip')
-                        with open(zip_path, 'wb') as f:
-                            f.write(uploaded_file.read())
-                        
-                        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                            zip_ref.extractall(tmpdir)
-                        
-                        shp_files = [f for f in os.listdir(tmpdir) if f.endswith('.shp')]
-                        if shp_files:
-                            shp_path = os.path.join(tmpdir, shp_files[0])
-                            gdf = gpd.read_file(shp_path)
-                            geojson_data = json.loads(gdf.to_json())
-                            roi = geojson_to_ee_geometry(geojson_data)
-                            st.sidebar.success(f"Loaded {shp_files[0]} from zip")
-                        else:
-                            st.sidebar.error("No .shp file found in zip")
+                ingested = load_upload(uploaded_file.file_id, uploaded_file.name, simplify_tolerance,
+                                       analysis_mode != "Per feature", uploaded_file)
+                roi_geojson = ingested['geojson']
+                roi = geojson_to_ee_geometry(roi_geojson)
+                st.sidebar.success(f"Loaded {uploaded_file.name}")
+                st.sidebar.caption(
+                    f"{ingested['features']} feature(s), "
+                    f"{ingested['vertices_before']:,} → {ingested['vertices_after']:,} vertices"
+                )
             
             except Exception as e:
                 st.sidebar.error(f"Error loading file: {str(e)}")
@@ -379,6 +593,61 @@ def main():
             max_lat = st.number_input("Max Latitude", value=31.0, format="%.4f", disabled=ui_disabled)
         if not ui_disabled:
             roi = ee.Geometry.Rectangle([min_lon, min_lat, max_lon, max_lat])
+            roi_geojson = {
+                'type': 'Polygon',
+                'coordinates': [[[min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, max_lat], [min_lon, min_lat]]]
+            }
+    
+    tiled = st.sidebar.checkbox(
+        "Tiled full-resolution processing",
+        value=False,
+        help="Split large ROIs into tiles so flood area is computed at full scale instead of a coarsened best-effort scale.",
+        disabled=ui_disabled or analysis_mode != "Single event"
+    )
+    directional_lee = st.sidebar.checkbox(
+        "Directional Refined Lee (7x7)",
+        value=False,
+        help="Edge-preserving 7x7 Refined Lee instead of the default 3x3 Lee filter; sharper shorelines, slower.",
+        disabled=ui_disabled
+    )
+    orbit_pass = st.sidebar.selectbox(
+        "Orbit pass", ORBIT_PASSES,
+        help="Sentinel-1 pass direction; BOTH considers ascending and descending scenes.",
+        disabled=ui_disabled
+    )
+    threshold_mode = st.sidebar.selectbox(
+        "Threshold", ["global", "adaptive", "multi"],
+        format_func={'global': "Global Otsu", 'adaptive': "Adaptive (bimodal grid cells)",
+                     'multi': "Multi-Otsu (open + shallow water)"}.get,
+        help="Adaptive merges the histograms of only those 5 km cells that contain both water and land. "
+             "Multi-Otsu adds a second threshold for shallow or mixed water (flooded vegetation).",
+        disabled=ui_disabled
+    )
+    progressive = st.sidebar.checkbox(
+        "Progressive (coarse preview first)",
+        value=False,
+        help="Show a 150 m result within seconds, then refine at 30 m only the tiles with water or near-threshold pixels.",
+        disabled=ui_disabled or analysis_mode != "Single event"
+    )
+    plan_scenes = st.sidebar.checkbox(
+        "Single relative orbit (scene planner)",
+        value=True,
+        help="Mosaic only the fewest scenes of one relative orbit that cover the ROI, instead of every scene in the window.",
+        disabled=ui_disabled
+    )
+    if analysis_mode == "Time series":
+        layer_names, hidden = ['Before (Filtered)', 'Flood Frequency', 'Maximum Extent'], ['Maximum Extent']
+    else:
+        layer_names, hidden = ['Before (Filtered)', 'After (Filtered)', 'Flooded Areas'], []
+        if analysis_mode == "Single event" and threshold_mode == 'multi':
+            layer_names.append('Shallow Water')
+    map_layers = st.sidebar.multiselect(
+        "Map layers",
+        layer_names,
+        default=[name for name in layer_names if name not in hidden],
+        help="Only the selected layers are requested from Earth Engine; their tile URLs are cached across reruns.",
+        disabled=ui_disabled
+    )
     
     run_analysis = st.sidebar.button("RUN ANALYSIS", type="primary", disabled=ui_disabled)
     
@@ -401,106 +670,57 @@ def main():
 
     if not ee_status:
         st.stop()
+    prewarm()
+    
+    with st.expander("Export Tasks", expanded=bool(get_export_manager().active())):
+        render_export_status()
         
-    if run_analysis and roi:
-        with st.spinner("Running flood analysis... This may take a few minutes."):
-            try:
-                results = run_flood_analysis(
-                    roi,
-                    before_start.strftime('%Y-%m-%d'),
-                    before_end.strftime('%Y-%m-%d'),
-                    after_start.strftime('%Y-%m-%d'),
-                    after_end.strftime('%Y-%m-%d')
-                )
-                
-                threshold_val = results['threshold'].getInfo()
-                flood_area_val = results['flood_area'].getInfo() / 1e6
-                roi_area_val = results['roi_area'].getInfo() / 1e6
-                
-                with stats_placeholder.container():
-                    st.markdown('<div class="stat-box">', unsafe_allow_html=True)
-                    st.metric("ROI Area", f"{roi_area_val:.2f} km²")
-                    st.metric("Otsu Threshold", f"{threshold_val:.2f}")
-                    st.markdown(f'<div class="flood-area">Flooded Area: {flood_area_val:.2f} km²</div>', unsafe_allow_html=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Keep key layers visible by default; prefer Esri imagery and fall back if basemap tiles fail.
-                Map = geemap.Map()
-                Map.centerObject(roi, 10)
-                vis_params = {'min': -18.54, 'max': 1.335, 'gamma': 1.26}
-                try:
-                    Map.add_basemap("Esri.WorldImagery")
-                except Exception:
-                    try:
-                        Map.add_basemap("HYBRID")
-                    except Exception:
-                        pass
-                
-                Map.addLayer(results['before_filtered'], vis_params, 'Before (Filtered)', True)
-                Map.addLayer(results['after_filtered'], vis_params, 'After (Filtered)', True)
-                
-                flood_layer = results['flood_mask'].updateMask(results['flood_mask'])
-                # Keep flood overlay slightly transparent so basemap and SAR imagery remain visible.
-                Map.addLayer(flood_layer, {'palette': ['red'], 'opacity': 0.6}, 'Flooded Areas', True)
-                Map.addLayer(roi, {'color': 'red'}, 'ROI', True)
-                try:
-                    import folium
-                    # Support both folium-backed geemap variants when adding layer controls.
-                    if hasattr(Map, "folium_map"):
-                        Map.folium_map.add_child(folium.LayerControl())
-                    elif hasattr(Map, "add_child"):
-                        Map.add_child(folium.LayerControl())
-                except Exception:
-                    pass
-                
-                with map_placeholder:
-                    try:
-                        Map.to_streamlit(height=_MAP_HEIGHT, width=_MAP_WIDTH)
-                    except (RuntimeError, ConnectionError, TimeoutError) as e:
-                        st.error(
-                            f"Map rendering failed ({type(e).__name__}). "
-                            "Please refresh the page and rerun the analysis. "
-                            "If the issue persists, verify Earth Engine authentication and network connectivity."
-                        )
-                
-                with export_placeholder.container():
-                    st.info("Click the buttons below to start export tasks")
-                    export_folder = st.text_input("Google Drive Folder", value="Flood_Exports")
-                    
-                    col1, col2, col3 = st.columns(3)
-                    
-                    with col1:
-                        if st.button("Export Flood Mask (Raster)"):
-                            export_to_drive(results['flood_mask'].toByte(), 'Flood_Mask_Raster', export_folder, roi)
-                            st.success("Export task started! Check Tasks tab in GEE Code Editor.")
-                    
-                    with col2:
-                        if st.button("Export Before Image"):
-                            export_to_drive(results['before_filtered'].visualize(vis_params), 'Before_Image_Visualized', export_folder, roi)
-                            st.success("Export task started!")
-                    
-                    with col3:
-                        if st.button("Export After Image"):
-                            export_to_drive(results['after_filtered'].visualize(vis_params), 'After_Image_Visualized', export_folder, roi)
-                            st.success("Export task started!")
-                    
-                    if st.button("Export Flood Polygons (Shapefile)"):
-                        flood_vectors = results['flood_mask'].reduceToVectors(
-                            geometry=roi, scale=10, geometryType='polygon',
-                            eightConnected=False, labelProperty='zone',
-                            reducer=ee.Reducer.countEvery()
-                        )
-                        export_vector_to_drive(flood_vectors, 'Flood_Mask_Vectors', export_folder)
-                        st.success("Vector export task started!")
+    handle = st.session_state.get('flood_result')
+    if run_analysis and not roi:
+        st.warning("Please select a Region of Interest first!")
+    elif run_analysis or (handle is not None and handle['mode'] == analysis_mode):
+        # Widget changes and button clicks rerun the script; redraw from the stored handle instead of recomputing.
+        fresh = bool(run_analysis)
+        metrics = begin_run(analysis_mode.lower().replace(' ', '_') if fresh else 'rerun')
+        try:
+            if fresh:
+                dates = [d.strftime('%Y-%m-%d') for d in (before_start, before_end, after_start, after_end)]
                 
-                st.success("Analysis complete!")
+                def show_preview(preview):
+                    stats_placeholder.info(
+                        f"Preview at {preview['scale']} m ({preview['seconds']:.1f} s): "
+                        f"{preview['flood_area'] / 1e6:.2f} km² flooded of {preview['roi_area'] / 1e6:.2f} km², "
+                        f"threshold {preview['threshold']:.2f}. Refining near-water tiles..."
+                    )
                 
-            except Exception as e:
-                st.error(f"Error during analysis: {str(e)}")
-                st.exception(e)
-    
-    elif run_analysis and not roi:
-        st.warning("Please select a Region of Interest first!")
+                with st.spinner(SPINNER_TEXT[analysis_mode]):
+                    handle = analyze(
+                        analysis_mode, roi, roi_geojson, dates, tiled, directional_lee, orbit_pass, plan_scenes,
+                        threshold_mode, progressive, show_preview
+                    )
+                st.session_state['flood_result'] = handle
+                st.session_state['rerun_seconds'] = []
+            view = {'map': map_placeholder, 'map_column': col1, 'stats': stats_placeholder, 'exports': export_placeholder}
+            if handle['mode'] == "Time series":
+                render_time_series(handle, map_layers, view)
+            elif handle['mode'] == "Per feature":
+                render_per_feature(handle, map_layers, view)
+            else:
+                render_single_event(handle, map_layers, view)
+            if fresh:
+                st.success("Time series complete!" if analysis_mode == "Time series" else "Analysis complete!")
+        
+        except Exception as e:
+            label = "time series analysis" if analysis_mode == "Time series" else "analysis"
+            st.error(f"Error during {label}: {str(e)}")
+            st.exception(e)
+        finally:
+            end_run(metrics)
+            reruns = st.session_state.setdefault('rerun_seconds', [])
+            if not fresh:
+                reruns.append(metrics.seconds)
+                del reruns[:-RERUN_HISTORY]
+            render_performance(metrics, reruns)
     
     with st.expander("How to Use This App"):
         st.markdown("""
@@ -512,9 +732,9 @@ def main():
         5. **Export Data**: Click export buttons to save to Google Drive
         
         ### Technical Details:
-        - **Sensor**: Sentinel-1 SAR (VV polarization)
-        - **Speckle Filter**: Refined Lee (3x3 kernel)
-        - **Threshold**: Otsu's automatic thresholding
+        - **Sensor**: Sentinel-1 SAR (VV polarization), one relative orbit per analysis by default
+        - **Speckle Filter**: Lee (3x3 kernel), or directional Refined Lee (7x7) when selected
+        - **Threshold**: Otsu's automatic thresholding, over the whole ROI or only its bimodal 5 km cells
         - **Slope Filter**: Removes areas with slope > 5°
         - **Export Format**: GeoTIFF (raster), Shapefile (vector)
         """)
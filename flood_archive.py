@@ -0,0 +1,354 @@
+"""Local archive of per-event flood polygons for historical queries.
+
+Polygons are stored as GeoParquet 1.1, one file per event under a Hive-style date partition
+(``date=2024-10-05/event=<id>.parquet``), in EPSG:4326 with a ``bbox`` covering column and the
+polygon area precomputed in an equal-area projection. Loading a date range reads only the matching
+partitions and builds an STRtree over the stored bounding boxes; WKB geometries are parsed only for
+polygons a query's boxes hit, so bbox/polygon intersection, per-event area and flood-frequency
+queries touch a few candidates rather than the whole archive.
+"""
+import argparse
+import datetime
+import functools
+import json
+import os
+import re
+import sys
+
+import numpy as np
+import shapely
+from pyproj import CRS, Transformer
+from shapely.geometry import mapping, shape
+
+from result_cache import CACHE_DIR
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pq = None
+
+ARCHIVE_DIR = os.path.join(CACHE_DIR, 'archive')
+# World Cylindrical Equal Area, for polygon areas in m^2.
+AREA_CRS = 'EPSG:6933'
+GEOPARQUET_VERSION = '1.1.0'
+_EVENT_ID = re.compile(r'[\w.-]+')
+_POLYGONAL = (3, 6)  # shapely type ids of Polygon and MultiPolygon
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The flood archive needs pyarrow: pip install pyarrow")
+
+
+def _iso_date(date):
+    return datetime.date.fromisoformat(str(date)[:10]).isoformat()
+
+
+@functools.lru_cache(maxsize=None)
+def _transformer(src, dst):
+    return Transformer.from_crs(src, dst, always_xy=True)
+
+
+def _reproject(geoms, src, dst):
+    transformer = _transformer(src, dst)
+    return shapely.transform(geoms, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+
+def _as_geometry(geometry):
+    """Shapely geometry from a shapely geometry, GeoJSON dict or (west, south, east, north) tuple."""
+    if isinstance(geometry, shapely.Geometry):
+        return geometry
+    if isinstance(geometry, dict):
+        if geometry.get('type') == 'FeatureCollection':
+            return shapely.union_all([shape(f['geometry']) for f in geometry['features'] if f.get('geometry')])
+        return shape(geometry.get('geometry', geometry))
+    return shapely.box(*geometry)
+
+
+def _geo_metadata(bounds):
+    """GeoParquet 'geo' metadata; without a 'crs' member the coordinates are OGC:CRS84 (lon/lat)."""
+    bbox = [float(bounds[:, 0].min()), float(bounds[:, 1].min()),
+            float(bounds[:, 2].max()), float(bounds[:, 3].max())] if len(bounds) else []
+    return {
+        'version': GEOPARQUET_VERSION,
+        'primary_column': 'geometry',
+        'columns': {'geometry': {
+            'encoding': 'WKB', 'geometry_types': ['Polygon', 'MultiPolygon'], 'bbox': bbox,
+            'covering': {'bbox': {k: ['bbox', k] for k in ('xmin', 'ymin', 'xmax', 'ymax')}},
+        }},
+    }
+
+
+class ArchiveIndex:
+    """In-memory columns of the loaded polygons and an STRtree over their bounding boxes.
+
+    Rows are polygons; ``event_ids``, ``dates`` (datetime64[D]), ``areas`` (m^2) and ``bounds``
+    are parallel arrays. Query geometries may be shapely geometries, GeoJSON or bbox tuples in
+    EPSG:4326.
+    """
+
+    def __init__(self, event_ids, dates, areas, bounds, wkb):
+        self.event_ids = np.asarray(event_ids, dtype=object)
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.areas = np.asarray(areas, dtype=np.float64)
+        self.bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        self.events, self._event_code = np.unique(self.event_ids.astype(str), return_inverse=True)
+        self._wkb = np.asarray(wkb, dtype=object)
+        self._geoms = np.full(len(self._wkb), None, dtype=object)
+        self.tree = shapely.STRtree(shapely.box(*self.bounds.T))
+
+    def __len__(self):
+        return len(self._wkb)
+
+    def geometries(self, indices):
+        """Geometries of the given rows, parsing (and keeping) those not yet parsed."""
+        indices = np.asarray(indices, dtype=np.intp)
+        missing = indices[shapely.is_missing(self._geoms[indices])]
+        if len(missing):
+            self._geoms[missing] = shapely.from_wkb(self._wkb[missing])
+        return self._geoms[indices]
+
+    def _in_dates(self, indices, start, end):
+        if start is not None:
+            indices = indices[self.dates[indices] >= np.datetime64(_iso_date(start))]
+        if end is not None:
+            indices = indices[self.dates[indices] <= np.datetime64(_iso_date(end))]
+        return indices
+
+    def query(self, geometry, start=None, end=None, exact=True):
+        """Sorted rows whose polygon intersects ``geometry`` (only its bbox if ``exact`` is False)."""
+        geometry = _as_geometry(geometry)
+        indices = self._in_dates(np.sort(self.tree.query(geometry)), start, end)
+        if exact and len(indices):
+            shapely.prepare(geometry)
+            indices = indices[shapely.intersects(geometry, self.geometries(indices))]
+        return indices
+
+    def features(self, indices):
+        """GeoJSON features (event_id, date, area_m2) of the given rows."""
+        return [{
+            'type': 'Feature', 'geometry': mapping(geom),
+            'properties': {'event_id': str(self.event_ids[i]), 'date': str(self.dates[i]),
+                           'area_m2': float(self.areas[i])},
+        } for i, geom in zip(indices, self.geometries(indices))]
+
+    def event_areas(self, region=None, start=None, end=None):
+        """{event_id: {date, polygons, area_m2}} of flooded area, clipped to ``region`` if given.
+
+        Polygons inside the region count with their stored area; only those crossing its boundary
+        are intersected with it.
+        """
+        if region is None:
+            indices = self._in_dates(np.arange(len(self)), start, end)
+            areas = self.areas[indices]
+        else:
+            region = _as_geometry(region)
+            indices = self.query(region, start, end)
+            areas = self.areas[indices].copy()
+            geoms = self.geometries(indices)
+            shapely.prepare(region)
+            crossing = ~shapely.contains(region, geoms)
+            if crossing.any():
+                clipped = shapely.intersection(geoms[crossing], region)
+                areas[crossing] = shapely.area(_reproject(clipped, 'EPSG:4326', AREA_CRS))
+        codes = self._event_code[indices]
+        totals = np.bincount(codes, weights=areas, minlength=len(self.events))
+        counts = np.bincount(codes, minlength=len(self.events))
+        present, first = np.unique(codes, return_index=True)
+        return {
+            str(self.events[code]): {'date': str(date), 'polygons': int(counts[code]), 'area_m2': float(totals[code])}
+            for code, date in zip(present, self.dates[indices[first]])
+        }
+
+    def flood_frequency(self, parcels, start=None, end=None):
+        """Number of distinct events with a polygon intersecting each parcel, as an int array."""
+        parcels = np.asarray([_as_geometry(p) for p in parcels], dtype=object)
+        parcel_idx, rows = self.tree.query(parcels)
+        keep = np.isin(rows, self._in_dates(np.unique(rows), start, end))
+        parcel_idx, rows = parcel_idx[keep], rows[keep]
+        if len(rows):
+            hit = shapely.intersects(parcels[parcel_idx], self.geometries(rows))
+            parcel_idx, rows = parcel_idx[hit], rows[hit]
+        pairs = np.unique(parcel_idx.astype(np.int64) * len(self.events) + self._event_code[rows])
+        return np.bincount(pairs // max(len(self.events), 1), minlength=len(parcels))
+
+
+class FloodArchive:
+    """Directory of per-event GeoParquet files partitioned by event date.
+
+    An event id is unique across the archive: ingesting it again replaces its polygons, also when the
+    date changes. ``index(start, end)`` keeps the last index built for each date range and rebuilds it
+    only when a partition in the range changed.
+    """
+
+    def __init__(self, root=ARCHIVE_DIR):
+        _require_pyarrow()
+        self.root = root
+        self._indexes = {}
+
+    def _event_files(self, start=None, end=None):
+        """Sorted (date, event_id, path) of the stored events, reading only partitions in the range."""
+        start = _iso_date(start) if start is not None else None
+        end = _iso_date(end) if end is not None else None
+        files = []
+        if not os.path.isdir(self.root):
+            return files
+        for partition in os.listdir(self.root):
+            if not partition.startswith('date='):
+                continue
+            date = partition[len('date='):]
+            if (start is not None and date < start) or (end is not None and date > end):
+                continue
+            for name in os.listdir(os.path.join(self.root, partition)):
+                if name.startswith('event=') and name.endswith('.parquet'):
+                    files.append((date, name[len('event='):-len('.parquet')], os.path.join(self.root, partition, name)))
+        return sorted(files)
+
+    def ingest(self, event_id, date, geometries, crs='EPSG:4326'):
+        """Store one event's flood polygons; returns dict(event_id, date, polygons, area_m2, path).
+
+        Non-polygonal and empty geometries are dropped; others are reprojected to EPSG:4326.
+        """
+        if not _EVENT_ID.fullmatch(str(event_id)):
+            raise ValueError(f"Event id {event_id!r} may only contain letters, digits, '_', '.' and '-'")
+        date = _iso_date(date)
+        geoms = np.asarray(list(geometries), dtype=object)
+        if len(geoms):
+            geoms = geoms[np.isin(shapely.get_type_id(geoms), _POLYGONAL) & ~shapely.is_empty(geoms)]
+        if len(geoms) and not CRS.from_user_input(crs).equals(CRS.from_epsg(4326), ignore_axis_order=True):
+            geoms = _reproject(geoms, crs, 'EPSG:4326')
+        areas = shapely.area(_reproject(geoms, 'EPSG:4326', AREA_CRS)) if len(geoms) else np.zeros(0)
+        bounds = shapely.bounds(geoms).reshape(-1, 4)
+        table = pa.table({
+            'event_id': pa.array([str(event_id)] * len(geoms), pa.string()),
+            'date': pa.array(np.full(len(geoms), np.datetime64(date, 'D'))),
+            'area_m2': pa.array(areas, pa.float64()),
+            'bbox': pa.StructArray.from_arrays(
+                [pa.array(bounds[:, k], pa.float64()) for k in range(4)], ['xmin', 'ymin', 'xmax', 'ymax']
+            ),
+            'geometry': pa.array(shapely.to_wkb(geoms) if len(geoms) else [], pa.binary()),
+        })
+        table = table.replace_schema_metadata({'geo': json.dumps(_geo_metadata(bounds))})
+
+        partition = os.path.join(self.root, f"date={date}")
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, f"event={event_id}.parquet")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        pq.write_table(table, tmp, compression='zstd')
+        os.replace(tmp, path)
+        for _, other_id, other in self._event_files():
+            if other_id == str(event_id) and other != path:
+                os.remove(other)
+        return {'event_id': str(event_id), 'date': date, 'polygons': len(geoms),
+                'area_m2': float(areas.sum()), 'path': path}
+
+    def ingest_features(self, event_id, date, features, crs='EPSG:4326'):
+        """Store GeoJSON features, e.g. packed_mask.polygonize output (pass the mask's CRS)."""
+        return self.ingest(event_id, date, (shape(f['geometry']) for f in features if f.get('geometry')), crs)
+
+    def ingest_file(self, path, event_id, date):
+        """Store the polygons of a Shapefile/GeoJSON, such as a downloaded reduceToVectors export.
+
+        Exports labelled with ``zone`` keep only the flooded (zone 1) polygons.
+        """
+        import roi_ingest
+
+        geoms = []
+        for batch, properties in roi_ingest.iter_batches(path):
+            zones = [p.get('zone', 1) for p in properties]
+            geoms.extend(g for g, zone in zip(batch, zones) if g is not None and zone == 1)
+        return self.ingest(event_id, date, geoms)
+
+    def events(self, start=None, end=None):
+        """Stored events as (date, event_id) pairs in date order."""
+        return [(date, event_id) for date, event_id, _ in self._event_files(start, end)]
+
+    def load(self, start=None, end=None):
+        """ArchiveIndex over the events dated within [start, end] (ISO dates, inclusive)."""
+        columns = ['event_id', 'date', 'area_m2', 'bbox', 'geometry']
+        tables = [pq.read_table(path, columns=columns) for _, _, path in self._event_files(start, end)]
+        if not tables:
+            return ArchiveIndex([], [], [], np.zeros((0, 4)), [])
+        table = pa.concat_tables(tables)
+        bbox = table.column('bbox').combine_chunks()
+        bounds = np.column_stack([bbox.field(k).to_numpy(zero_copy_only=False)
+                                  for k in ('xmin', 'ymin', 'xmax', 'ymax')])
+        return ArchiveIndex(
+            table.column('event_id').to_numpy(zero_copy_only=False),
+            table.column('date').to_numpy(zero_copy_only=False),
+            table.column('area_m2').to_numpy(zero_copy_only=False),
+            bounds,
+            table.column('geometry').to_numpy(zero_copy_only=False),
+        )
+
+    def index(self, start=None, end=None):
+        """load(start, end), reused until an event in the range is added, replaced or removed."""
+        files = self._event_files(start, end)
+        signature = tuple((path, os.stat(path).st_mtime_ns) for _, _, path in files)
+        key = (start, end)
+        cached = self._indexes.get(key)
+        if cached is None or cached[0] != signature:
+            cached = self._indexes[key] = (signature, self.load(start, end))
+        return cached[1]
+
+
+def _read_geojson(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest and query the local flood-polygon archive.")
+    parser.add_argument('--root', default=ARCHIVE_DIR, help="archive directory (default: %(default)s)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest = commands.add_parser('ingest', help="store an event's flood polygons (Shapefile, zip or GeoJSON)")
+    ingest.add_argument('event_id')
+    ingest.add_argument('date', help="event date, YYYY-MM-DD")
+    ingest.add_argument('path')
+    for name, help_text in (('events', "list stored events"),
+                            ('areas', "flooded area per event, optionally within --roi"),
+                            ('query', "flood polygons intersecting --roi or --bbox, as GeoJSON"),
+                            ('frequency', "number of flood events touching each parcel")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--start', help="first event date, YYYY-MM-DD")
+        command.add_argument('--end', help="last event date, YYYY-MM-DD")
+        if name in ('areas', 'query'):
+            command.add_argument('--roi', help="GeoJSON file of the query region")
+        if name == 'query':
+            command.add_argument('--bbox', type=float, nargs=4, metavar=('W', 'S', 'E', 'N'))
+        if name == 'frequency':
+            command.add_argument('parcels', help="GeoJSON FeatureCollection of parcels")
+    args = parser.parse_args(argv)
+
+    archive = FloodArchive(args.root)
+    if args.command == 'ingest':
+        print(json.dumps(archive.ingest_file(args.path, args.event_id, args.date)))
+        return 0
+    if args.command == 'events':
+        for date, event_id in archive.events(args.start, args.end):
+            print(date, event_id)
+        return 0
+
+    index = archive.index(args.start, args.end)
+    if args.command == 'areas':
+        region = _read_geojson(args.roi) if args.roi else None
+        print(json.dumps(index.event_areas(region), indent=1))
+    elif args.command == 'query':
+        if not (args.roi or args.bbox):
+            parser.error("query needs --roi or --bbox")
+        region = _read_geojson(args.roi) if args.roi else args.bbox
+        json.dump({'type': 'FeatureCollection', 'features': index.features(index.query(region))}, sys.stdout)
+        print()
+    else:
+        parcels = _read_geojson(args.parcels)
+        counts = index.flood_frequency([f['geometry'] for f in parcels['features']])
+        for feature, count in zip(parcels['features'], counts):
+            feature.setdefault('properties', {})['flood_events'] = int(count)
+        json.dump(parcels, sys.stdout)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
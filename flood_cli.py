@@ -0,0 +1,200 @@
+"""Headless batch runner: python flood_cli.py manifest.json -o results.jsonl
+
+The manifest is a JSON list of jobs (or {"jobs": [...]}) or a CSV with one job per row. Each job
+needs ``roi`` (a GeoJSON file path or inline GeoJSON) and ``before_start``, ``before_end``,
+``after_start``, ``after_end``; ``id``, ``tiled``, ``directional_lee``, ``orbit_pass`` (ASCENDING,
+DESCENDING or BOTH), ``plan_scenes``, ``threshold_mode`` (global, adaptive or multi), ``progressive``
+(coarse pass, then full scale near water only) and ``per_feature`` (flood area for each feature of
+the ROI file) are optional. Results are written as JSON lines in completion order.
+
+Jobs with ``backend`` set to ``local`` (or every job, with ``--backend local``) run
+local_engine.run_flood_analysis_local on Sentinel-1 VV GeoTIFFs already on disk instead of Earth
+Engine: they need ``roi``, ``before_paths`` and ``after_paths`` (lists, or ``;``-separated in a CSV,
+relative to the manifest) and take an optional ``dem_path`` and ``threshold_mode`` (global or multi);
+dates are not used.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DATE_FIELDS = ('before_start', 'before_end', 'after_start', 'after_end')
+PATH_FIELDS = ('before_paths', 'after_paths')
+BACKENDS = ('earthengine', 'local')
+
+
+def load_manifest(path, backend='earthengine'):
+    with open(path, newline='') as f:
+        if path.lower().endswith('.csv'):
+            jobs = list(csv.DictReader(f))
+        else:
+            jobs = json.load(f)
+            if isinstance(jobs, dict):
+                jobs = jobs.get('jobs', [])
+    for i, job in enumerate(jobs):
+        job.setdefault('id', str(i))
+        job['backend'] = job.get('backend') or backend
+        if job['backend'] not in BACKENDS:
+            raise ValueError(f"Job {job['id']} has unknown backend {job['backend']!r}")
+        required = PATH_FIELDS if job['backend'] == 'local' else DATE_FIELDS
+        missing = [k for k in ('roi',) + required if not job.get(k)]
+        if missing:
+            raise ValueError(f"Job {job['id']} is missing {', '.join(missing)}")
+    return jobs
+
+
+def _load_roi(roi, base_dir):
+    if isinstance(roi, dict):
+        return roi
+    if roi.lstrip().startswith('{'):
+        return json.loads(roi)
+    with open(os.path.join(base_dir, roi)) as f:
+        return json.load(f)
+
+
+def _paths(value, base_dir):
+    if isinstance(value, str):
+        value = [p.strip() for p in value.split(';') if p.strip()]
+    return [os.path.join(base_dir, p) for p in value]
+
+
+def _as_bool(value, default=False):
+    # CSV manifests give '' for an empty cell; that and a missing key mean the default.
+    if value is None or str(value).strip() == '':
+        return default
+    return str(value).strip().lower() in {'1', 'true', 'yes'}
+
+
+def run_local_job(job, base_dir):
+    import local_engine
+    from instrumentation import stage, track_run
+
+    start = time.perf_counter()
+    dem_path = os.path.join(base_dir, job['dem_path']) if job.get('dem_path') else None
+    static_store = None
+    if dem_path:
+        import flood_core
+        static_store = flood_core.get_static_store()
+    with track_run('cli_local_job'), stage('local_analysis'):
+        results = local_engine.run_flood_analysis_local(
+            _load_roi(job['roi'], base_dir), _paths(job['before_paths'], base_dir),
+            _paths(job['after_paths'], base_dir), dem_path=dem_path, static_store=static_store,
+            threshold_mode=job.get('threshold_mode') or 'global'
+        )
+    return {
+        'id': job['id'],
+        'status': 'ok',
+        'backend': 'local',
+        'threshold': results['threshold'],
+        'flood_area_km2': results['flood_area'] / 1e6,
+        'roi_area_km2': results['roi_area'] / 1e6,
+        'shallow_threshold': results.get('shallow_threshold'),
+        'shallow_area_km2': results['shallow_area'] / 1e6 if 'shallow_area' in results else None,
+        'elapsed_s': round(time.perf_counter() - start, 3),
+    }
+
+
+def run_job(job, base_dir):
+    if job.get('backend') == 'local':
+        return run_local_job(job, base_dir)
+
+    import flood_core
+    from instrumentation import track_run
+
+    start = time.perf_counter()
+    roi_geojson = _load_roi(job['roi'], base_dir)
+    roi = flood_core.geojson_to_ee_geometry(roi_geojson)
+    dates = [job[k] for k in DATE_FIELDS]
+    orbit_pass = job.get('orbit_pass') or flood_core.ORBIT_PASS
+    plan_scenes = _as_bool(job.get('plan_scenes'), default=True)
+    directional_lee = _as_bool(job.get('directional_lee', False))
+    features = None
+    with track_run('cli_job') as metrics:
+        if _as_bool(job.get('per_feature', False)):
+            stats, _, features = flood_core.run_multi_roi_analysis(
+                roi_geojson, dates, orbit_pass=orbit_pass, plan_scenes=plan_scenes,
+                directional_lee=directional_lee
+            )
+            flood_area = sum(stats['flood_area'])
+        else:
+            stats, _ = flood_core.run_cached_analysis(
+                roi, roi_geojson, dates, tiled=_as_bool(job.get('tiled', False)),
+                directional_lee=directional_lee, orbit_pass=orbit_pass, plan_scenes=plan_scenes,
+                threshold_mode=job.get('threshold_mode') or 'global',
+                progressive=_as_bool(job.get('progressive', False))
+            )
+            flood_area = stats['flood_area'] or 0
+    totals = metrics.totals()
+    return {
+        'id': job['id'],
+        'status': 'ok',
+        'threshold': stats['threshold'],
+        'flood_area_km2': flood_area / 1e6,
+        'roi_area_km2': stats['roi_area'] / 1e6,
+        'scenes': stats.get('scenes'),
+        'threshold_cells': {k: v for k, v in stats['adaptive'].items() if k != 'cells'} if 'adaptive' in stats else None,
+        'features': [f['properties'] for f in features] if features is not None else None,
+        'progressive': stats.get('progressive'),
+        'shallow_area_km2': (stats['shallow_area'] or 0) / 1e6 if 'shallow_area' in stats else None,
+        'elapsed_s': round(time.perf_counter() - start, 3),
+        'ee_calls': totals['ee_calls'],
+        'ee_request_bytes': totals['request_bytes'],
+        'ee_response_bytes': totals['response_bytes'],
+    }
+
+
+def run_manifest(jobs, output, base_dir='.', workers=4):
+    """Run jobs on a bounded thread pool and append one JSON line per job to output; returns failures."""
+    lock = threading.Lock()
+    failures = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, job, base_dir): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                failures += 1
+                record = {'id': job['id'], 'status': 'error', 'error': str(e)}
+            with lock:
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run flood analyses from a JSON/CSV manifest without Streamlit.")
+    parser.add_argument('manifest', help="JSON or CSV manifest of jobs")
+    parser.add_argument('-o', '--output', default='-', help="JSON lines output file (default: stdout)")
+    parser.add_argument('-j', '--workers', type=int, default=4, help="concurrent jobs (default: 4)")
+    parser.add_argument('--backend', choices=BACKENDS, default='earthengine',
+                        help="backend for jobs that do not set one (default: earthengine)")
+    parser.add_argument('--project', help="Google Cloud project for Earth Engine")
+    parser.add_argument('--key-file', help="service account JSON key file")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log per-stage timings as JSON lines")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    jobs = load_manifest(args.manifest, args.backend)
+
+    if any(job['backend'] == 'earthengine' for job in jobs):
+        import flood_core
+        flood_core.initialize(project=args.project, key_file=args.key_file)
+
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+    if args.output == '-':
+        failures = run_manifest(jobs, sys.stdout, base_dir, args.workers)
+    else:
+        with open(args.output, 'a') as output:
+            failures = run_manifest(jobs, output, base_dir, args.workers)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,842 @@
+"""Earth Engine flood analysis pipeline, importable without Streamlit or the mapping stack."""
+import collections
+import datetime
+import functools
+import io
+import logging
+import time
+
+import ee
+
+from ee_client import call, evaluate, get_info, start_task
+from instrumentation import record_server_profile, stage
+from result_cache import ResultCache, analysis_key
+from static_layers import StaticLayerStore
+
+logger = logging.getLogger(__name__)
+
+EE_SCOPES = ['https://www.googleapis.com/auth/earthengine']
+S1_COLLECTION = 'COPERNICUS/S1_GRD'
+ORBIT_PASS = 'ASCENDING'
+ORBIT_PASSES = ('ASCENDING', 'DESCENDING', 'BOTH')
+POLARISATION = 'VV'
+LEE_RADIUS = 1
+FEATURE_BATCH = 250
+FeatureBatch = collections.namedtuple('FeatureBatch', ['index', 'features'])
+COARSE_SCALE = 150
+PROGRESSIVE_TILE_M = 5000
+# Coarse pixels within this many dB of the threshold may hold water the coarse pass cannot resolve.
+REFINE_MARGIN_DB = 1.5
+# Split points multi_otsu_threshold scores pairwise; finer histograms are split every k-th bucket.
+MULTI_OTSU_SPLITS = 256
+ANALYSIS_PARAMS = {'scale': 30, 'buckets': 255, 'min_bucket_width': 0.1, 'slope_limit': 5, 'focal_iterations': 5,
+                   'lee_radius': LEE_RADIUS}
+
+def initialize(project=None, key_file=None):
+    """Initialize Earth Engine outside Streamlit, from a service-account key file or local credentials."""
+    if key_file:
+        from google.oauth2 import service_account
+        
+        creds = service_account.Credentials.from_service_account_file(key_file, scopes=EE_SCOPES)
+        ee.Initialize(credentials=creds, project=project)
+    elif project:
+        ee.Initialize(project=project)
+    else:
+        ee.Initialize()
+
+def geojson_to_ee_geometry(geojson_data):
+    """Convert GeoJSON dict to ee.Geometry, supporting Geometry/Feature/FeatureCollection."""
+    gtype = geojson_data.get('type') if isinstance(geojson_data, dict) else None
+
+    if gtype == 'FeatureCollection':
+        features = geojson_data.get('features', [])
+        if not features:
+            raise ValueError("GeoJSON FeatureCollection contains no features")
+        geoms = [
+            ee.Feature(f).geometry()
+            for f in features
+            if isinstance(f, dict) and f.get('geometry')
+        ]
+        if not geoms:
+            raise ValueError("GeoJSON FeatureCollection has no valid geometries")
+        return ee.FeatureCollection([ee.Feature(g) for g in geoms]).geometry()
+
+    if gtype == 'Feature':
+        return ee.Feature(geojson_data).geometry()
+
+    if gtype in {'Point', 'MultiPoint', 'LineString', 'MultiLineString', 'Polygon', 'MultiPolygon', 'GeometryCollection'}:
+        return ee.Geometry(geojson_data)
+
+    raise ValueError(f"Unsupported GeoJSON type: {gtype}")
+
+def _local_moments(img, kernel):
+    """Neighbourhood mean and variance from a single combined-reducer pass."""
+    reducer = ee.Reducer.mean().combine(reducer2=ee.Reducer.variance(), sharedInputs=True)
+    moments = img.reduceNeighborhood(reducer=reducer, kernel=kernel)
+    return moments.select('.*_mean'), moments.select('.*_variance')
+
+def refined_lee_filter(image, radius=LEE_RADIUS, directional=False):
+    """Lee speckle filter over a (2*radius+1)^2 window, or the 7x7 directional Refined Lee.
+    
+    ``directional`` ignores ``radius`` and runs Lee's edge-aligned variant in linear power units.
+    """
+    if directional:
+        return directional_lee_filter(image)
+    bandNames = image.bandNames()
+    img = ee.Image(image).toFloat()
+    kernel = ee.Kernel.square(radius, 'pixels', False)
+    mean, variance = _local_moments(img, kernel)
+    variance_mean_sq = variance.divide(mean.multiply(mean))
+    sigma_v = ee.Image(0.05)
+    b = variance_mean_sq.subtract(sigma_v).divide(variance_mean_sq.multiply(ee.Image(1).add(sigma_v)))
+    b = b.min(1).max(0)
+    return mean.add(b.multiply(img.subtract(mean))).rename(bandNames)
+
+def directional_lee_filter(image):
+    """Refined Lee (Lee 1981): pick the 7x7 half-window aligned with the strongest edge and filter
+    with its statistics. Works on one band in dB, converting to power and back."""
+    bandNames = image.bandNames()
+    img = ee.Image(10).pow(ee.Image(image).toFloat().divide(10))
+    
+    # 3x3 means/variances sampled on the nine 3x3 cells of the 7x7 window.
+    mean3, variance3 = _local_moments(img, ee.Kernel.square(1, 'pixels', False))
+    sample = [[0] * 7, [0, 1, 0, 1, 0, 1, 0]] * 3 + [[0] * 7]
+    sample_kernel = ee.Kernel.fixed(7, 7, sample, 3, 3, False)
+    sample_mean = mean3.neighborhoodToBands(sample_kernel)
+    sample_var = variance3.neighborhoodToBands(sample_kernel)
+    
+    def cell(i):
+        return sample_mean.select(i)
+    
+    # Edge gradients along the four axes through the centre cell; the largest picks the direction.
+    pairs = [(1, 7), (6, 2), (3, 5), (0, 8)]
+    gradients = ee.Image.cat(*[cell(a).subtract(cell(b)).abs() for a, b in pairs])
+    gradmask = gradients.eq(gradients.reduce(ee.Reducer.max()))
+    gradmask = gradmask.addBands(gradmask)
+    
+    # Directions 1-4 face the side whose mean departs from the centre; 5-8 are their opposites.
+    sides = [cell(a).subtract(cell(4)).gt(cell(4).subtract(cell(b))) for a, b in pairs]
+    directions = ee.Image.cat(*(
+        [side.multiply(i + 1) for i, side in enumerate(sides)]
+        + [side.Not().multiply(i + 5) for i, side in enumerate(sides)]
+    ))
+    directions = directions.updateMask(gradmask).reduce(ee.Reducer.sum())
+    
+    # Noise variance from the five most homogeneous 3x3 cells.
+    sample_stats = sample_var.divide(sample_mean.multiply(sample_mean))
+    sigma_v = sample_stats.toArray().arraySort().arraySlice(0, 0, 5).arrayReduce(ee.Reducer.mean(), [0])
+    
+    rect = [[0] * 7] * 3 + [[1] * 7] * 4
+    diag = [[1] * (i + 1) + [0] * (6 - i) for i in range(7)]
+    rect_kernel = ee.Kernel.fixed(7, 7, rect, 3, 3, False)
+    diag_kernel = ee.Kernel.fixed(7, 7, diag, 3, 3, False)
+    dir_means, dir_vars = [], []
+    for i in range(4):
+        for offset, kernel in ((1, rect_kernel), (2, diag_kernel)):
+            mean, variance = _local_moments(img, kernel.rotate(i) if i else kernel)
+            selected = directions.eq(2 * i + offset)
+            dir_means.append(mean.updateMask(selected))
+            dir_vars.append(variance.updateMask(selected))
+    dir_mean = ee.Image.cat(*dir_means).reduce(ee.Reducer.sum())
+    dir_var = ee.Image.cat(*dir_vars).reduce(ee.Reducer.sum())
+    
+    var_x = dir_var.subtract(dir_mean.multiply(dir_mean).multiply(sigma_v)).divide(sigma_v.add(1.0))
+    b = var_x.divide(dir_var)
+    result = dir_mean.add(b.multiply(img.subtract(dir_mean)))
+    result = result.arrayProject([0]).arrayFlatten([['sum']])
+    return result.log10().multiply(10).toFloat().rename(bandNames)
+
+def otsu_threshold(histogram):
+    counts = ee.Array(ee.Dictionary(histogram).get('histogram'))
+    means = ee.Array(ee.Dictionary(histogram).get('bucketMeans'))
+    total = counts.reduce(ee.Reducer.sum(), [0]).get([0])
+    sum_val = means.multiply(counts).reduce(ee.Reducer.sum(), [0]).get([0])
+    mean = sum_val.divide(total)
+    
+    # Cumulative sums give the class sizes and sums for every split in one pass.
+    aCount = counts.accum(0)
+    aSum = means.multiply(counts).accum(0)
+    aMean = aSum.divide(aCount)
+    bCount = aCount.multiply(-1).add(total)
+    bMean = aSum.multiply(-1).add(sum_val).divide(bCount)
+    bss = aCount.multiply(aMean.subtract(mean).pow(2)).add(bCount.multiply(bMean.subtract(mean).pow(2)))
+    return means.sort(bss).get([-1])
+
+def multi_otsu_threshold(histogram, max_splits=MULTI_OTSU_SPLITS):
+    """Two Otsu thresholds splitting the histogram into open water, shallow/mixed water and land.
+    
+    Every pair of split points is scored at once on a splits x splits array, so a histogram with more
+    than ``max_splits`` buckets is only split after every k-th bucket, as if k buckets were merged.
+    """
+    counts = ee.Array(ee.Dictionary(histogram).get('histogram'))
+    means = ee.Array(ee.Dictionary(histogram).get('bucketMeans'))
+    total = counts.reduce(ee.Reducer.sum(), [0]).get([0])
+    sum_val = means.multiply(counts).reduce(ee.Reducer.sum(), [0]).get([0])
+    step = means.length().get([0]).divide(max_splits).ceil()
+    
+    def at_splits(a):
+        return a.slice(0, step.subtract(1), None, step)
+    
+    # Class sizes and sums up to each candidate split.
+    p = at_splits(counts.accum(0))
+    s = at_splits(means.multiply(counts).accum(0))
+    split_means = at_splits(means)
+    size = split_means.length().get([0])
+    
+    def as_rows(a):
+        return a.reshape([-1, 1]).repeat(1, size)
+    
+    def as_cols(a):
+        return a.reshape([1, -1]).repeat(0, size)
+    
+    def term(sk, wk):
+        return sk.pow(2).divide(wk.add(wk.eq(0)))
+    
+    w0, s0 = as_rows(p), as_rows(s)
+    w1, s1 = as_cols(p).subtract(w0), as_cols(s).subtract(s0)
+    w2, s2 = as_cols(p).multiply(-1).add(total), as_cols(s).multiply(-1).add(sum_val)
+    index = ee.Array(ee.List.sequence(0, size.subtract(1)))
+    ordered = as_rows(index).lt(as_cols(index))
+    score = term(s0, w0).add(term(s1, w1)).add(term(s2, w2)).add(ordered.Not().multiply(-1e30))
+    position = ee.List(score.argmax())
+    return ee.List([split_means.get([position.get(0)]), split_means.get([position.get(1)])])
+
+def s1_collection(roi, orbit_pass=ORBIT_PASS, polarisation=POLARISATION):
+    collection = ee.ImageCollection(S1_COLLECTION) \
+        .filter(ee.Filter.eq('instrumentMode', 'IW')) \
+        .filter(ee.Filter.listContains('transmitterReceiverPolarisation', polarisation))
+    if orbit_pass != 'BOTH':
+        collection = collection.filter(ee.Filter.eq('orbitProperties_pass', orbit_pass))
+    return collection.filterBounds(roi).select(polarisation)
+
+def scene_mosaic(scene_ids, roi, polarisation=POLARISATION):
+    """Mosaic of planned scenes, loaded by asset id instead of filtering the whole collection."""
+    scenes = [ee.Image(f"{S1_COLLECTION}/{scene_id}").select(polarisation) for scene_id in scene_ids]
+    return ee.ImageCollection(scenes).mosaic().clip(roi)
+
+def _roi_histogram(before_filtered, roi, scale):
+    return before_filtered.reduceRegion(
+        reducer=ee.Reducer.histogram(255, 0.1),
+        geometry=roi, scale=scale, bestEffort=True
+    )
+
+def compute_threshold(before_filtered, roi, polarisation=POLARISATION, scale=30):
+    histogram = _roi_histogram(before_filtered, roi, scale)
+    
+    return ee.Number(ee.Algorithms.If(
+        histogram.contains(polarisation),
+        otsu_threshold(histogram.get(polarisation)), -15
+    ))
+
+def compute_multi_threshold(before_filtered, roi, polarisation=POLARISATION, scale=30):
+    """ee.List [open water, shallow water] multi-Otsu thresholds; [-15, -15] when the ROI has no pixels."""
+    histogram = _roi_histogram(before_filtered, roi, scale)
+    
+    return ee.List(ee.Algorithms.If(
+        histogram.contains(polarisation),
+        multi_otsu_threshold(histogram.get(polarisation)), [-15, -15]
+    ))
+
+def detect_flood(after_filtered, before_filtered, threshold, slope_mask=None, permanent_water=None):
+    water_mask = after_filtered.lt(threshold)
+    if slope_mask is None:
+        srtm = ee.Image("USGS/SRTMGL1_003")
+        slope = ee.Terrain.slope(srtm)
+        slope_mask = slope.lt(5)
+    water_cleaned = water_mask.updateMask(slope_mask).focalMode(1.5, 'circle', 'pixels', 5)
+    if permanent_water is None:
+        permanent_water = before_filtered.lt(threshold)
+    return water_cleaned.And(permanent_water.Not())
+
+def shallow_water(results, shallow_threshold, slope_mask=None):
+    """New water between the flood threshold and ``shallow_threshold``: flooded vegetation, mixed pixels."""
+    return detect_flood(results['after_filtered'], results['before_filtered'], shallow_threshold, slope_mask) \
+        .And(results['flood_mask'].Not())
+
+def flood_area_of(flood_only, geometry, polarisation=POLARISATION, best_effort=True, scale=30):
+    reduce_args = {'bestEffort': True} if best_effort else {'maxPixels': 1e10}
+    return flood_only.multiply(ee.Image.pixelArea()).reduceRegion(
+        reducer=ee.Reducer.sum(), geometry=geometry, scale=scale, **reduce_args
+    ).get(polarisation)
+
+def run_flood_analysis(roi, before_start, before_end, after_start, after_end,
+                       orbit_pass=ORBIT_PASS, polarisation=POLARISATION,
+                       threshold=None, area_geometry=None, best_effort=True, slope_mask=None,
+                       directional_lee=False, scenes=None, scale=30):
+    """Build the flood graph; ``scenes`` is a scene_planner plan restricting both mosaics to its scenes.
+    
+    ``scale`` is the metres per pixel of the threshold histogram and the area sum; Earth Engine then
+    evaluates the whole chain, speckle filter and focal cleanup included, at that scale.
+    """
+    start = time.perf_counter()
+    if scenes is not None:
+        with stage('mosaic'):
+            before = scene_mosaic(scenes['before'], roi, polarisation)
+            after = scene_mosaic(scenes['after'], roi, polarisation)
+    else:
+        with stage('collection'):
+            collection = s1_collection(roi, orbit_pass, polarisation)
+        
+        with stage('mosaic'):
+            before = collection.filterDate(before_start, before_end).mosaic().clip(roi)
+            after = collection.filterDate(after_start, after_end).mosaic().clip(roi)
+    
+    with stage('speckle_filter'):
+        before_filtered = refined_lee_filter(before, directional=directional_lee)
+        after_filtered = refined_lee_filter(after, directional=directional_lee)
+    
+    with stage('histogram_otsu'):
+        if threshold is None:
+            threshold = compute_threshold(before_filtered, roi, polarisation, scale)
+        else:
+            threshold = ee.Number(threshold)
+    
+    with stage('detect_flood'):
+        flood_only = detect_flood(after_filtered, before_filtered, threshold, slope_mask)
+    
+    with stage('area'):
+        area_geometry = area_geometry or roi
+        flood_area = flood_area_of(flood_only, area_geometry, polarisation, best_effort, scale)
+        roi_area = area_geometry.area(maxError=1)
+    logger.info("analysis graph built in %.3fs", time.perf_counter() - start)
+    
+    return {
+        'before_filtered': before_filtered,
+        'after_filtered': after_filtered,
+        'flood_mask': flood_only,
+        'threshold': threshold,
+        'flood_area': flood_area,
+        'roi_area': roi_area,
+        'stats': ee.Dictionary({'threshold': threshold, 'flood_area': flood_area, 'roi_area': roi_area})
+    }
+
+def _profiled_info(ee_object, destination):
+    # The profile hook is thread-local, so it is installed on the client thread that makes the request.
+    with ee.profilePrinting(destination=destination):
+        return ee_object.getInfo()
+
+
+def fetch_stats(results, callback=None, profile=False):
+    """Fetch threshold, flood_area and roi_area from run_flood_analysis results in one server call.
+    
+    With ``callback`` the dictionary is evaluated asynchronously, ``callback(stats, error)`` is
+    invoked when it arrives and the request's Future is returned. With ``profile`` the server-side
+    per-operation profile is logged and attached to the active instrumentation run.
+    """
+    start = time.perf_counter()
+    
+    if callback is not None:
+        def on_result(value, error=None):
+            logger.info("stats evaluated in %.2fs", time.perf_counter() - start)
+            callback(value, error)
+        return evaluate(results['stats'], on_result)
+    
+    with stage('fetch_stats'):
+        if profile:
+            report = io.StringIO()
+            stats = call(_profiled_info, results['stats'], report)
+            logger.info("server profile:\n%s", report.getvalue())
+            record_server_profile(report.getvalue())
+        else:
+            stats = get_info(results['stats'])
+    logger.info("stats evaluated in %.2fs", time.perf_counter() - start)
+    return stats
+
+def run_tiled_flood_analysis(roi_geojson, before_start, before_end, after_start, after_end,
+                             tile_size_m=None, max_workers=None, slope_mask=None, directional_lee=False,
+                             orbit_pass=ORBIT_PASS, scenes=None, threshold=None, tiles=None, scale=30):
+    """Analyse a large ROI tile by tile at full scale (no bestEffort coarsening).
+    
+    The Otsu threshold is computed once over the whole ROI (unless given); each overlap-padded tile
+    then runs with that threshold and sums flood area over its non-overlapping core only. Tiles are
+    padded for the filters' reach at ``scale``; ``tiles`` restricts the run to a subset of
+    tiling.make_tiles(roi_geojson, tile_size_m, pad_m=tiling.pad_for_scale(scale, directional_lee)).
+    """
+    import tiling
+    
+    roi = geojson_to_ee_geometry(roi_geojson)
+    dates = (before_start, before_end, after_start, after_end)
+    if threshold is None:
+        with stage('global_threshold'):
+            threshold = get_info(run_flood_analysis(
+                roi, *dates, orbit_pass=orbit_pass, slope_mask=slope_mask, directional_lee=directional_lee,
+                scenes=scenes, scale=scale
+            )['threshold'])
+    
+    def analyse_tile(tile):
+        with stage('tile'):
+            core = ee.Geometry(tile.core)
+            results = run_flood_analysis(
+                ee.Geometry(tile.padded), *dates, orbit_pass=orbit_pass,
+                threshold=threshold, area_geometry=core, best_effort=False, slope_mask=slope_mask,
+                directional_lee=directional_lee, scenes=scenes, scale=scale
+            )
+            return {'flood_area': get_info(results['flood_area']) or 0, 'results': results, 'core': core}
+    
+    if tiles is None:
+        tiles = tiling.make_tiles(roi_geojson, tile_size_m or tiling.TILE_SIZE_M,
+                                  pad_m=tiling.pad_for_scale(scale, directional_lee))
+    tile_results = tiling.run_tiles(tiles, analyse_tile, max_workers or tiling.MAX_WORKERS)
+    
+    def merged(name):
+        return ee.ImageCollection([r['results'][name].clip(r['core']) for r in tile_results]).mosaic()
+    
+    flood_area = ee.Number(tiling.merge_areas(r['flood_area'] for r in tile_results))
+    roi_area = roi.area(maxError=1)
+    return {
+        'before_filtered': merged('before_filtered'),
+        'after_filtered': merged('after_filtered'),
+        'flood_mask': merged('flood_mask'),
+        'threshold': ee.Number(threshold),
+        'flood_area': flood_area,
+        'roi_area': roi_area,
+        'stats': ee.Dictionary({'threshold': threshold, 'flood_area': flood_area, 'roi_area': roi_area})
+    }
+
+def run_progressive_analysis(roi_geojson, before_start, before_end, after_start, after_end,
+                             coarse_scale=COARSE_SCALE, margin_db=REFINE_MARGIN_DB, tile_size_m=PROGRESSIVE_TILE_M,
+                             max_workers=None, slope_mask=None, directional_lee=False, orbit_pass=ORBIT_PASS,
+                             scenes=None, threshold=None, on_preview=None):
+    """Run the chain over the whole ROI at ``coarse_scale``, then at full scale only on tiles near water.
+    
+    The coarse pass returns, in one request, its threshold and per-tile sums of flood area and of the
+    area within ``margin_db`` (and twice that) of the threshold. ``on_preview`` is called with the
+    coarse dict(threshold, flood_area, roi_area, scale, seconds) before any tile is refined. Tiles
+    with coarse flood or near-threshold pixels are rerun at 30 m (run_tiled_flood_analysis) with a
+    threshold taken over those tiles; the rest keep their coarse flood area of zero.
+    
+    The returned 'progressive' report holds the coarse result, tile counts, time to first and to final
+    result, and ``bound``: the area of unrefined pixels within 2 * margin_db of the threshold, i.e. how
+    much flood the full-resolution answer could add to the progressive one.
+    """
+    import tiling
+    
+    start = time.perf_counter()
+    roi = geojson_to_ee_geometry(roi_geojson)
+    dates = (before_start, before_end, after_start, after_end)
+    analysis = functools.partial(run_flood_analysis, roi, *dates, orbit_pass=orbit_pass, slope_mask=slope_mask,
+                                 directional_lee=directional_lee, scenes=scenes)
+    # Near-water tiles are rerun at 30 m, so they are padded for that scale.
+    tiles = tiling.make_tiles(roi_geojson, tile_size_m, pad_m=tiling.pad_for_scale(30, directional_lee))
+    with stage('coarse'):
+        coarse = analysis(threshold=threshold, scale=coarse_scale)
+        coarse_threshold = ee.Number(coarse['threshold'])
+        
+        def uncertain(margin):
+            near = [image.gt(coarse_threshold.subtract(margin)).And(image.lt(coarse_threshold.add(margin)))
+                    for image in (coarse['before_filtered'], coarse['after_filtered'])]
+            return near[0].Or(near[1]).unmask(0)
+        
+        area = ee.Image.pixelArea()
+        sums = coarse['flood_mask'].unmask(0).multiply(area).rename('flood') \
+            .addBands(uncertain(margin_db).multiply(area).rename('near')) \
+            .addBands(uncertain(2 * margin_db).multiply(area).rename('wide')) \
+            .reduceRegions(
+                collection=ee.FeatureCollection([
+                    ee.Feature(ee.Geometry(tile.core), {'tile': tile.index}) for tile in tiles
+                ]),
+                reducer=ee.Reducer.sum(), scale=coarse_scale, tileScale=4
+            ).select(['tile', 'flood', 'near', 'wide'], None, False)
+        info = get_info(ee.Dictionary({
+            'threshold': coarse['threshold'], 'roi_area': coarse['roi_area'], 'tiles': sums
+        }))
+    tile_sums = {f['properties']['tile']: f['properties'] for f in info['tiles']['features']}
+    
+    def tile_sum(tile, name):
+        return tile_sums.get(tile.index, {}).get(name) or 0
+    
+    preview = {
+        'threshold': info['threshold'], 'flood_area': tiling.merge_areas(tile_sum(t, 'flood') for t in tiles),
+        'roi_area': info['roi_area'], 'scale': coarse_scale, 'seconds': time.perf_counter() - start,
+    }
+    if on_preview is not None:
+        on_preview(preview)
+    
+    refine = [t for t in tiles if tile_sum(t, 'flood') > 0 or tile_sum(t, 'near') > 0]
+    refined_ids = {t.index for t in refine}
+    if threshold is None and refine:
+        with stage('refine_threshold'):
+            region = ee.FeatureCollection([ee.Feature(ee.Geometry(t.core)) for t in refine]).geometry()
+            threshold = get_info(compute_threshold(coarse['before_filtered'], region))
+    elif threshold is None:
+        threshold = info['threshold']
+    refined = run_tiled_flood_analysis(
+        roi_geojson, *dates, tile_size_m=tile_size_m, max_workers=max_workers, slope_mask=slope_mask,
+        directional_lee=directional_lee, orbit_pass=orbit_pass, scenes=scenes, threshold=threshold, tiles=refine
+    )
+    final = analysis(threshold=threshold)
+    flood_area = refined['flood_area']
+    return {
+        'before_filtered': final['before_filtered'],
+        'after_filtered': final['after_filtered'],
+        'flood_mask': final['flood_mask'],
+        'threshold': ee.Number(threshold),
+        'flood_area': flood_area,
+        'roi_area': ee.Number(info['roi_area']),
+        'stats': ee.Dictionary({'threshold': threshold, 'flood_area': flood_area, 'roi_area': info['roi_area']}),
+        'progressive': {
+            'scale': coarse_scale,
+            'coarse_threshold': preview['threshold'],
+            'coarse_flood_area': preview['flood_area'],
+            'first_seconds': preview['seconds'],
+            'final_seconds': time.perf_counter() - start,
+            'tiles': len(tiles),
+            'refined': len(refine),
+            'bound': tiling.merge_areas(tile_sum(t, 'wide') for t in tiles if t.index not in refined_ids),
+        },
+    }
+
+@functools.lru_cache(maxsize=None)
+def get_result_cache():
+    return ResultCache()
+
+@functools.lru_cache(maxsize=None)
+def get_static_store():
+    return StaticLayerStore()
+
+def run_cached_analysis(roi, roi_geojson, dates, tiled=False, directional_lee=False,
+                        orbit_pass=ORBIT_PASS, plan_scenes=True, threshold_mode='global', progressive=False,
+                        on_preview=None, orbit=None):
+    """Return (stats, images) for the analysis, reusing a cached entry for the same ROI/dates/params.
+    
+    With ``plan_scenes`` both mosaics use only the scenes scene_planner picks from a single relative
+    orbit (``orbit`` when given); stats then carry the plan under 'scenes'. Without a usable plan (no
+    orbit imaged the ROI in both windows) every scene of the pass is mosaicked as before.
+    
+    ``threshold_mode='adaptive'`` takes the threshold from the bimodal cells of a grid over the ROI
+    (adaptive_threshold); stats then carry the cell report under 'adaptive'. ``threshold_mode='multi'``
+    splits the ROI histogram in three (multi_otsu_threshold): open water below the lower threshold is
+    the flood, new water below the upper one is returned as the 'shallow_mask' image, with stats
+    'shallow_threshold' and 'shallow_area'.
+    
+    ``progressive`` runs run_progressive_analysis (calling ``on_preview`` with the coarse result)
+    instead of the plain or tiled analysis; stats then carry its report under 'progressive'.
+    """
+    import adaptive_threshold
+    import scene_planner
+    
+    cache = get_result_cache()
+    params = dict(ANALYSIS_PARAMS, tiled=tiled, directional_lee=directional_lee, plan_scenes=plan_scenes,
+                  threshold_mode=threshold_mode, progressive=progressive, orbit=orbit)
+    key = analysis_key(roi_geojson, dates, orbit_pass, POLARISATION, params)
+    with stage('cache_lookup'):
+        entry = cache.get(key)
+    if entry is not None:
+        images = {name: ee.Image(ee.deserializer.fromJSON(graph)) for name, graph in entry['graphs'].items()}
+        return entry['stats'], images
+    
+    plan = None
+    if plan_scenes:
+        with stage('scene_plan'):
+            plan = scene_planner.plan_for_dates(roi, roi_geojson, dates, orbit_pass, POLARISATION, orbit=orbit)
+        if plan is None:
+            logger.warning("no relative orbit%s covers the ROI in both windows; mosaicking all %s scenes",
+                           f" {orbit}" if orbit is not None else '', orbit_pass)
+    with stage('static_layers'):
+        slope_mask = get_static_store().slope_mask(roi, roi_geojson)
+    adaptive = multi = None
+    if threshold_mode in ('adaptive', 'multi'):
+        before_filtered = run_flood_analysis(
+            roi, *dates, orbit_pass=orbit_pass, directional_lee=directional_lee, scenes=plan
+        )['before_filtered']
+    if threshold_mode == 'multi':
+        with stage('multi_threshold'):
+            multi = get_info(compute_multi_threshold(before_filtered, roi))
+    elif threshold_mode == 'adaptive':
+        with stage('adaptive_threshold'):
+            adaptive = adaptive_threshold.adaptive_threshold(
+                before_filtered, roi_geojson, dates[:2], cache,
+                key_params=dict(ANALYSIS_PARAMS, directional_lee=directional_lee,
+                                scenes=plan['before'] if plan else None),
+                orbit_pass=orbit_pass, polarisation=POLARISATION
+            )
+    threshold = adaptive['threshold'] if adaptive else multi[0] if multi else None
+    if progressive:
+        results = run_progressive_analysis(
+            roi_geojson, *dates, slope_mask=slope_mask, directional_lee=directional_lee,
+            orbit_pass=orbit_pass, scenes=plan, threshold=threshold, on_preview=on_preview
+        )
+    elif tiled:
+        results = run_tiled_flood_analysis(
+            roi_geojson, *dates, slope_mask=slope_mask, directional_lee=directional_lee,
+            orbit_pass=orbit_pass, scenes=plan, threshold=threshold
+        )
+    else:
+        results = run_flood_analysis(
+            roi, *dates, orbit_pass=orbit_pass, slope_mask=slope_mask, directional_lee=directional_lee,
+            scenes=plan, threshold=threshold
+        )
+    images = {name: results[name] for name in ('before_filtered', 'after_filtered', 'flood_mask')}
+    if multi is not None:
+        images['shallow_mask'] = shallow_water(results, multi[1], slope_mask)
+        shallow_area = flood_area_of(images['shallow_mask'], roi)
+        results['stats'] = ee.Dictionary(results['stats']).set('shallow_area', shallow_area)
+    stats = fetch_stats(results, profile=logger.isEnabledFor(logging.DEBUG))
+    if plan is not None:
+        stats['scenes'] = plan
+    if adaptive is not None:
+        stats['adaptive'] = adaptive
+    if multi is not None:
+        stats['shallow_threshold'] = multi[1]
+    if 'progressive' in results:
+        stats['progressive'] = results['progressive']
+    with stage('cache_store'):
+        cache.put(key, stats, graphs={name: ee.serializer.toJSON(image) for name, image in images.items()})
+    return stats, images
+
+def roi_features(roi_geojson, id_property=None):
+    """GeoJSON features of an ROI kept separate, each with a display name.
+    
+    Names come from ``id_property`` when given, else a 'name' property or the feature id, else the
+    feature's position.
+    """
+    gtype = roi_geojson.get('type')
+    if gtype == 'FeatureCollection':
+        features = [f for f in roi_geojson.get('features', []) if isinstance(f, dict) and f.get('geometry')]
+    elif gtype == 'Feature':
+        features = [roi_geojson]
+    else:
+        features = [{'type': 'Feature', 'properties': {}, 'geometry': roi_geojson}]
+    if not features:
+        raise ValueError("GeoJSON FeatureCollection has no valid geometries")
+    named = []
+    for index, feature in enumerate(features):
+        props = feature.get('properties') or {}
+        name = props.get(id_property) if id_property else props.get('name', feature.get('id'))
+        named.append({'type': 'Feature', 'geometry': feature['geometry'],
+                      'properties': {'feature_id': index, 'name': str(name if name is not None else index)}})
+    return named
+
+def per_feature_flood_area(flood_mask, features, scale=30, tile_scale=4):
+    """Flood area (m²) per feature as an ee.FeatureCollection of (feature_id, sum), in one reduceRegions.
+    
+    Geometries are dropped from the output so the response carries only the numbers.
+    """
+    collection = ee.FeatureCollection([
+        ee.Feature(ee.Geometry(f['geometry']), {'feature_id': f['properties']['feature_id']}) for f in features
+    ])
+    areas = flood_mask.unmask(0).multiply(ee.Image.pixelArea())
+    return areas.reduceRegions(collection=collection, reducer=ee.Reducer.sum(), scale=scale, tileScale=tile_scale) \
+        .select(['feature_id', 'sum'], None, False)
+
+def run_multi_roi_analysis(roi_geojson, dates, id_property=None, orbit_pass=ORBIT_PASS, plan_scenes=True,
+                           directional_lee=False, slope_mask=None, batch_size=FEATURE_BATCH, max_workers=None,
+                           cache=None):
+    """Flood area of every feature of an ROI from one shared filter/threshold/slope pass.
+    
+    The speckle filter, Otsu threshold (over all features together) and slope mask are built once over
+    the dissolved ROI; flood area per feature comes from reduceRegions, one request per batch of
+    ``batch_size`` features, batches in parallel. Returns (stats, images, features) where features are
+    GeoJSON features whose properties hold name, area_km2, flood_area_km2 and flood_pct.
+    """
+    import local_engine
+    import scene_planner
+    import tiling
+    
+    cache = cache or get_result_cache()
+    features = roi_features(roi_geojson, id_property)
+    params = dict(ANALYSIS_PARAMS, mode='multi_roi', id_property=id_property, directional_lee=directional_lee,
+                  plan_scenes=plan_scenes)
+    key = analysis_key(roi_geojson, dates, orbit_pass, POLARISATION, params)
+    with stage('cache_lookup'):
+        entry = cache.get(key)
+    if entry is not None:
+        stats = entry['stats']
+        images = {name: ee.Image(ee.deserializer.fromJSON(graph)) for name, graph in entry['graphs'].items()}
+    else:
+        roi = geojson_to_ee_geometry(roi_geojson)
+        plan = None
+        if plan_scenes:
+            with stage('scene_plan'):
+                plan = scene_planner.plan_for_dates(roi, roi_geojson, dates, orbit_pass, POLARISATION)
+        analysis = functools.partial(
+            run_flood_analysis, roi, *dates, orbit_pass=orbit_pass, slope_mask=slope_mask,
+            directional_lee=directional_lee, scenes=plan
+        )
+        with stage('global_threshold'):
+            threshold = get_info(analysis()['threshold'])
+        results = analysis(threshold=threshold)
+        
+        def reduce_batch(batch):
+            with stage('reduce_regions'):
+                reduced = get_info(per_feature_flood_area(results['flood_mask'], batch.features))
+                return {f['properties']['feature_id']: f['properties'].get('sum') or 0 for f in reduced['features']}
+        
+        batches = [FeatureBatch(i, features[start:start + batch_size])
+                   for i, start in enumerate(range(0, len(features), batch_size))]
+        flood_areas = {}
+        for areas in tiling.run_tiles(batches, reduce_batch, max_workers or tiling.MAX_WORKERS):
+            flood_areas.update(areas)
+        stats = {'threshold': threshold, 'flood_area': [flood_areas[i] for i in range(len(features))]}
+        if plan is not None:
+            stats['scenes'] = plan
+        images = {name: results[name] for name in ('before_filtered', 'after_filtered', 'flood_mask')}
+        with stage('cache_store'):
+            cache.put(key, stats, graphs={name: ee.serializer.toJSON(image) for name, image in images.items()})
+    
+    for feature, flood_area in zip(features, stats['flood_area']):
+        area = local_engine.geodesic_area([feature['geometry']])
+        feature['properties'].update(
+            area_km2=area / 1e6, flood_area_km2=flood_area / 1e6,
+            flood_pct=100 * flood_area / area if area else 0.0
+        )
+    stats = dict(stats, roi_area=sum(f['properties']['area_km2'] for f in features) * 1e6)
+    return stats, images, features
+
+def acquisition_dates(roi, start, end, orbit_pass=ORBIT_PASS, polarisation=POLARISATION):
+    """Sorted distinct 'YYYY-MM-dd' acquisition days of the collection over the ROI in [start, end)."""
+    return get_info(s1_collection(roi, orbit_pass, polarisation).filterDate(start, end)
+                    .aggregate_array('system:time_start')
+                    .map(lambda t: ee.Date(t).format('YYYY-MM-dd'))
+                    .distinct().sort())
+
+def run_flood_time_series(roi, roi_geojson, before_start, before_end, series_start, series_end,
+                          directional_lee=False, orbit_pass=ORBIT_PASS, plan_scenes=True, threshold_mode='global'):
+    """Flood extent for every acquisition day in [series_start, series_end) against one baseline.
+    
+    The baseline (filtered pre-event image and threshold) and each day's flood area and mask graph are
+    cached per ROI and settings, so extending the end date builds and evaluates only the new days, all
+    in a single server call. The options are those of run_cached_analysis: with ``plan_scenes`` the
+    baseline and every day use scenes of the relative orbit scene_planner picks for the two windows,
+    and ``threshold_mode`` 'adaptive' or 'multi' sets the baseline threshold ('multi' keeps the lower,
+    open-water one).
+    """
+    import pandas as pd
+    
+    import adaptive_threshold
+    import scene_planner
+    
+    cache = get_result_cache()
+    before_dates = [before_start, before_end]
+    plan = day_scenes = None
+    if plan_scenes:
+        with stage('scene_plan'):
+            plan = scene_planner.plan_for_dates(
+                roi, roi_geojson, (*before_dates, series_start, series_end), orbit_pass, POLARISATION
+            )
+        if plan is None:
+            logger.warning("no relative orbit covers the ROI in both windows; mosaicking all %s scenes", orbit_pass)
+    params = dict(ANALYSIS_PARAMS, mode='time_series', directional_lee=directional_lee, plan_scenes=plan_scenes,
+                  threshold_mode=threshold_mode, scenes=plan['before'] if plan else None)
+    collection = s1_collection(roi, orbit_pass)
+    
+    baseline_key = analysis_key(roi_geojson, before_dates, orbit_pass, POLARISATION, params)
+    baseline = cache.get(baseline_key)
+    if baseline is not None:
+        before_filtered = ee.Image(ee.deserializer.fromJSON(baseline['graphs']['before_filtered']))
+    else:
+        with stage('baseline_threshold'):
+            if plan is not None:
+                before = scene_mosaic(plan['before'], roi)
+            else:
+                before = collection.filterDate(before_start, before_end).mosaic().clip(roi)
+            before_filtered = refined_lee_filter(before, directional=directional_lee)
+            if threshold_mode == 'adaptive':
+                threshold = adaptive_threshold.adaptive_threshold(
+                    before_filtered, roi_geojson, before_dates, cache,
+                    key_params=dict(ANALYSIS_PARAMS, directional_lee=directional_lee, scenes=params['scenes']),
+                    orbit_pass=orbit_pass, polarisation=POLARISATION
+                )['threshold']
+            elif threshold_mode == 'multi':
+                threshold = get_info(compute_multi_threshold(before_filtered, roi))[0]
+            else:
+                threshold = get_info(compute_threshold(before_filtered, roi))
+        baseline = cache.put(baseline_key, {'threshold': threshold},
+                             graphs={'before_filtered': ee.serializer.toJSON(before_filtered)})
+    threshold = baseline['stats']['threshold']
+    
+    with stage('static_layers'):
+        store = get_static_store()
+        slope_mask = store.slope_mask(roi, roi_geojson)
+        permanent_water = store.permanent_water(roi, roi_geojson, before_filtered, threshold, before_dates)
+    
+    with stage('acquisition_dates'):
+        if plan is not None:
+            # The catalog query behind the plan is cached; keep every day of the planned orbit.
+            day_scenes = {}
+            for scene in scene_planner.cached_scenes(roi, roi_geojson, series_start, series_end, orbit_pass,
+                                                     POLARISATION):
+                if (scene['pass'], scene['orbit']) == (plan['pass'], plan['orbit']):
+                    day = datetime.datetime.fromtimestamp(scene['time'] / 1000, datetime.timezone.utc)
+                    day_scenes.setdefault(day.strftime('%Y-%m-%d'), []).append(scene['id'])
+            days = sorted(day_scenes)
+        else:
+            days = acquisition_dates(roi, series_start, series_end, orbit_pass)
+    
+    areas, masks, cached, pending = {}, {}, {}, {}
+    for day in days:
+        key = analysis_key(roi_geojson, [*before_dates, day], orbit_pass, POLARISATION,
+                           dict(params, baseline=baseline_key, scenes=day_scenes[day] if plan else None))
+        entry = cache.get(key)
+        cached[day] = entry is not None
+        if entry is not None:
+            areas[day] = entry['stats']['flood_area']
+            masks[day] = ee.Image(ee.deserializer.fromJSON(entry['graphs']['flood_mask']))
+            continue
+        if plan is not None:
+            after = scene_mosaic(day_scenes[day], roi)
+        else:
+            after = collection.filterDate(day, ee.Date(day).advance(1, 'day')).mosaic().clip(roi)
+        masks[day] = detect_flood(refined_lee_filter(after, directional=directional_lee), before_filtered,
+                                  threshold, slope_mask, permanent_water)
+        pending[day] = key
+    
+    if pending:
+        start = time.perf_counter()
+        with stage('evaluate_new_dates'):
+            new_areas = get_info(ee.Dictionary({day: flood_area_of(masks[day], roi) for day in pending}))
+        logger.info("evaluated %d new dates in %.2fs", len(pending), time.perf_counter() - start)
+        for day, key in pending.items():
+            areas[day] = new_areas.get(day) or 0
+            cache.put(key, {'flood_area': areas[day]}, graphs={'flood_mask': ee.serializer.toJSON(masks[day])})
+    
+    days = sorted(masks)
+    if not days:
+        raise ValueError(f"No Sentinel-1 acquisitions between {series_start} and {series_end}")
+    table = pd.DataFrame({
+        'date': pd.to_datetime(days),
+        'flood_area_km2': [areas[d] / 1e6 for d in days],
+        'cached': [cached[d] for d in days]
+    })
+    stack = ee.ImageCollection([masks[d].unmask(0).rename('flood') for d in days])
+    return {
+        'table': table,
+        'threshold': threshold,
+        'before_filtered': before_filtered,
+        'max_extent': stack.max().clip(roi),
+        'frequency': stack.mean().clip(roi)
+    }
+
+def result_handle(mode, roi, images, **fields):
+    """Picklable record of a finished analysis: fetched scalars plus the serialized ROI and image graphs.
+    
+    Kept in the app's session state so reruns (exports, layer toggles) rebuild maps and exports from it
+    without recomputing anything.
+    """
+    graphs = {name: ee.serializer.toJSON(obj) for name, obj in dict(images, roi=roi).items()}
+    return dict(mode=mode, graphs=graphs, created=time.time(), **fields)
+
+@functools.lru_cache(maxsize=64)
+def _from_graph(graph):
+    return ee.deserializer.fromJSON(graph)
+
+def handle_objects(handle):
+    """(roi, {name: ee.Image}) of a result handle; repeated calls reuse the decoded graphs."""
+    images = {name: ee.Image(_from_graph(graph)) for name, graph in handle['graphs'].items() if name != 'roi'}
+    return ee.Geometry(_from_graph(handle['graphs']['roi'])), images
+
+def export_to_drive(image, description, folder, roi, scale=10):
+    task = ee.batch.Export.image.toDrive(
+        image=image, description=description, folder=folder,
+        scale=scale, region=roi, maxPixels=1e10
+    )
+    start_task(task)
+    return task
+
+def export_vector_to_drive(vectors, description, folder):
+    task = ee.batch.Export.table.toDrive(
+        collection=vectors, description=description,
+        folder=folder, fileFormat='SHP'
+    )
+    start_task(task)
+    return task
@@ -0,0 +1,222 @@
+"""Per-run instrumentation: stage wall times, Earth Engine API calls and payload sizes.
+
+Open a run with ``begin_run``/``end_run`` (or the ``track_run`` context manager) and wrap its steps in
+``stage(name)``. Every Earth Engine REST call made while a stage is active (getInfo, getMapId, task
+starts, ...) is counted against the innermost stage with its request and response size. Finished runs
+are logged as JSON lines and, when FLOOD_PROMETHEUS_TEXTFILE is set, written to that file in the
+Prometheus text exposition format for a node_exporter textfile collector.
+
+Earth Engine graphs are lazy: stages that only build images measure client-side construction, and
+the server time lands in the stage that evaluates them. ``record_server_profile`` keeps the server's
+per-operation breakdown for that.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_TEXTFILE = os.environ.get('FLOOD_PROMETHEUS_TEXTFILE')
+COUNTERS = ('ee_calls', 'ee_seconds', 'request_bytes', 'response_bytes')
+
+_run = contextvars.ContextVar('flood_run', default=None)
+_stage = contextvars.ContextVar('flood_stage', default=None)
+_hook_lock = threading.Lock()
+_hooked = False
+_latest = {}
+_latest_lock = threading.Lock()
+
+
+def _record(name, parent=None):
+    return dict({'stage': name, 'parent': parent, 'seconds': 0.0}, **{c: 0 for c in COUNTERS})
+
+
+class RunMetrics:
+    """Stage records of one run, in the order the stages started."""
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self.seconds = None
+        self.started = time.time()
+        self.server_profile = None
+        self.outside = _record('(outside stages)')
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._token = None
+
+    def add_ee_call(self, seconds, request_bytes, response_bytes):
+        record = _stage.get() or self.outside
+        with self._lock:
+            record['ee_calls'] += 1
+            record['ee_seconds'] += seconds
+            record['request_bytes'] += request_bytes
+            record['response_bytes'] += response_bytes
+
+    def totals(self):
+        """Counters summed over all stages (each EE call is attributed to exactly one record)."""
+        with self._lock:
+            records = self.stages + [self.outside]
+            return {c: sum(r[c] for r in records) for c in COUNTERS}
+
+    def by_stage(self):
+        """Records merged by stage name (repeated stages such as tiles are summed)."""
+        merged = {}
+        with self._lock:
+            for record in self.stages:
+                entry = merged.setdefault(record['stage'], _record(record['stage'], record['parent']))
+                for field in ('seconds',) + COUNTERS:
+                    entry[field] += record[field]
+        return list(merged.values())
+
+    def as_dict(self):
+        return dict(
+            run=self.name, started=self.started, seconds=self.seconds,
+            stages=[dict(r) for r in self.stages], **self.totals()
+        )
+
+
+def current():
+    """The RunMetrics of the active run, or None."""
+    return _run.get()
+
+
+def begin_run(name):
+    install_ee_hook()
+    metrics = RunMetrics(name)
+    metrics._token = _run.set(metrics)
+    return metrics
+
+
+def end_run(metrics):
+    metrics.seconds = time.perf_counter() - metrics._start
+    if metrics._token is not None:
+        _run.reset(metrics._token)
+        metrics._token = None
+    for record in metrics.stages:
+        logger.info(json.dumps(dict(record, event='stage', run=metrics.name)))
+    logger.info(json.dumps(dict(
+        event='run', run=metrics.name, seconds=round(metrics.seconds, 4), stages=len(metrics.stages),
+        **metrics.totals()
+    )))
+    with _latest_lock:
+        _latest[metrics.name] = metrics
+        runs = list(_latest.values())
+    if PROMETHEUS_TEXTFILE:
+        try:
+            write_prometheus(PROMETHEUS_TEXTFILE, runs)
+        except OSError as e:
+            logger.warning("could not write %s: %s", PROMETHEUS_TEXTFILE, e)
+    return metrics
+
+
+@contextlib.contextmanager
+def track_run(name):
+    metrics = begin_run(name)
+    try:
+        yield metrics
+    finally:
+        end_run(metrics)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time a step of the active run; a no-op outside a run."""
+    metrics = _run.get()
+    if metrics is None:
+        yield None
+        return
+    parent = _stage.get()
+    record = _record(name, parent['stage'] if parent else None)
+    with metrics._lock:
+        metrics.stages.append(record)
+    token = _stage.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        _stage.reset(token)
+
+
+def record_server_profile(text):
+    metrics = _run.get()
+    if metrics is not None:
+        metrics.server_profile = text
+
+
+def _size(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode())
+    return len(json.dumps(value, default=str).encode())
+
+
+def install_ee_hook():
+    """Count Earth Engine REST calls by wrapping ee.data._execute_cloud_call (idempotent).
+
+    That private helper is the single point through which ee.data issues Cloud API requests; if a
+    future earthengine-api drops it, runs are still timed but EE calls are not counted.
+    """
+    global _hooked
+    with _hook_lock:
+        if _hooked:
+            return
+        import ee
+
+        original = getattr(ee.data, '_execute_cloud_call', None)
+        if original is None:
+            logger.warning("ee.data._execute_cloud_call not found; EE calls will not be counted")
+            _hooked = True
+            return
+
+        def counted(call, num_retries=None):
+            start = time.perf_counter()
+            result = None
+            try:
+                result = original(call, num_retries)
+                return result
+            finally:
+                metrics = _run.get()
+                if metrics is not None:
+                    metrics.add_ee_call(time.perf_counter() - start, _size(getattr(call, 'body', None)), _size(result))
+
+        ee.data._execute_cloud_call = counted
+        _hooked = True
+
+
+def write_prometheus(path, runs):
+    """Write the latest metrics of each run name as Prometheus gauges, replacing path atomically."""
+    stage_gauges = [
+        ('flood_stage_seconds', 'Wall time of each stage in the latest run.', 'seconds'),
+        ('flood_stage_ee_calls', 'Earth Engine API calls made by each stage in the latest run.', 'ee_calls'),
+        ('flood_stage_ee_request_bytes', 'Bytes sent to Earth Engine by each stage.', 'request_bytes'),
+        ('flood_stage_ee_response_bytes', 'Bytes received from Earth Engine by each stage.', 'response_bytes'),
+    ]
+    lines = []
+    for metric, help_text, field in stage_gauges:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        for run in runs:
+            for record in run.by_stage():
+                lines.append(f'{metric}{{run="{run.name}",stage="{record["stage"]}"}} {record[field]}')
+    run_gauges = [
+        ('flood_run_seconds', 'Wall time of the latest run.', lambda run: run.seconds),
+        ('flood_run_ee_calls', 'Earth Engine API calls made by the latest run.', lambda run: run.totals()['ee_calls']),
+        ('flood_run_timestamp_seconds', 'Unix time the latest run started.', lambda run: run.started),
+    ]
+    for metric, help_text, value in run_gauges:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        lines += [f'{metric}{{run="{run.name}"}} {value(run)}' for run in runs]
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp, path)
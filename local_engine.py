@@ -0,0 +1,472 @@
+"""Local NumPy backend for the flood analysis chain on downloaded Sentinel-1 VV GeoTIFFs."""
+import math
+import os
+import tempfile
+
+import numpy as np
+
+try:
+    import rasterio
+    from rasterio import features, windows
+    from rasterio.vrt import WarpedVRT
+    from rasterio.warp import Resampling, transform_bounds, transform_geom
+except ImportError:
+    rasterio = None
+
+BLOCK_SIZE = 1024
+ANALYSIS_SCALE = 30
+LEE_RADIUS = 1
+SIGMA_V = 0.05
+SLOPE_LIMIT = 5
+# focalMode(1.5, 'circle', 'pixels', 5): a radius of 1.5 px covers the full 3x3 neighbourhood.
+FOCAL_RADIUS = 1
+FOCAL_ITERATIONS = 5
+DEFAULT_THRESHOLD = -15
+EARTH_RADIUS = 6378137.0
+
+
+class NoOverlapError(ValueError):
+    """The ROI does not intersect any of the supplied rasters."""
+
+
+def _require_rasterio():
+    if rasterio is None:
+        raise ImportError("The local engine needs rasterio: pip install rasterio")
+
+
+class LocalRaster:
+    """Memory-mapped float32 raster on a georeferenced grid; NaN marks masked pixels."""
+
+    def __init__(self, array, transform, crs):
+        self.array = array
+        self.transform = transform
+        self.crs = crs
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    def pixel_size(self):
+        """Approximate pixel size in metres."""
+        return pixel_size_m(self.crs, self.transform, self.shape[0])
+
+    def row_pixel_areas(self, row_start, row_stop):
+        """Pixel area in m² for each row in [row_start, row_stop)."""
+        rows = np.arange(row_start, row_stop, dtype=np.float64)
+        if self.crs is not None and self.crs.is_geographic:
+            dlon = math.radians(abs(self.transform.a))
+            top = np.radians(self.transform.f + self.transform.e * rows)
+            bottom = np.radians(self.transform.f + self.transform.e * (rows + 1))
+            return EARTH_RADIUS ** 2 * dlon * np.abs(np.sin(top) - np.sin(bottom))
+        return np.full(rows.shape, abs(self.transform.a * self.transform.e))
+
+
+def pixel_size_m(crs, transform, height):
+    """Approximate pixel width in metres of a grid ``height`` rows tall (at its middle row)."""
+    res = abs(transform.a)
+    if crs is not None and crs.is_geographic:
+        lat = transform.f + transform.e * height / 2
+        return res * math.pi / 180 * EARTH_RADIUS * math.cos(math.radians(lat))
+    return res
+
+
+def scratch(shape, workdir, name, fill=np.nan):
+    """Create a float32 memmap under workdir filled with fill."""
+    array = np.memmap(os.path.join(workdir, f"{name}.f32"), dtype=np.float32, mode='w+', shape=shape)
+    for rows, cols in iter_blocks(shape):
+        array[rows, cols] = fill
+    return array
+
+
+def iter_blocks(shape, block_size=BLOCK_SIZE):
+    """Yield (row_slice, col_slice) windows covering an array of the given shape."""
+    height, width = shape
+    for r0 in range(0, height, block_size):
+        for c0 in range(0, width, block_size):
+            yield slice(r0, min(r0 + block_size, height)), slice(c0, min(c0 + block_size, width))
+
+
+def map_blocks(fn, sources, out, halo=0, block_size=BLOCK_SIZE):
+    """Apply fn to halo-padded windows of the source arrays and write each block interior into out."""
+    height, width = out.shape
+    for rows, cols in iter_blocks(out.shape, block_size):
+        r0, r1 = max(rows.start - halo, 0), min(rows.stop + halo, height)
+        c0, c1 = max(cols.start - halo, 0), min(cols.stop + halo, width)
+        result = fn(*[np.asarray(src[r0:r1, c0:c1]) for src in sources])
+        out[rows, cols] = result[rows.start - r0:rows.stop - r0, cols.start - c0:cols.stop - c0]
+    return out
+
+
+def _box_sum(values, radius):
+    """Zero-padded (2r+1)^2 window sums over the last two axes via a summed-area table.
+
+    Cost per pixel does not depend on the radius; leading axes are summed independently.
+    """
+    size = 2 * radius + 1
+    h, w = values.shape[-2:]
+    pad = [(0, 0)] * (values.ndim - 2) + [(radius + 1, radius)] * 2
+    sat = np.pad(values, pad).cumsum(-2, dtype=np.float64).cumsum(-1)
+    return sat[..., size:, size:] - sat[..., :h, size:] - sat[..., size:, :w] + sat[..., :h, :w]
+
+
+def refined_lee_filter(image, radius=LEE_RADIUS, sigma_v=SIGMA_V):
+    """NumPy port of the Earth Engine refined_lee_filter; NaN pixels are treated as masked."""
+    img = np.asarray(image, dtype=np.float32)
+    valid = np.isfinite(img)
+    values = np.where(valid, img, 0).astype(np.float64)
+    # Count, sum and sum of squares share one summed-area pass.
+    count, total, total_sq = _box_sum(np.stack([valid, values, values * values]), radius)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = total_sq / count - mean * mean
+        variance_mean_sq = variance / (mean * mean)
+        b = (variance_mean_sq - sigma_v) / (variance_mean_sq * (1 + sigma_v))
+    b = np.clip(b, 0, 1)
+    out = mean + b * (img - mean)
+    return np.where(valid, out, np.nan).astype(np.float32)
+
+
+def focal_mode(mask, radius=FOCAL_RADIUS, iterations=FOCAL_ITERATIONS):
+    """Binary equivalent of ee.Image.focalMode over a square window; ties resolve to 0."""
+    current = np.asarray(mask, dtype=np.float32)
+    for _ in range(iterations):
+        valid = np.isfinite(current)
+        ones = _box_sum(np.where(valid, current, 0), radius)
+        count = _box_sum(valid.astype(np.float32), radius)
+        current = np.where(count > 0, (ones > count - ones).astype(np.float32), np.nan)
+    return current
+
+
+def histogram(image, max_buckets=255, min_bucket_width=0.1, stride=1, block_size=BLOCK_SIZE):
+    """Block-wise ee.Reducer.histogram(max_buckets, min_bucket_width); None when nothing is valid."""
+    lo, hi = np.inf, -np.inf
+    for rows, cols in iter_blocks(image.shape, block_size):
+        block = np.asarray(image[rows, cols])[::stride, ::stride]
+        block = block[np.isfinite(block)]
+        if block.size:
+            lo, hi = min(lo, block.min()), max(hi, block.max())
+    if not np.isfinite(lo):
+        return None
+
+    width = min_bucket_width
+    while math.floor(hi / width) - math.floor(lo / width) + 1 > max_buckets:
+        width *= 2
+    bucket_min = math.floor(lo / width) * width
+    size = math.floor(hi / width) - math.floor(lo / width) + 1
+
+    counts = np.zeros(size)
+    sums = np.zeros(size)
+    for rows, cols in iter_blocks(image.shape, block_size):
+        block = np.asarray(image[rows, cols])[::stride, ::stride]
+        block = block[np.isfinite(block)].astype(np.float64)
+        idx = np.clip(((block - bucket_min) / width).astype(np.int64), 0, size - 1)
+        counts += np.bincount(idx, minlength=size)
+        sums += np.bincount(idx, weights=block, minlength=size)
+
+    centres = bucket_min + (np.arange(size) + 0.5) * width
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, centres)
+    return {
+        'histogram': counts.tolist(),
+        'bucketMeans': means.tolist(),
+        'bucketMin': bucket_min,
+        'bucketWidth': width,
+    }
+
+
+def otsu_threshold(histogram):
+    """Otsu threshold over a histogram/bucketMeans dict using cumulative sums (O(n) in buckets)."""
+    counts = np.asarray(histogram['histogram'], dtype=np.float64)
+    means = np.asarray(histogram['bucketMeans'], dtype=np.float64)
+    total = counts.sum()
+    sum_val = (means * counts).sum()
+    mean = sum_val / total
+
+    a_count = np.cumsum(counts)
+    a_sum = np.cumsum(means * counts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a_mean = a_sum / a_count
+        b_count = total - a_count
+        b_mean = (sum_val - a_sum) / b_count
+        bss = a_count * (a_mean - mean) ** 2 + b_count * (b_mean - mean) ** 2
+    return float(means[np.nanargmax(bss)])
+
+
+def multi_otsu_threshold(histogram):
+    """Two Otsu thresholds splitting the histogram into open water, shallow/mixed water and land."""
+    counts = np.asarray(histogram['histogram'], dtype=np.float64)
+    means = np.asarray(histogram['bucketMeans'], dtype=np.float64)
+    p = np.cumsum(counts)
+    s = np.cumsum(means * counts)
+    w0, s0 = p[:, None], s[:, None]
+    w1, s1 = p[None, :] - w0, s[None, :] - s0
+    w2, s2 = p[-1] - p[None, :], s[-1] - s[None, :]
+
+    def _term(sk, wk):
+        return sk ** 2 / np.where(wk == 0, 1, wk)
+
+    score = _term(s0, w0) + _term(s1, w1) + _term(s2, w2)
+    score = np.where(np.triu(np.ones(score.shape, dtype=bool), k=1), score, -np.inf)
+    t1, t2 = np.unravel_index(np.argmax(score), score.shape)
+    return float(means[t1]), float(means[t2])
+
+
+def roi_geometries(geojson_data):
+    if geojson_data is None:
+        return None
+    gtype = geojson_data.get('type')
+    if gtype == 'FeatureCollection':
+        geoms = [f['geometry'] for f in geojson_data.get('features', []) if f.get('geometry')]
+        if not geoms:
+            raise ValueError("GeoJSON FeatureCollection has no valid geometries")
+        return geoms
+    if gtype == 'Feature':
+        return [geojson_data['geometry']]
+    return [geojson_data]
+
+
+def _ring_area(ring):
+    area = 0.0
+    for (lon1, lat1), (lon2, lat2) in zip(ring, ring[1:]):
+        area += math.radians(lon2 - lon1) * (2 + math.sin(math.radians(lat1)) + math.sin(math.radians(lat2)))
+    return abs(area) * EARTH_RADIUS ** 2 / 2
+
+
+def geodesic_area(geometries):
+    """Spherical area in m² of (Multi)Polygon GeoJSON geometries in EPSG:4326."""
+    area = 0.0
+    for geom in geometries:
+        if geom['type'] == 'Polygon':
+            polygons = [geom['coordinates']]
+        elif geom['type'] == 'MultiPolygon':
+            polygons = geom['coordinates']
+        elif geom['type'] == 'GeometryCollection':
+            area += geodesic_area(geom['geometries'])
+            continue
+        else:
+            continue
+        for rings in polygons:
+            area += _ring_area(rings[0]) - sum(_ring_area(hole) for hole in rings[1:])
+    return area
+
+
+def analysis_grid(paths, roi_geoms=None):
+    """Common (crs, transform, width, height) for the given tiles, cropped to the ROI bounds."""
+    _require_rasterio()
+    with rasterio.open(paths[0]) as ref:
+        crs, res, origin = ref.crs, ref.res, (ref.bounds.left, ref.bounds.top)
+    bounds = []
+    for path in paths:
+        with rasterio.open(path) as src:
+            bounds.append(transform_bounds(src.crs, crs, *src.bounds))
+    left = min(b[0] for b in bounds)
+    bottom = min(b[1] for b in bounds)
+    right = max(b[2] for b in bounds)
+    top = max(b[3] for b in bounds)
+
+    if roi_geoms:
+        shapes = [transform_geom('EPSG:4326', crs, g) for g in roi_geoms]
+        roi_bounds = features.bounds({'type': 'GeometryCollection', 'geometries': shapes})
+        left, bottom = max(left, roi_bounds[0]), max(bottom, roi_bounds[1])
+        right, top = min(right, roi_bounds[2]), min(top, roi_bounds[3])
+        if left >= right or bottom >= top:
+            raise NoOverlapError("ROI does not overlap the supplied rasters")
+
+    # Snap to the reference raster's pixel grid so crops of the same scenes line up exactly.
+    left = origin[0] + math.floor((left - origin[0]) / res[0]) * res[0]
+    top = origin[1] - math.floor((origin[1] - top) / res[1]) * res[1]
+    width = max(1, math.ceil((right - left) / res[0]))
+    height = max(1, math.ceil((top - bottom) / res[1]))
+    transform = rasterio.transform.from_origin(left, top, res[0], res[1])
+    return crs, transform, width, height
+
+
+def roi_mask(roi_geoms, grid, rows, cols):
+    """Boolean array, True inside the EPSG:4326 geometries, for a block of the grid."""
+    crs, transform, _, _ = grid
+    window = windows.Window(cols.start, rows.start, cols.stop - cols.start, rows.stop - rows.start)
+    shapes = [transform_geom('EPSG:4326', crs, g) for g in roi_geoms]
+    return features.geometry_mask(
+        shapes, out_shape=(window.height, window.width),
+        transform=windows.transform(window, transform), invert=True
+    )
+
+
+def mosaic(paths, grid, workdir, name, roi_geoms=None, block_size=BLOCK_SIZE):
+    """Mosaic VV GeoTIFFs onto the grid block by block; later tiles win like ee.ImageCollection.mosaic()."""
+    _require_rasterio()
+    crs, transform, width, height = grid
+    out = scratch((height, width), workdir, name, fill=np.nan)
+    for path in paths:
+        with rasterio.open(path) as src, WarpedVRT(
+            src, crs=crs, transform=transform, width=width, height=height,
+            resampling=Resampling.nearest
+        ) as vrt:
+            for rows, cols in iter_blocks((height, width), block_size):
+                window = windows.Window(cols.start, rows.start, cols.stop - cols.start, rows.stop - rows.start)
+                block = vrt.read(1, window=window, masked=True)
+                valid = ~np.ma.getmaskarray(block) & np.isfinite(block.filled(np.nan))
+                if valid.any():
+                    current = np.asarray(out[rows, cols])
+                    current[valid] = block.data[valid]
+                    out[rows, cols] = current
+
+    if roi_geoms:
+        for rows, cols in iter_blocks((height, width), block_size):
+            inside = roi_mask(roi_geoms, grid, rows, cols)
+            current = np.asarray(out[rows, cols])
+            current[~inside] = np.nan
+            out[rows, cols] = current
+    out.flush()
+    return LocalRaster(out, transform, crs)
+
+
+def slope_mask(dem_path, grid, workdir, slope_limit=SLOPE_LIMIT, block_size=BLOCK_SIZE):
+    """1 where the DEM slope is below slope_limit degrees, NaN elsewhere (like slope.lt(5) as a mask)."""
+    _require_rasterio()
+    crs, transform, width, height = grid
+    dem = scratch((height, width), workdir, 'dem', fill=np.nan)
+    with rasterio.open(dem_path) as src, WarpedVRT(
+        src, crs=crs, transform=transform, width=width, height=height,
+        resampling=Resampling.bilinear
+    ) as vrt:
+        for rows, cols in iter_blocks((height, width), block_size):
+            window = windows.Window(cols.start, rows.start, cols.stop - cols.start, rows.stop - rows.start)
+            dem[rows, cols] = vrt.read(1, window=window, masked=True).astype(np.float32).filled(np.nan)
+
+    grid_raster = LocalRaster(dem, transform, crs)
+    dx = grid_raster.pixel_size()
+    dy = dx if not (crs and crs.is_geographic) else abs(transform.e) * math.pi / 180 * EARTH_RADIUS
+
+    def _slope(z):
+        gy, gx = np.gradient(z.astype(np.float64), dy, dx)
+        degrees = np.degrees(np.arctan(np.hypot(gx, gy)))
+        return np.where(degrees < slope_limit, 1, np.nan).astype(np.float32)
+
+    out = scratch((height, width), workdir, 'slope_mask', fill=np.nan)
+    map_blocks(_slope, [dem], out, halo=1, block_size=block_size)
+    return LocalRaster(out, transform, crs)
+
+
+def filtered_mosaic(paths, grid, workdir, name, roi_geoms=None, block_size=BLOCK_SIZE):
+    """Mosaic the tiles and apply the Lee filter, returning the filtered LocalRaster."""
+    crs, transform, width, height = grid
+    raw = mosaic(paths, grid, workdir, name, roi_geoms, block_size)
+    filtered = scratch((height, width), workdir, f"{name}_filtered")
+    map_blocks(refined_lee_filter, [raw.array], filtered, LEE_RADIUS, block_size)
+    return LocalRaster(filtered, transform, crs)
+
+
+def _sampled_histogram(filtered, block_size=BLOCK_SIZE):
+    stride = max(1, round(ANALYSIS_SCALE / filtered.pixel_size()))
+    return histogram(filtered.array, stride=stride, block_size=block_size)
+
+
+def threshold_from(filtered, block_size=BLOCK_SIZE):
+    """Otsu threshold of a filtered raster sampled at ANALYSIS_SCALE, or DEFAULT_THRESHOLD if empty."""
+    hist = _sampled_histogram(filtered, block_size)
+    return otsu_threshold(hist) if hist else DEFAULT_THRESHOLD
+
+
+def multi_threshold_from(filtered, block_size=BLOCK_SIZE):
+    """(open water, shallow water) multi-Otsu thresholds of a filtered raster, like threshold_from."""
+    hist = _sampled_histogram(filtered, block_size)
+    return multi_otsu_threshold(hist) if hist else (DEFAULT_THRESHOLD, DEFAULT_THRESHOLD)
+
+
+def estimate_threshold(roi, before_paths, workdir=None, block_size=BLOCK_SIZE):
+    """Otsu threshold of the filtered pre-event mosaic over the whole ROI."""
+    workdir = tempfile.mkdtemp(prefix='flood_threshold_', dir=workdir)
+    roi_geoms = roi_geometries(roi)
+    grid = analysis_grid(list(before_paths), roi_geoms)
+    return threshold_from(filtered_mosaic(before_paths, grid, workdir, 'before', roi_geoms, block_size), block_size)
+
+
+def run_flood_analysis_local(roi, before_paths, after_paths, dem_path=None, workdir=None,
+                             block_size=BLOCK_SIZE, threshold=None, area_roi=None, static_store=None,
+                             threshold_mode='global'):
+    """Run the flood chain on local VV GeoTIFFs; returns the same dict keys as run_flood_analysis.
+
+    ``roi`` is a GeoJSON dict in EPSG:4326 (or None for the full raster extent). Rasters are
+    memory-mapped scratch files under ``workdir``; areas are in m² like the Earth Engine path.
+    A fixed ``threshold`` skips the Otsu step, and ``area_roi`` restricts the area sums to a
+    sub-region of ``roi`` (used by the tiler so padded tiles are not double counted).
+    With a ``static_store`` (static_layers.StaticLayerStore) the slope mask is reused across runs.
+    ``threshold_mode='multi'`` splits the pre-event histogram in three (multi_otsu_threshold) and adds
+    ``shallow_mask``, ``shallow_threshold`` and ``shallow_area`` for pixels between the two thresholds.
+    """
+    _require_rasterio()
+    workdir = tempfile.mkdtemp(prefix='flood_local_', dir=workdir)
+    roi_geoms = roi_geometries(roi)
+    area_geoms = roi_geometries(area_roi) or roi_geoms
+    grid = analysis_grid(list(before_paths) + list(after_paths), roi_geoms)
+    crs, transform, width, height = grid
+    shape = (height, width)
+
+    before_filtered = filtered_mosaic(before_paths, grid, workdir, 'before', roi_geoms, block_size)
+    after_filtered = filtered_mosaic(after_paths, grid, workdir, 'after', roi_geoms, block_size)
+    shallow_threshold = None
+    if threshold_mode == 'multi':
+        low, shallow_threshold = multi_threshold_from(before_filtered, block_size)
+        threshold = low if threshold is None else threshold
+    elif threshold is None:
+        threshold = threshold_from(before_filtered, block_size)
+
+    sources = [after_filtered.array, before_filtered.array]
+    if dem_path and static_store is not None:
+        sources.append(static_store.local_slope_mask(dem_path, grid, workdir, block_size=block_size).array)
+    elif dem_path:
+        sources.append(slope_mask(dem_path, grid, workdir, block_size=block_size).array)
+
+    def _flood_below(cutoff):
+        def _flood(after_block, before_block, slope_block=None):
+            water = np.where(np.isfinite(after_block), (after_block < cutoff).astype(np.float32), np.nan)
+            if slope_block is not None:
+                water = np.where(np.isfinite(slope_block), water, np.nan)
+            water_cleaned = focal_mode(water)
+            permanent_water = np.where(np.isfinite(before_block), before_block < cutoff, np.nan)
+            valid = np.isfinite(water_cleaned) & np.isfinite(permanent_water)
+            flood = (water_cleaned == 1) & (permanent_water == 0)
+            return np.where(valid, flood, np.nan).astype(np.float32)
+        return _flood
+
+    flood_mask = LocalRaster(
+        map_blocks(_flood_below(threshold), sources, scratch(shape, workdir, 'flood_mask'),
+                   FOCAL_RADIUS * FOCAL_ITERATIONS, block_size),
+        transform, crs
+    )
+    shallow_mask = None
+    if shallow_threshold is not None:
+        # As in flood_core.shallow_water: flooded at the upper threshold but not at the lower one.
+        shallow = map_blocks(_flood_below(shallow_threshold), sources, scratch(shape, workdir, 'shallow_mask'),
+                             FOCAL_RADIUS * FOCAL_ITERATIONS, block_size)
+        map_blocks(lambda upper, lower: np.where(np.isfinite(upper), (upper == 1) & (lower != 1), np.nan),
+                   [shallow, flood_mask.array], shallow, 0, block_size)
+        shallow_mask = LocalRaster(shallow, transform, crs)
+
+    flood_area = 0.0
+    shallow_area = 0.0
+    valid_area = 0.0
+    for rows, cols in iter_blocks(shape, block_size):
+        block = np.asarray(flood_mask.array[rows, cols])
+        areas = flood_mask.row_pixel_areas(rows.start, rows.stop)[:, None]
+        if area_roi is not None:
+            areas = areas * roi_mask(area_geoms, grid, rows, cols)
+        flood_area += float((np.nan_to_num(block) * areas).sum())
+        if shallow_mask is not None:
+            shallow_area += float((np.nan_to_num(np.asarray(shallow_mask.array[rows, cols])) * areas).sum())
+        valid_area += float((np.isfinite(np.asarray(after_filtered.array[rows, cols])) * areas).sum())
+
+    roi_area = geodesic_area(area_geoms) if area_geoms else valid_area
+
+    results = {
+        'before_filtered': before_filtered,
+        'after_filtered': after_filtered,
+        'flood_mask': flood_mask,
+        'threshold': threshold,
+        'flood_area': flood_area,
+        'roi_area': roi_area
+    }
+    if shallow_mask is not None:
+        results.update(shallow_mask=shallow_mask, shallow_threshold=shallow_threshold, shallow_area=shallow_area)
+    return results
@@ -0,0 +1,125 @@
+"""Map layers: cached Earth Engine tile URLs, lazily requested layers and browser-side vector overlays."""
+import collections
+import hashlib
+import json
+import threading
+import time
+
+MAP_ID_TTL = 3600
+MAX_ENTRIES = 256
+ATTRIBUTION = 'Google Earth Engine'
+
+Layer = collections.namedtuple('Layer', ['name', 'image', 'vis_params', 'shown'])
+
+
+def layer_key(ee_object, vis_params):
+    """SHA-256 of the serialized Earth Engine graph and the visualisation parameters."""
+    import ee
+
+    payload = {'graph': ee.serializer.toJSON(ee_object), 'vis': vis_params}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class TileUrlCache:
+    """Tile URL templates per (graph, vis params), so reruns redraw maps without calling getMapId.
+
+    Map IDs stay valid for hours; entries are refreshed after ``ttl`` seconds to stay well inside that.
+    """
+
+    def __init__(self, ttl=MAP_ID_TTL, max_entries=MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def tile_url(self, image, vis_params):
+        import ee
+
+        from ee_client import get_client
+
+        key = layer_key(image, vis_params)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        url = get_client().call(
+            lambda: ee.Image(image).getMapId(vis_params)['tile_fetcher'].url_format, key=('getMapId', key)
+        )
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (url, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return url
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+def add_layers(m, layers, cache, selected=None):
+    """Add layers to a geemap map as XYZ tile layers using cached URLs.
+
+    Only layers named in ``selected`` (default: those with ``shown``) are requested from Earth Engine;
+    the rest cost nothing until the user picks them.
+    """
+    for layer in layers:
+        if not (layer.name in selected if selected is not None else layer.shown):
+            continue
+        vis_params = dict(layer.vis_params)
+        opacity = vis_params.pop('opacity', 1.0)
+        url = cache.tile_url(layer.image, vis_params)
+        m.add_tile_layer(url, layer.name, ATTRIBUTION, opacity=opacity, shown=True)
+
+
+def add_roi_outline(m, roi_geojson, color='red', name='ROI'):
+    """Draw the ROI from its GeoJSON in the browser instead of rendering it as Earth Engine tiles."""
+    m.add_geojson(roi_geojson, layer_name=name, style={'color': color, 'weight': 2, 'fillOpacity': 0})
+
+
+def geojson_bounds(geojson):
+    """[[south, west], [north, east]] over all coordinates of a GeoJSON geometry, feature or collection."""
+    xs, ys = [], []
+    stack = [geojson]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend(item.get('features') or item.get('geometries') or [])
+            stack.extend(v for v in (item.get('geometry'), item.get('coordinates')) if v is not None)
+        elif item and isinstance(item[0], (int, float)):
+            xs.append(item[0])
+            ys.append(item[1])
+        else:
+            stack.extend(item)
+    return [[min(ys), min(xs)], [max(ys), max(xs)]]
+
+
+def fit_roi(m, roi_geojson):
+    """Zoom the map to the ROI from its GeoJSON, without the server round trips of centerObject."""
+    m.fit_bounds(geojson_bounds(roi_geojson))
+
+
+def add_choropleth(m, features, value, name, caption=None, colormap='YlOrRd_09'):
+    """Colour GeoJSON features by a numeric property, with a tooltip of their properties and a legend."""
+    import branca.colormap
+    import folium
+
+    values = [f['properties'][value] for f in features]
+    scale = getattr(branca.colormap.linear, colormap).scale(min(values, default=0), max(max(values, default=0), 1e-9))
+    scale.caption = caption or value
+    fields = [key for key in features[0]['properties'] if key != 'feature_id'] if features else []
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features}, name=name,
+        style_function=lambda f: {
+            'fillColor': scale(f['properties'][value]), 'color': '#333333', 'weight': 1, 'fillOpacity': 0.7
+        },
+        tooltip=folium.GeoJsonTooltip(fields=fields, localize=True),
+    ).add_to(m)
+    scale.add_to(m)
+
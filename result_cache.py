@@ -0,0 +1,174 @@
+"""Persistent content-addressed cache for flood analysis results."""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+CACHE_DIR = os.environ.get('FLOOD_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'nile_flood'))
+MAX_BYTES = 512 * 1024 ** 2
+MAX_ENTRIES = 256
+COORD_PRECISION = 7
+
+
+def _round_coords(coords):
+    if isinstance(coords, (list, tuple)):
+        if coords and isinstance(coords[0], (int, float)):
+            return [round(float(c), COORD_PRECISION) for c in coords]
+        return [_round_coords(c) for c in coords]
+    return coords
+
+
+def _canonical_ring(ring, counterclockwise):
+    # Start at the smallest vertex and wind one way, so the same ring drawn differently compares equal.
+    points = [list(p) for p in ring]
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    if len(points) < 3:
+        return ring
+    start = points.index(min(points))
+    points = points[start:] + points[:start]
+    area = sum(a[0] * b[1] - b[0] * a[1] for a, b in zip(points, points[1:] + points[:1]))
+    if area and (area > 0) != counterclockwise:
+        points = points[:1] + points[:0:-1]
+    return points + points[:1]
+
+
+def _canonical_polygon(rings):
+    # RFC 7946 winding: exterior ring counterclockwise, holes clockwise.
+    holes = sorted((_canonical_ring(r, False) for r in rings[1:]), key=json.dumps)
+    return [_canonical_ring(rings[0], True)] + holes if rings else []
+
+
+def canonical_geometry(geojson_data):
+    """Strip properties/CRS members and round coordinates so equal ROIs serialize identically.
+
+    Polygon rings are also rotated to start at their smallest vertex and wound the RFC 7946 way, and
+    holes, polygon parts and geometries are sorted.
+    """
+    gtype = geojson_data.get('type') if isinstance(geojson_data, dict) else None
+    if gtype == 'FeatureCollection':
+        geoms = [f['geometry'] for f in geojson_data.get('features', []) if isinstance(f, dict) and f.get('geometry')]
+    elif gtype == 'Feature':
+        geoms = [geojson_data['geometry']]
+    elif gtype == 'GeometryCollection':
+        geoms = geojson_data.get('geometries', [])
+    else:
+        geoms = [geojson_data]
+
+    canonical = []
+    for geom in geoms:
+        if geom.get('type') == 'GeometryCollection':
+            canonical.extend(canonical_geometry(geom)['geometries'])
+        else:
+            coords = _round_coords(geom['coordinates'])
+            if geom['type'] == 'Polygon':
+                coords = _canonical_polygon(coords)
+            elif geom['type'] == 'MultiPolygon':
+                coords = sorted((_canonical_polygon(p) for p in coords), key=json.dumps)
+            canonical.append({'type': geom['type'], 'coordinates': coords})
+    canonical.sort(key=lambda g: json.dumps(g, sort_keys=True))
+    return {'type': 'GeometryCollection', 'geometries': canonical}
+
+
+def analysis_key(geojson_data, dates, orbit_pass='ASCENDING', polarisation='VV', params=None):
+    """SHA-256 over the canonical ROI, the four date strings, the collection filters and algorithm params."""
+    payload = {
+        'roi': canonical_geometry(geojson_data),
+        'dates': [str(d) for d in dates],
+        'orbit_pass': orbit_pass,
+        'polarisation': polarisation,
+        'params': params or {},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class ResultCache:
+    """On-disk store of analysis stats, serialized EE graphs and derived files with LRU eviction.
+
+    Each entry is a directory named by its key holding ``meta.json`` plus any attached files.
+    Recency is the mtime of ``meta.json``, refreshed on every hit.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES, max_entries=MAX_ENTRIES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def path(self, key, name):
+        """Path of a file attached to a cached entry."""
+        return os.path.join(self._entry(key), name)
+
+    def get(self, key):
+        meta_path = self.path(key, 'meta.json')
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return meta
+
+    def put(self, key, stats, graphs=None, files=None):
+        """Store scalar stats, serialized EE graphs and copies of local files under key."""
+        staging = tempfile.mkdtemp(prefix='.staging_', dir=self.root)
+        try:
+            for name, src in (files or {}).items():
+                shutil.copyfile(src, os.path.join(staging, name))
+            meta = {
+                'stats': stats,
+                'graphs': graphs or {},
+                'files': sorted(files or {}),
+                'created': time.time(),
+            }
+            with open(os.path.join(staging, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            os.replace(staging, self._entry(key))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        self._evict()
+        return meta
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            meta_path = os.path.join(entry, 'meta.json')
+            if name.startswith('.') or not os.path.isfile(meta_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(meta_path), size, entry))
+        return sorted(entries)
+
+    def _evict(self):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+                _, size, entry = entries.pop(0)
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+        }
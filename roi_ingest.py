@@ -0,0 +1,139 @@
+"""Streaming ROI ingestion: read features in batches, reproject, dissolve and simplify."""
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+import pyogrio
+import shapely
+from pyproj import CRS, Transformer
+from shapely.geometry import mapping
+from shapely.ops import unary_union
+
+BATCH_SIZE = 500
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = 50 * 1024 ** 2
+MAX_VERTICES = 50000
+SIMPLIFY_TOLERANCE_M = 10
+METRES_PER_DEGREE = 111320
+
+
+class RoiTooLargeError(ValueError):
+    """The upload exceeds the size cap or still has too many vertices after simplification."""
+
+
+def _dataset_path(path):
+    if not path.lower().endswith('.zip'):
+        return path
+    with zipfile.ZipFile(path) as zf:
+        shp_files = [n for n in zf.namelist() if n.lower().endswith('.shp')]
+    if not shp_files:
+        raise ValueError("No .shp file found in zip")
+    return f"/vsizip/{path}/{shp_files[0]}"
+
+
+def iter_batches(path, batch_size=BATCH_SIZE):
+    """Yield (geometries, properties) batches reprojected to EPSG:4326 without loading the whole file."""
+    dataset = _dataset_path(path)
+    transformer = None
+    skip = 0
+    while True:
+        meta, _, wkb, field_data = pyogrio.raw.read(dataset, skip_features=skip, max_features=batch_size)
+        if len(wkb) == 0:
+            break
+        if skip == 0 and meta['crs']:
+            crs = CRS.from_user_input(meta['crs'])
+            if not crs.equals(CRS.from_epsg(4326), ignore_axis_order=True):
+                transformer = Transformer.from_crs(crs, 4326, always_xy=True)
+        geoms = shapely.from_wkb(wkb)
+        if transformer is not None:
+            geoms = shapely.transform(geoms, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+        properties = [
+            {name: (values[i].item() if hasattr(values[i], 'item') else values[i])
+             for name, values in zip(meta['fields'], field_data)}
+            for i in range(len(wkb))
+        ]
+        yield geoms, properties
+        skip += len(wkb)
+        if len(wkb) < batch_size:
+            break
+
+
+def ingest(path, tolerance_m=SIMPLIFY_TOLERANCE_M, dissolve=True, max_vertices=MAX_VERTICES,
+           batch_size=BATCH_SIZE):
+    """Read a GeoJSON/Shapefile/zipped Shapefile into a simplified EPSG:4326 GeoJSON dict.
+
+    With ``dissolve`` the features are unioned into one geometry; otherwise each feature is kept
+    (with its properties) in a FeatureCollection. Simplification preserves topology and uses a
+    tolerance in metres. Returns a dict with the GeoJSON and feature/vertex counts.
+    """
+    tolerance = tolerance_m / METRES_PER_DEGREE
+    features = 0
+    vertices_before = 0
+    merged = None
+    kept = []
+    for geoms, properties in iter_batches(path, batch_size):
+        present = ~shapely.is_missing(geoms)
+        geoms = geoms[present]
+        properties = [p for p, keep in zip(properties, present) if keep]
+        features += len(geoms)
+        vertices_before += int(shapely.get_num_coordinates(geoms).sum())
+        # Simplify first so the validity check and the running dissolve work on far fewer vertices.
+        geoms = shapely.simplify(geoms, tolerance, preserve_topology=True)
+        invalid = ~shapely.is_valid(geoms)
+        if invalid.any():
+            geoms[invalid] = shapely.make_valid(geoms[invalid])
+        if dissolve:
+            merged = unary_union([g for g in [merged] if g is not None] + list(geoms))
+        else:
+            kept.extend(zip(geoms, properties))
+
+    if features == 0:
+        raise ValueError("ROI file contains no features")
+
+    if dissolve:
+        geometry = shapely.simplify(merged, tolerance, preserve_topology=True)
+        vertices_after = int(shapely.get_num_coordinates(geometry))
+        geojson = {'type': 'Feature', 'properties': {}, 'geometry': mapping(geometry)}
+    else:
+        vertices_after = sum(int(shapely.get_num_coordinates(g)) for g, _ in kept)
+        geojson = {
+            'type': 'FeatureCollection',
+            'features': [{'type': 'Feature', 'properties': p, 'geometry': mapping(g)} for g, p in kept]
+        }
+
+    if max_vertices and vertices_after > max_vertices:
+        raise RoiTooLargeError(
+            f"ROI has {vertices_after} vertices after simplification (limit {max_vertices}); "
+            "increase the simplification tolerance"
+        )
+    return {
+        'geojson': geojson,
+        'features': features,
+        'vertices_before': vertices_before,
+        'vertices_after': vertices_after,
+    }
+
+
+def ingest_upload(fileobj, filename, tolerance_m=SIMPLIFY_TOLERANCE_M, max_bytes=MAX_UPLOAD_BYTES, **kwargs):
+    """Spool an uploaded file to disk in chunks (enforcing max_bytes) and ingest it."""
+    suffix = os.path.splitext(filename)[1].lower()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, f"upload{suffix}")
+        written = 0
+        with open(path, 'wb') as out:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise RoiTooLargeError(f"Upload exceeds {max_bytes / 1024 ** 2:.0f} MB")
+                out.write(chunk)
+        return ingest(path, tolerance_m, **kwargs)
+
+
+def write_geojson(result, output_path):
+    with open(output_path, 'w') as f:
+        json.dump(result['geojson'], f)
@@ -0,0 +1,158 @@
+"""Sentinel-1 scene planning: the fewest same-orbit scenes covering an ROI, from one catalog query.
+
+Mosaicking every scene in a date window mixes acquisition geometries (relative orbits), which
+processes more pixels than needed and stitches backscatter taken at different incidence angles.
+The planner fetches candidate metadata and footprints once per ROI/window, groups the scenes by
+(pass, relative orbit), picks for each group the smallest set covering the ROI by greedy set cover,
+and keeps the group with the best coverage in both the before and after windows.
+"""
+import functools
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from result_cache import CACHE_DIR, ResultCache, analysis_key, canonical_geometry
+
+S1_COLLECTION = 'COPERNICUS/S1_GRD'
+CATALOG_DIR = os.path.join(CACHE_DIR, 'catalog')
+TARGET_COVERAGE = 0.995
+# Scenes adding less than this fraction of the ROI are not worth another mosaic input.
+MIN_GAIN = 0.001
+# Windows ending less than this long before the query may still receive newly ingested scenes.
+INGEST_LAG_S = 3 * 86400
+RECENT_TTL_S = 3600
+
+
+@functools.lru_cache(maxsize=None)
+def get_catalog_cache():
+    return ResultCache(CATALOG_DIR)
+
+
+def query_scenes(roi, start, end, orbit_pass='ASCENDING', polarisation='VV'):
+    """Candidate scenes in [start, end) over the ROI as dicts with id, time, orbit, pass and footprint.
+
+    One getInfo call; ``orbit_pass='BOTH'`` keeps ascending and descending scenes.
+    """
+    import ee
+
+    from ee_client import get_info
+
+    collection = ee.ImageCollection(S1_COLLECTION) \
+        .filter(ee.Filter.eq('instrumentMode', 'IW')) \
+        .filter(ee.Filter.listContains('transmitterReceiverPolarisation', polarisation)) \
+        .filterBounds(roi).filterDate(start, end)
+    if orbit_pass != 'BOTH':
+        collection = collection.filter(ee.Filter.eq('orbitProperties_pass', orbit_pass))
+    features = get_info(collection.map(lambda image: ee.Feature(image.geometry(), {
+        'id': image.get('system:index'),
+        'time': image.get('system:time_start'),
+        'orbit': image.get('relativeOrbitNumber_start'),
+        'pass': image.get('orbitProperties_pass'),
+    })))['features']
+    return [dict(f['properties'], footprint=f['geometry']) for f in features]
+
+
+def _fresh(entry, end):
+    end_s = datetime.strptime(str(end)[:10], '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp()
+    return entry['created'] - end_s > INGEST_LAG_S or time.time() - entry['created'] < RECENT_TTL_S
+
+
+def cached_scenes(roi, roi_geojson, start, end, orbit_pass='ASCENDING', polarisation='VV', cache=None):
+    """query_scenes through the on-disk catalog cache.
+
+    Windows that closed well before the query are final and cached indefinitely; recent ones are
+    re-queried after RECENT_TTL_S so late-ingested scenes are picked up.
+    """
+    cache = cache or get_catalog_cache()
+    key = analysis_key(roi_geojson, [start, end], orbit_pass, polarisation, {'query': 'scenes'})
+    entry = cache.get(key)
+    if entry is not None and _fresh(entry, end):
+        return entry['stats']['scenes']
+    scenes = query_scenes(roi, start, end, orbit_pass, polarisation)
+    cache.put(key, {'scenes': scenes})
+    return scenes
+
+
+def roi_shape(roi_geojson):
+    return shapely.union_all([shape(g) for g in canonical_geometry(roi_geojson)['geometries']])
+
+
+def greedy_cover(scenes, roi, target=TARGET_COVERAGE, min_gain=MIN_GAIN):
+    """(chosen scenes, covered fraction): repeatedly take the scene adding the most uncovered ROI area.
+
+    Greedy set cover is within a log factor of the optimum and exact for the one-or-two-scene
+    cases typical of a single orbit. Ties go to the newest scene.
+    """
+    total = roi.area
+    if not scenes or total == 0:
+        return [], 0.0
+    scenes = sorted(scenes, key=lambda s: -s['time'])
+    footprints = shapely.intersection(np.array([shape(s['footprint']) for s in scenes]), roi)
+    remaining = list(range(len(scenes)))
+    uncovered = roi
+    chosen = []
+    while remaining and uncovered.area > (1 - target) * total:
+        gains = shapely.area(shapely.intersection(footprints[remaining], uncovered))
+        best = int(np.argmax(gains))
+        if gains[best] < min_gain * total:
+            break
+        index = remaining.pop(best)
+        chosen.append(scenes[index])
+        uncovered = uncovered.difference(footprints[index])
+    return chosen, 1 - uncovered.area / total
+
+
+def _by_orbit(scenes):
+    groups = {}
+    for scene in scenes:
+        groups.setdefault((scene['pass'], scene['orbit']), []).append(scene)
+    return groups
+
+
+def plan_scenes(before_scenes, after_scenes, roi_geojson, target=TARGET_COVERAGE, orbit=None):
+    """Pick one (pass, relative orbit) and the scenes of each window to mosaic, or None.
+
+    Orbits are ranked by the coverage of the worse window, then by the number of scenes, then by
+    the latest after-event acquisition. ``orbit`` restricts the choice to that relative orbit. An
+    orbit whose scenes cover none of the ROI in either window (or a ROI without area) gives no plan.
+    """
+    roi = roi_shape(roi_geojson)
+    before, after = _by_orbit(before_scenes), _by_orbit(after_scenes)
+    best = None
+    for key in set(before) & set(after):
+        if orbit is not None and key[1] != orbit:
+            continue
+        before_cover, before_coverage = greedy_cover(before[key], roi, target)
+        after_cover, after_coverage = greedy_cover(after[key], roi, target)
+        if not before_cover or not after_cover or min(before_coverage, after_coverage) == 0:
+            continue
+        score = (
+            round(min(before_coverage, after_coverage), 3),
+            -(len(before_cover) + len(after_cover)),
+            max(s['time'] for s in after_cover),
+        )
+        if best is None or score > best[0]:
+            best = (score, key, before_cover, after_cover, before_coverage, after_coverage)
+    if best is None:
+        return None
+    _, (orbit_pass, orbit), before_cover, after_cover, before_coverage, after_coverage = best
+    return {
+        'pass': orbit_pass,
+        'orbit': orbit,
+        'before': [s['id'] for s in before_cover],
+        'after': [s['id'] for s in after_cover],
+        'coverage': {'before': before_coverage, 'after': after_coverage},
+        'candidates': {'before': len(before_scenes), 'after': len(after_scenes)},
+    }
+
+
+def plan_for_dates(roi, roi_geojson, dates, orbit_pass='ASCENDING', polarisation='VV', cache=None, orbit=None):
+    """plan_scenes for the (before_start, before_end, after_start, after_end) windows of an analysis."""
+    before_start, before_end, after_start, after_end = dates
+    before = cached_scenes(roi, roi_geojson, before_start, before_end, orbit_pass, polarisation, cache)
+    after = cached_scenes(roi, roi_geojson, after_start, after_end, orbit_pass, polarisation, cache)
+    return plan_scenes(before, after, roi_geojson, orbit=orbit)
@@ -0,0 +1,163 @@
+"""Per-ROI store for static layers (slope and permanent-water masks) reused across runs."""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import ee
+import numpy as np
+
+from ee_client import call, start_task
+from result_cache import CACHE_DIR, canonical_geometry
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = os.path.join(CACHE_DIR, 'static')
+DEM_SOURCE = 'USGS/SRTMGL1_003'
+SLOPE_LIMIT = 5
+ASSET_SCALE = 30
+# Export tasks still on their way to an asset; any other state but COMPLETED means export again.
+PENDING_STATES = {'UNSUBMITTED', 'READY', 'RUNNING'}
+# How long a pending task's state is trusted before it is polled again.
+STATUS_TTL = 300
+
+
+def layer_key(name, roi_geojson=None, **params):
+    """SHA-256 over the layer name, the canonical ROI and the parameters that define the layer."""
+    payload = {
+        'name': name,
+        'roi': canonical_geometry(roi_geojson) if roi_geojson is not None else None,
+        'params': params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _task_status(task_id):
+    return call(ee.data.getTaskStatus, task_id)[0]
+
+
+class StaticLayerStore:
+    """Registry of precomputed static layers.
+
+    Earth Engine layers are exported once to ``asset_root`` (when set) and afterwards loaded as
+    ``ee.Image(asset_id)``; until the export finishes the layer is computed on the fly. The export
+    task's state is kept in the registry: a failed, cancelled or unknown task is exported again.
+    ``status_fn(task_id)`` returns a task status dict (defaults to ee.data.getTaskStatus). Local layers
+    are written as DEFLATE-compressed uint8 GeoTIFFs under ``root``. Keys include the DEM source
+    and cutoff, so changing either builds a new layer rather than reusing a stale one.
+    """
+
+    def __init__(self, root=STORE_DIR, asset_root=None, status_fn=None):
+        self.root = root
+        self.asset_root = asset_root if asset_root is not None else os.environ.get('FLOOD_STATIC_ASSET_ROOT')
+        self._status_fn = status_fn or _task_status
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._registry_path = os.path.join(root, 'registry.json')
+
+    def _load(self):
+        try:
+            with open(self._registry_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _record(self, key, **entry):
+        with self._lock:
+            registry = self._load()
+            registry[key] = dict(registry.get(key, {}), **entry)
+            tmp = self._registry_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(registry, f, indent=1)
+            os.replace(tmp, self._registry_path)
+
+    def _task_state(self, key, entry):
+        """State of the entry's export task; pending states are re-polled at most every STATUS_TTL s."""
+        state = entry.get('state')
+        if state == 'COMPLETED' or time.time() - entry.get('checked', 0) < STATUS_TTL:
+            return state
+        try:
+            state = self._status_fn(entry['task_id']).get('state')
+        except ee.EEException as e:
+            logger.warning("static layer %s: task status unavailable (%s)", entry['name'], e)
+        self._record(key, state=state, checked=time.time())
+        return state
+
+    def _ee_layer(self, name, roi, roi_geojson, params, build):
+        key = layer_key(name, roi_geojson, **params)
+        entry = self._load().get(key)
+        state = self._task_state(key, entry) if entry else None
+        if state == 'COMPLETED':
+            return ee.Image(entry['asset_id'])
+
+        image = build()
+        if self.asset_root and state not in PENDING_STATES:
+            if entry:
+                logger.warning("static layer %s: export %s ended %s; exporting again", name, entry['task_id'], state)
+            asset_id = f"{self.asset_root}/{name}_{key[:16]}"
+            task = ee.batch.Export.image.toAsset(
+                image=image.clip(roi).toByte(), description=f"static_{name}_{key[:8]}",
+                assetId=asset_id, region=roi, scale=params.get('scale', ASSET_SCALE), maxPixels=1e10
+            )
+            start_task(task)
+            self._record(key, name=name, asset_id=asset_id, task_id=task.id, state='READY', checked=time.time(),
+                         created=time.time())
+        return image
+
+    def slope_mask(self, roi, roi_geojson, dem_source=DEM_SOURCE, slope_limit=SLOPE_LIMIT, scale=ASSET_SCALE):
+        """1 where terrain slope is below slope_limit degrees, 0 elsewhere."""
+        def build():
+            return ee.Terrain.slope(ee.Image(dem_source)).lt(slope_limit)
+
+        params = {'dem_source': dem_source, 'slope_limit': slope_limit, 'scale': scale}
+        return self._ee_layer('slope_mask', roi, roi_geojson, params, build)
+
+    def permanent_water(self, roi, roi_geojson, before_filtered, threshold, before_dates, scale=ASSET_SCALE):
+        """Pre-event water (before_filtered < threshold) for one baseline window and threshold."""
+        def build():
+            return before_filtered.lt(threshold)
+
+        params = {'before_dates': list(before_dates), 'threshold': threshold, 'scale': scale}
+        return self._ee_layer('permanent_water', roi, roi_geojson, params, build)
+
+    def local_slope_mask(self, dem_path, grid, workdir, slope_limit=SLOPE_LIMIT, block_size=None):
+        """local_engine.slope_mask backed by a compressed GeoTIFF per DEM file, cutoff and grid."""
+        import rasterio
+        from rasterio import windows
+
+        import local_engine
+
+        block_size = block_size or local_engine.BLOCK_SIZE
+        crs, transform, width, height = grid
+        stat = os.stat(dem_path)
+        key = layer_key(
+            'local_slope_mask', dem=os.path.abspath(dem_path), dem_size=stat.st_size, dem_mtime=stat.st_mtime,
+            slope_limit=slope_limit, crs=crs.to_string() if crs else None,
+            transform=tuple(transform)[:6], width=width, height=height
+        )
+        path = os.path.join(self.root, f"{key}.tif")
+
+        if not os.path.exists(path):
+            mask = local_engine.slope_mask(dem_path, grid, workdir, slope_limit, block_size)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            profile = {
+                'driver': 'GTiff', 'dtype': 'uint8', 'count': 1, 'width': width, 'height': height,
+                'crs': crs, 'transform': transform, 'compress': 'deflate', 'tiled': True,
+                'blockxsize': 256, 'blockysize': 256, 'nbits': 1,
+            }
+            with rasterio.open(tmp, 'w', **profile) as dst:
+                for rows, cols in local_engine.iter_blocks((height, width), block_size):
+                    window = windows.Window(cols.start, rows.start, cols.stop - cols.start, rows.stop - rows.start)
+                    dst.write(np.isfinite(np.asarray(mask.array[rows, cols])).astype(np.uint8), 1, window=window)
+            os.replace(tmp, path)
+            self._record(key, name='local_slope_mask', path=path, created=time.time())
+            return mask
+
+        out = local_engine.scratch((height, width), workdir, 'slope_mask')
+        with rasterio.open(path) as src:
+            for rows, cols in local_engine.iter_blocks((height, width), block_size):
+                window = windows.Window(cols.start, rows.start, cols.stop - cols.start, rows.stop - rows.start)
+                out[rows, cols] = np.where(src.read(1, window=window) == 1, 1, np.nan)
+        return local_engine.LocalRaster(out, transform, crs)
@@ -0,0 +1,229 @@
+"""Synthetic inputs, reference implementations and fakes shared by benchmark.py and the tests."""
+import time
+
+import ee
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import local_engine
+
+
+def bimodal_histogram(buckets, seed=0):
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([rng.normal(-20, 2, 300_000), rng.normal(-9, 2.5, 700_000)])
+    counts, edges = np.histogram(values, bins=buckets)
+    sums, _ = np.histogram(values, bins=edges, weights=values)
+    centres = (edges[:-1] + edges[1:]) / 2
+    means = np.where(counts > 0, sums / np.maximum(counts, 1), centres)
+    return {'histogram': counts.tolist(), 'bucketMeans': means.tolist()}
+
+
+def otsu_threshold_per_bucket(histogram):
+    # The original formulation: one slice-and-sum per candidate split, O(n^2) in buckets.
+    counts = np.asarray(histogram['histogram'], dtype=np.float64)
+    means = np.asarray(histogram['bucketMeans'], dtype=np.float64)
+    total = counts.sum()
+    sum_val = (means * counts).sum()
+    mean = sum_val / total
+
+    bss = np.empty(len(means))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i in range(1, len(means) + 1):
+            a_count = counts[:i].sum()
+            a_mean = (means[:i] * counts[:i]).sum() / a_count
+            b_count = total - a_count
+            b_mean = (sum_val - a_count * a_mean) / b_count
+            bss[i - 1] = a_count * (a_mean - mean) ** 2 + b_count * (b_mean - mean) ** 2
+    return float(means[np.nanargmax(bss)])
+
+
+def ee_otsu_threshold_per_bucket(histogram):
+    # The original Earth Engine formulation: ee.List.map over every split, each slicing and summing.
+    counts = ee.Array(ee.Dictionary(histogram).get('histogram'))
+    means = ee.Array(ee.Dictionary(histogram).get('bucketMeans'))
+    size = means.length().get([0])
+    total = counts.reduce(ee.Reducer.sum(), [0]).get([0])
+    sum_val = means.multiply(counts).reduce(ee.Reducer.sum(), [0]).get([0])
+    mean = sum_val.divide(total)
+    indices = ee.List.sequence(1, size)
+
+    def calculate_bss(i):
+        aCounts = counts.slice(0, 0, i)
+        aCount = aCounts.reduce(ee.Reducer.sum(), [0]).get([0])
+        aMeans = means.slice(0, 0, i)
+        aMean = aMeans.multiply(aCounts).reduce(ee.Reducer.sum(), [0]).get([0]).divide(aCount)
+        bCount = total.subtract(aCount)
+        bMean = sum_val.subtract(aCount.multiply(aMean)).divide(bCount)
+        return aCount.multiply(aMean.subtract(mean).pow(2)).add(bCount.multiply(bMean.subtract(mean).pow(2)))
+
+    bss = indices.map(calculate_bss)
+    return means.sort(bss).get([-1])
+
+
+def jagged_roi(vertices, seed=0):
+    # A jagged ring around the Menofia reach, dense like a digitized river buffer.
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    radius = 0.25 + 0.002 * rng.standard_normal(vertices)
+    ring = np.column_stack([30.9 + radius * np.cos(angles), 30.5 + radius * np.sin(angles)]).tolist()
+    ring.append(ring[0])
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Polygon', 'coordinates': [ring]}}
+    ]}
+
+
+def speckled_scene(out, seed=0):
+    # Land at -8 dB with -20 dB water bands, under 4-look gamma speckle; written block by block.
+    rng = np.random.default_rng(seed)
+    for rows, cols in local_engine.iter_blocks(out.shape):
+        y, x = np.mgrid[rows, cols]
+        water = np.sin(x / 700) + np.cos(y / 500) > 1.2
+        power = 10 ** (np.where(water, -20, -8) / 10) * rng.gamma(4, 1 / 4, water.shape)
+        out[rows, cols] = 10 * np.log10(power)
+    return out
+
+
+def lee_sliding_window(image, radius, sigma_v=local_engine.SIGMA_V):
+    # The previous formulation: three separate (2r+1)^2 strided window sums, O(r^2) per pixel.
+    def box_sum(values):
+        size = 2 * radius + 1
+        return sliding_window_view(np.pad(values, radius), (size, size)).sum(axis=(-2, -1))
+
+    img = np.asarray(image, dtype=np.float32)
+    valid = np.isfinite(img)
+    values = np.where(valid, img, 0).astype(np.float64)
+    count, total, total_sq = box_sum(valid.astype(np.float64)), box_sum(values), box_sum(values * values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance_mean_sq = (total_sq / count - mean * mean) / (mean * mean)
+        b = np.clip((variance_mean_sq - sigma_v) / (variance_mean_sq * (1 + sigma_v)), 0, 1)
+    return np.where(valid, mean + b * (img - mean), np.nan).astype(np.float32)
+
+
+def mask_stack(workdir, size):
+    # Smooth water blobs, a permanent river band and a slope mask with a masked steep margin.
+    stack = {name: local_engine.scratch((size, size), workdir, name)
+             for name in ('water_cleaned', 'permanent_water', 'slope_mask')}
+    for rows, cols in local_engine.iter_blocks((size, size)):
+        y, x = np.mgrid[rows, cols]
+        stack['water_cleaned'][rows, cols] = np.sin(x / 150) * np.cos(y / 230) > 0.8
+        stack['permanent_water'][rows, cols] = np.abs(x - size / 2 - 300 * np.sin(y / 900)) < 60
+        stack['slope_mask'][rows, cols] = np.where(x < size * 0.9, 1, np.nan)
+    return stack
+
+
+def grid_features(bounds, count):
+    west, south, east, north = bounds
+    rows = max(r for r in range(1, int(np.sqrt(count)) + 1) if count % r == 0)
+    cols = count // rows
+    dx, dy = (east - west) / cols, (north - south) / rows
+    features = []
+    for i in range(count):
+        x0, y0 = west + (i % cols) * dx, south + (i // cols) * dy
+        features.append({'type': 'Feature', 'properties': {'name': f"cell_{i}"}, 'geometry': {
+            'type': 'Polygon', 'coordinates': [[[x0, y0], [x0 + dx, y0], [x0 + dx, y0 + dy], [x0, y0 + dy], [x0, y0]]]
+        }})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def flood_polygons(rng, count, bounds):
+    """``count`` random 50-300 m flood polygons (as boxes) inside ``bounds``."""
+    import shapely
+
+    west, south, east, north = bounds
+    x = rng.uniform(west, east, count)
+    y = rng.uniform(south, north, count)
+    half = rng.uniform(25, 150, (2, count)) / 111320
+    return shapely.box(x - half[0], y - half[1], x + half[0], y + half[1])
+
+
+def scene_footprints(rng, count, orbits, t0):
+    scenes = []
+    for i in range(count):
+        orbit = int(rng.integers(orbits))
+        x0, y0 = 29 + orbit * 0.15 + rng.uniform(-1, 1), 29 + rng.uniform(-1.5, 1.5)
+        scenes.append({
+            'id': f"S1_{t0 + i}", 'time': t0 + i, 'orbit': orbit, 'pass': 'ASCENDING' if orbit % 2 else 'DESCENDING',
+            'footprint': {'type': 'Polygon', 'coordinates': [[
+                [x0, y0], [x0 + 2.5, y0 + 0.4], [x0 + 2.2, y0 + 2.1], [x0 - 0.3, y0 + 1.7], [x0, y0]
+            ]]},
+        })
+    return scenes
+
+
+def scene_feed(t0, days, seed=0):
+    """Sentinel-1 passes over the Nile delta: alternating ascending/descending passes about every 1.5
+    days, two frames each, reaching the catalog 1-6 h after acquisition. Returns (scene, ingest_s) pairs."""
+    rng = np.random.default_rng(seed)
+    feed = []
+    for k in range(int(days / 1.5)):
+        orbit_pass, orbit, hour = ('ASCENDING', 58, 16) if k % 2 else ('DESCENDING', 131, 4)
+        acquired = t0 + (int(k * 1.5) + 1) * 86400 + hour * 3600
+        ingest = acquired + rng.uniform(1, 6) * 3600
+        for frame in range(2):
+            scene = {'id': f"S1A_{orbit}_{k:03d}_{frame}", 'time': int((acquired + 25 * frame) * 1000),
+                     'orbit': orbit, 'pass': orbit_pass}
+            feed.append((scene, ingest))
+    return feed
+
+
+class FakeBackend:
+    """Earth Engine stand-in: answers after ``latency`` s, refuses with a 429 beyond ``quota`` concurrent
+    requests and fails ``error_rate`` of the rest with a 503."""
+
+    def __init__(self, latency=0.05, quota=8, error_rate=0.05, seed=0):
+        import random
+        import threading
+
+        self.latency = latency
+        self.quota = quota
+        self.error_rate = error_rate
+        self.calls = 0
+        self._active = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def request(self, key):
+        import fake_ee
+
+        with self._lock:
+            self.calls += 1
+            self._active += 1
+            active, fail = self._active, self._rng.random() < self.error_rate
+        try:
+            if active > self.quota:
+                raise fake_ee.EEException("429 Too Many Requests: quota exceeded")
+            time.sleep(self.latency)
+            if fail:
+                raise fake_ee.EEException("503 Service Unavailable")
+            return {'key': key}
+        finally:
+            with self._lock:
+                self._active -= 1
+
+
+# A scripted Streamlit page run with Earth Engine initialization stubbed out. Prints the cold start, map
+# stack prewarm and median rerun seconds and the errors the page rendered, as one JSON line.
+APP_RUN = """
+import json, statistics, threading, time
+# A running server has Streamlit loaded already; the page's own imports count from here.
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+import ee
+# No credentials offline; initialization is a network round trip the budget does not cover.
+ee.Initialize = lambda *args, **kwargs: None
+app = AppTest.from_file({path!r}, default_timeout=120)
+app.run()
+cold = time.perf_counter() - start
+for thread in threading.enumerate():
+    if thread.name == 'prewarm':
+        thread.join()
+prewarm = time.perf_counter() - start
+reruns = []
+for _ in range(5):
+    start = time.perf_counter()
+    app.run()
+    reruns.append(time.perf_counter() - start)
+print(json.dumps({{'cold': cold, 'prewarm': prewarm, 'rerun': statistics.median(reruns),
+                  'errors': [str(e.value) for e in list(app.exception) + list(app.error)]}}))
+"""
@@ -0,0 +1,21 @@
+import fake_ee
+import flood_core
+from result_cache import ResultCache
+
+import adaptive_threshold
+
+DATES = ('2023-08-01', '2023-08-20', '2023-09-15', '2023-09-25')
+
+
+def test_cached_cell_histograms_give_the_same_threshold(tmp_path):
+    catalog = fake_ee.synthetic_catalog(256)
+    roi_geojson = catalog.roi()
+    with fake_ee.use_fake_ee(catalog, modules=('flood_core', 'adaptive_threshold', 'ee_client')):
+        before = flood_core.run_flood_analysis(fake_ee.Geometry(roi_geojson), *DATES)['before_filtered']
+        cache = ResultCache(str(tmp_path))
+        cold = adaptive_threshold.adaptive_threshold(before, roi_geojson, DATES[:2], cache, cell_size_m=500)
+        cached = adaptive_threshold.adaptive_threshold(before, roi_geojson, DATES[:2], cache, cell_size_m=500)
+
+    assert not cold['cached'] and cached['cached']
+    assert cached['threshold'] == cold['threshold']
+    assert -21 < cold['threshold'] < -8
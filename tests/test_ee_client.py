@@ -0,0 +1,37 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import ee_client
+from synthetic import FakeBackend
+
+
+def test_sessions_survive_transient_errors(caplog):
+    caplog.set_level(logging.ERROR, logger='ee_client')
+    backend = FakeBackend(latency=0.005, quota=4, error_rate=0.3)
+    client = ee_client.EEClient(rate=1000, burst=4, max_workers=4, backoff=0.001)
+    keys = [[f"shared-{j}" for j in range(3)] + [f"session{i}-{j}" for j in range(3)] for i in range(6)]
+
+    def session(session_keys):
+        futures = [client.submit(partial(backend.request, key), key=key) for key in session_keys]
+        return [f.result()['key'] for f in futures]
+
+    with ThreadPoolExecutor(max_workers=len(keys)) as executor:
+        assert list(executor.map(session, keys)) == keys
+    assert client.stats().get('retries', 0) > 0
+
+
+def test_call_goes_through_the_shared_client(monkeypatch):
+    client = ee_client.EEClient(rate=1000, backoff=0.001)
+    monkeypatch.setattr(ee_client, 'get_client', lambda: client)
+    attempts = []
+
+    def flaky(a, b=0):
+        attempts.append((a, b))
+        if len(attempts) == 1:
+            raise ConnectionError('connection reset')
+        return a + b
+
+    assert ee_client.call(flaky, 1, b=2) == 3
+    assert attempts == [(1, 2), (1, 2)]
+    assert client.stats()['requests'] == 1 and client.stats()['retries'] == 1
@@ -0,0 +1,152 @@
+import threading
+
+import pytest
+
+import export_manager
+from export_manager import ExportManager
+
+
+class FakeTask:
+    """Stands in for an ee.batch.Task; status() walks through the given states."""
+
+    def __init__(self, task_id, statuses=({'state': 'READY'},)):
+        self.id = task_id
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def status(self):
+        status = self.statuses[min(self.calls, len(self.statuses) - 1)]
+        self.calls += 1
+        return dict(status, id=self.id)
+
+
+class RecordingEvent:
+    """A stop event whose wait() records the poll interval instead of sleeping."""
+
+    def __init__(self):
+        self.waits = []
+
+    def is_set(self):
+        return False
+
+    def clear(self):
+        pass
+
+    def set(self):
+        pass
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        return False
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = ExportManager(str(tmp_path / 'exports.json'), status_fn=_no_status)
+    manager.start_polling = lambda: None
+    return manager
+
+
+def _no_status(task_id):
+    raise AssertionError(f"unexpected status_fn call for {task_id}")
+
+
+def test_submit_dedupes_pending_and_completed(manager):
+    started = []
+
+    def start():
+        started.append(FakeTask(f"T{len(started)}"))
+        return started[-1]
+
+    entry, was_started = manager.submit('k', start, 'flood')
+    assert was_started and entry['task_id'] == 'T0' and entry['state'] == 'READY'
+    entry, was_started = manager.submit('k', start, 'flood')
+    assert not was_started and entry['task_id'] == 'T0'
+
+    manager._entries['k']['state'] = 'COMPLETED'
+    assert manager.submit('k', start, 'flood')[1] is False
+    assert len(started) == 1
+
+
+@pytest.mark.parametrize('state', sorted(export_manager.RETRYABLE_STATES))
+def test_submit_restarts_failed_and_cancelled(manager, state):
+    manager.submit('k', lambda: FakeTask('T0'), 'flood')
+    manager._entries['k']['state'] = state
+    entry, started = manager.submit('k', lambda: FakeTask('T1'), 'flood')
+    assert started and entry['task_id'] == 'T1' and entry['state'] == 'READY'
+
+
+def test_submit_starts_task_outside_the_lock(manager):
+    seen = {}
+
+    def start():
+        # Another caller must not block on the lock while this task is starting, and must not start it twice.
+        def other():
+            seen['entries'] = manager.entries()
+            seen['submit'] = manager.submit('k', lambda: FakeTask('duplicate'), 'flood')
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+        return FakeTask('T0')
+
+    entry, started = manager.submit('k', start, 'flood')
+    assert started and entry['task_id'] == 'T0'
+    assert seen['entries'] == []
+    reserved, duplicate_started = seen['submit']
+    assert not duplicate_started and reserved['state'] == 'SUBMITTING'
+
+
+def test_failed_start_releases_the_reservation(manager):
+    def start():
+        raise RuntimeError('quota')
+
+    with pytest.raises(RuntimeError):
+        manager.submit('k', start, 'flood')
+    assert manager.submit('k', lambda: FakeTask('T0'), 'flood')[1] is True
+
+
+def test_registry_persists_and_reloads(manager):
+    manager.submit('k', lambda: FakeTask('T0'), 'flood', kind='image')
+    statuses = {'T0': {'state': 'RUNNING', 'progress': 0.5}}
+    reloaded = ExportManager(manager.registry_path, status_fn=lambda task_id: statuses[task_id])
+
+    assert [(e['key'], e['task_id'], e['kind']) for e in reloaded.entries()] == [('k', 'T0', 'image')]
+    assert reloaded.submit('k', lambda: FakeTask('T1'), 'flood')[1] is False
+    # Tasks from an earlier process are polled through status_fn.
+    assert reloaded.poll_once()
+    assert reloaded.entries()[0]['state'] == 'RUNNING' and reloaded.entries()[0]['progress'] == 0.5
+    assert ExportManager(manager.registry_path).entries()[0]['state'] == 'RUNNING'
+
+
+def test_poll_backs_off_until_done(manager):
+    running = {'state': 'RUNNING', 'progress': 0.1}
+    task = FakeTask('T0', [running, running, running, running, {'state': 'COMPLETED'}])
+    manager.submit('k', lambda: task, 'flood')
+    manager.poll_interval, manager.max_poll_interval = 1, 4
+    manager._stop = RecordingEvent()
+
+    manager._poll_loop()
+
+    # Changed, then unchanged three times (doubling, capped), then completed: the loop exits.
+    assert manager._stop.waits == [1, 2, 4, 4]
+    entry = manager.entries()[0]
+    assert entry['state'] == 'COMPLETED' and entry['progress'] == 1.0
+    assert not manager.active()
+
+
+def test_status_polls_go_through_ee_client(manager, monkeypatch):
+    import ee_client
+
+    calls = []
+
+    def call(fn, *args, **kwargs):
+        calls.append(fn)
+        return fn(*args, **kwargs)
+
+    monkeypatch.setattr(ee_client, 'call', call)
+    task = FakeTask('T0', [{'state': 'RUNNING', 'progress': 0.5}])
+    manager.submit('k', lambda: task, 'flood')
+    manager.poll_once()
+    assert calls == [task.status]
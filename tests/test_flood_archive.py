@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+import flood_archive
+from synthetic import flood_polygons
+
+shapely = pytest.importorskip('shapely')
+pytest.importorskip('pyarrow')
+
+
+def test_indexed_bbox_query_matches_full_scan(tmp_path):
+    rng = np.random.default_rng(0)
+    archive = flood_archive.FloodArchive(str(tmp_path))
+    for i in range(20):
+        archive.ingest(f"event_{i:02d}", f"2020-01-{i + 1:02d}", flood_polygons(rng, 50, (30.7, 30.3, 31.2, 30.8)))
+    index = archive.load()
+    box = (30.9, 30.4, 31.0, 30.5)
+
+    hits = index.query(box)
+    expected = np.flatnonzero(shapely.intersects(shapely.from_wkb(index._wkb), shapely.box(*box)))
+    assert len(hits) > 0
+    np.testing.assert_array_equal(np.sort(hits), expected)
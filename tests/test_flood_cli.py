@@ -0,0 +1,93 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+import flood_cli
+import flood_core
+
+ROI = {'type': 'Polygon', 'coordinates': [[[31.0, 30.0], [31.1, 30.0], [31.1, 30.1], [31.0, 30.0]]]}
+DATES = {'before_start': '2023-08-01', 'before_end': '2023-08-20',
+         'after_start': '2023-09-15', 'after_end': '2023-09-25'}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def run_cached_analysis(roi, roi_geojson, dates, **kwargs):
+        calls.append(kwargs)
+        return {'threshold': -15.0, 'flood_area': 1e6, 'roi_area': 1e8}, None
+
+    monkeypatch.setattr(flood_core, 'geojson_to_ee_geometry', lambda geojson: geojson)
+    monkeypatch.setattr(flood_core, 'run_cached_analysis', run_cached_analysis)
+    return calls
+
+
+@pytest.mark.parametrize('value, expected', [
+    (False, False), ('false', False), ('0', False), (True, True), ('yes', True), ('', True), (None, True),
+])
+def test_plan_scenes_flag(calls, value, expected):
+    job = dict(DATES, id='a', roi=ROI)
+    if value is not None:
+        job['plan_scenes'] = value
+    flood_cli.run_job(job, '.')
+    assert calls[0]['plan_scenes'] is expected
+
+
+def test_manifest_plan_scenes_false(calls, tmp_path):
+    path = tmp_path / 'jobs.json'
+    path.write_text(json.dumps([dict(DATES, roi=ROI, plan_scenes=False), dict(DATES, roi=ROI)]))
+    output = io.StringIO()
+
+    assert flood_cli.run_manifest(flood_cli.load_manifest(str(path)), output, str(tmp_path), workers=1) == 0
+    records = {r['id']: r for r in map(json.loads, output.getvalue().splitlines())}
+    assert set(records) == {'0', '1'} and all(r['status'] == 'ok' for r in records.values())
+    assert sorted(call['plan_scenes'] for call in calls) == [False, True]
+
+
+def _write_scene(path, levels):
+    # Columns in bands of -22 (open water), -15 (shallow water) and -7 dB (land), with mild speckle.
+    rasterio = pytest.importorskip('rasterio')
+    from affine import Affine
+
+    rng = np.random.default_rng(len(levels))
+    values = np.repeat(np.asarray(levels, dtype=np.float32), 200 // len(levels))[None, :].repeat(200, axis=0)
+    values = values + rng.normal(0, 0.5, values.shape).astype(np.float32)
+    profile = dict(driver='GTiff', width=200, height=200, count=1, dtype='float32', crs='EPSG:4326',
+                   transform=Affine(0.0003, 0, 31.0, 0, -0.0003, 30.06))
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(values, 1)
+
+
+def test_local_backend_jobs_skip_earth_engine(tmp_path, monkeypatch):
+    _write_scene(tmp_path / 'before.tif', [-22, -7, -15, -7, -7, -7, -7, -7])
+    _write_scene(tmp_path / 'after.tif', [-22, -22, -15, -15, -7, -7, -7, -7])
+    roi = {'type': 'Polygon', 'coordinates': [[[31.0, 30.0], [31.06, 30.0], [31.06, 30.06], [31.0, 30.06],
+                                                [31.0, 30.0]]]}
+    (tmp_path / 'roi.geojson').write_text(json.dumps(roi))
+    local = {'roi': 'roi.geojson', 'before_paths': ['before.tif'], 'after_paths': 'after.tif'}
+    (tmp_path / 'jobs.json').write_text(json.dumps([
+        dict(local, id='global'), dict(local, id='multi', threshold_mode='multi'),
+    ]))
+    monkeypatch.setattr(flood_core, 'initialize', lambda **kwargs: pytest.fail("Earth Engine initialized"))
+
+    output = tmp_path / 'results.jsonl'
+    assert flood_cli.main([str(tmp_path / 'jobs.json'), '--backend', 'local', '-o', str(output)]) == 0
+    records = {r['id']: r for r in map(json.loads, output.read_text().splitlines())}
+    single, multi = records['global'], records['multi']
+    assert single['status'] == multi['status'] == 'ok' and single['shallow_area_km2'] is None
+    # An eighth of the ROI turns to open water and another eighth to shallow water, which the global
+    # threshold counts as flood too.
+    assert single['flood_area_km2'] == pytest.approx(single['roi_area_km2'] / 4, rel=0.1)
+    assert multi['threshold'] < -15 < multi['shallow_threshold'] < -7
+    assert multi['flood_area_km2'] == pytest.approx(single['roi_area_km2'] / 8, rel=0.1)
+    assert multi['shallow_area_km2'] == pytest.approx(single['roi_area_km2'] / 8, rel=0.1)
+
+
+def test_local_jobs_need_tile_paths(tmp_path):
+    path = tmp_path / 'jobs.csv'
+    path.write_text('roi,backend,before_paths\nroi.geojson,local,a.tif;b.tif\n')
+    with pytest.raises(ValueError, match='after_paths'):
+        flood_cli.load_manifest(str(path))
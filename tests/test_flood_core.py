@@ -0,0 +1,227 @@
+import logging
+import threading
+
+import numpy as np
+import pytest
+
+import ee_client
+import fake_ee
+import flood_core
+from result_cache import ResultCache
+from static_layers import StaticLayerStore
+from synthetic import bimodal_histogram, ee_otsu_threshold_per_bucket, grid_features, otsu_threshold_per_bucket
+
+DATES = ('2023-08-01', '2023-08-20', '2023-09-15', '2023-09-25')
+FAKE_EE_MODULES = ('flood_core', 'ee_client', 'static_layers')
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return fake_ee.synthetic_catalog(256)
+
+
+def _roi_geojson(catalog):
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {}, 'geometry': catalog.roi()}
+    ]}
+
+
+def test_pipeline_finds_the_synthetic_flood(catalog):
+    with fake_ee.use_fake_ee(catalog):
+        stats = flood_core.run_flood_analysis(fake_ee.Geometry(catalog.roi()), *DATES)['stats'].getInfo()
+    assert -21 < stats['threshold'] < -8
+    assert 0 < stats['flood_area'] < stats['roi_area']
+
+
+def test_feature_areas_sum_to_the_whole_roi(catalog, tmp_path):
+    ring = catalog.roi()['coordinates'][0]
+    roi_geojson = grid_features((ring[0][0], ring[0][1], ring[2][0], ring[2][1]), 16)
+    with fake_ee.use_fake_ee(catalog):
+        whole = flood_core.run_flood_analysis(fake_ee.Geometry(catalog.roi()), *DATES)['stats'].getInfo()
+        _, _, features = flood_core.run_multi_roi_analysis(
+            roi_geojson, DATES, plan_scenes=False, max_workers=1, cache=ResultCache(str(tmp_path))
+        )
+    assert len(features) == 16
+    total = sum(f['properties']['flood_area_km2'] for f in features)
+    assert total == pytest.approx(whole['flood_area'] / 1e6, rel=0.05)
+
+
+def _west_water_catalog(size=256, seed=0):
+    """The synthetic catalog with water only in the western fifth: a channel and, after the event, a flood
+    spreading east of it. The speckle is 16-look, so tiles further east hold nothing near -14.5 dB."""
+    import numpy as np
+
+    catalog = fake_ee.synthetic_catalog(size, seed)
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size]
+    channel = x < size / 10
+    flood = (x < size / 5) & (np.abs(y - size / 2) < size / 4) & ~channel
+
+    def scene(water):
+        power = 10 ** (np.where(water, -21.0, -8.0) / 10) * rng.gamma(16, 1 / 16, water.shape)
+        return 10 * np.log10(power)
+
+    entries = catalog.collections[fake_ee.S1_COLLECTION]
+    for i, (_, image) in enumerate(entries):
+        image.bands['VV'] = scene(channel | flood if i == len(entries) - 1 else channel)
+    return catalog
+
+
+def _tiled_reference(catalog, threshold, tile_size_m):
+    return flood_core.run_tiled_flood_analysis(
+        _roi_geojson(catalog), *DATES, tile_size_m=tile_size_m, max_workers=1, threshold=threshold
+    )['stats'].getInfo()
+
+
+def test_progressive_matches_full_resolution(catalog):
+    previews = []
+    with fake_ee.use_fake_ee(catalog):
+        results = flood_core.run_progressive_analysis(
+            _roi_geojson(catalog), *DATES, coarse_scale=90, tile_size_m=500, max_workers=1, on_preview=previews.append
+        )
+        stats = results['stats'].getInfo()
+        reference = _tiled_reference(catalog, stats['threshold'], 500)
+
+    assert len(previews) == 1
+    preview, report = previews[0], results['progressive']
+    assert preview['scale'] == 90 and preview['flood_area'] > 0
+    assert report['coarse_flood_area'] == preview['flood_area']
+    assert report['first_seconds'] <= report['final_seconds']
+    assert 0 < report['refined'] <= report['tiles']
+    assert stats['flood_area'] == pytest.approx(reference['flood_area'], abs=report['bound'] + 1e-6)
+
+
+def test_progressive_skips_tiles_far_from_water():
+    catalog = _west_water_catalog()
+    with fake_ee.use_fake_ee(catalog):
+        results = flood_core.run_progressive_analysis(
+            _roi_geojson(catalog), *DATES, coarse_scale=90, tile_size_m=500, max_workers=1, threshold=-14.5
+        )
+        stats = results['stats'].getInfo()
+        reference = _tiled_reference(catalog, -14.5, 500)
+
+    report = results['progressive']
+    assert report['refined'] < report['tiles'] / 2
+    assert stats['flood_area'] > 0
+    assert stats['flood_area'] == pytest.approx(reference['flood_area'], abs=report['bound'] + 1e-6)
+
+
+def _padded_histogram(buckets):
+    # Empty buckets at both ends: the first and last splits leave one class empty.
+    histogram = bimodal_histogram(buckets - 20)
+    step = histogram['bucketMeans'][1] - histogram['bucketMeans'][0]
+    low = [histogram['bucketMeans'][0] - step * (10 - i) for i in range(10)]
+    high = [histogram['bucketMeans'][-1] + step * (i + 1) for i in range(10)]
+    return {'histogram': [0] * 10 + histogram['histogram'] + [0] * 10,
+            'bucketMeans': low + histogram['bucketMeans'] + high}
+
+
+@pytest.mark.parametrize('buckets', [255, 1024, 4096])
+@pytest.mark.parametrize('make_histogram', [bimodal_histogram, _padded_histogram])
+def test_otsu_matches_per_bucket_earth_engine_formulation(catalog, buckets, make_histogram):
+    histogram = make_histogram(buckets)
+    with fake_ee.use_fake_ee(catalog, modules=('flood_core', 'synthetic')):
+        threshold = flood_core.otsu_threshold(histogram).getInfo()
+        reference = ee_otsu_threshold_per_bucket(histogram).getInfo()
+    assert threshold == reference
+    assert threshold == otsu_threshold_per_bucket(histogram)
+
+
+def test_multi_otsu_splits_open_and_shallow_water(catalog):
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.normal(-22, 1, 30_000), rng.normal(-15, 1, 20_000), rng.normal(-7, 1, 50_000)])
+
+    def histogram(buckets):
+        counts, edges = np.histogram(values, bins=buckets)
+        sums, _ = np.histogram(values, bins=edges, weights=values)
+        means = np.where(counts > 0, sums / np.maximum(counts, 1), (edges[:-1] + edges[1:]) / 2)
+        return {'histogram': counts.tolist(), 'bucketMeans': means.tolist()}
+
+    with fake_ee.use_fake_ee(catalog):
+        low, high = flood_core.multi_otsu_threshold(histogram(4096)).getInfo()
+        merged = flood_core.multi_otsu_threshold(histogram(1024)).getInfo()
+        exact = flood_core.multi_otsu_threshold(histogram(1024), max_splits=1024).getInfo()
+    assert -20 < low < -17 and -13 < high < -9
+    assert merged == pytest.approx(exact, abs=0.2)
+
+
+def _fake_stores(monkeypatch, tmp_path):
+    monkeypatch.setattr(flood_core, 'get_result_cache', lambda: ResultCache(str(tmp_path / 'results')))
+    monkeypatch.setattr(flood_core, 'get_static_store',
+                        lambda: StaticLayerStore(str(tmp_path / 'static'), asset_root=''))
+
+
+def test_multi_threshold_mode_reports_shallow_water(catalog, tmp_path, monkeypatch):
+    _fake_stores(monkeypatch, tmp_path)
+    with fake_ee.use_fake_ee(catalog, modules=FAKE_EE_MODULES):
+        roi = fake_ee.Geometry(catalog.roi())
+        stats, images = flood_core.run_cached_analysis(
+            roi, _roi_geojson(catalog), DATES, plan_scenes=False, threshold_mode='multi'
+        )
+        overlap = images['shallow_mask'].And(images['flood_mask']).reduceRegion(
+            fake_ee.Reducer.sum(), roi
+        ).getInfo()
+    assert stats['threshold'] < stats['shallow_threshold']
+    assert 0 <= stats['shallow_area'] < stats['roi_area']
+    assert overlap['VV'] == 0
+
+
+def test_extending_the_time_series_evaluates_only_new_dates(tmp_path, monkeypatch):
+    catalog = fake_ee.synthetic_catalog(128, after_dates=('2023-09-10', '2023-09-18', '2023-09-26'))
+    _fake_stores(monkeypatch, tmp_path)
+    built, evaluated = [], []
+    detect_flood, get_info = flood_core.detect_flood, flood_core.get_info
+    monkeypatch.setattr(flood_core, 'detect_flood', lambda *args: built.append(args) or detect_flood(*args))
+    monkeypatch.setattr(flood_core, 'get_info', lambda obj: evaluated.append(get_info(obj)) or evaluated[-1])
+
+    def series(end):
+        built.clear()
+        evaluated.clear()
+        with fake_ee.use_fake_ee(catalog, modules=FAKE_EE_MODULES):
+            return flood_core.run_flood_time_series(
+                fake_ee.Geometry(catalog.roi()), catalog.roi(), '2023-08-01', '2023-08-20', '2023-09-01', end,
+                plan_scenes=False
+            )
+
+    first = series('2023-09-15')
+    assert len(built) == 1
+    extended = series('2023-09-30')
+    assert len(built) == 2
+    # Only the day list and the new days' areas are fetched; the baseline and 09-10 come from the cache.
+    assert len(evaluated) == 2 and sorted(evaluated[-1]) == ['2023-09-18', '2023-09-26']
+    assert extended['table']['cached'].tolist() == [True, False, False]
+    assert extended['table']['flood_area_km2'][0] == first['table']['flood_area_km2'][0] > 0
+    assert extended['threshold'] == first['threshold']
+
+
+@pytest.mark.parametrize('profile', [False, True])
+def test_one_server_evaluation_per_analysis(catalog, tmp_path, monkeypatch, caplog, profile):
+    _fake_stores(monkeypatch, tmp_path)
+    if profile:
+        caplog.set_level(logging.DEBUG, logger='flood_core')
+    client = ee_client.EEClient(rate=1000, backoff=0.001)
+    monkeypatch.setattr(ee_client, 'get_client', lambda: client)
+    evaluations = []
+    get_info = fake_ee.Computed.getInfo
+    monkeypatch.setattr(fake_ee.Computed, 'getInfo', lambda self: evaluations.append(self) or get_info(self))
+
+    with fake_ee.use_fake_ee(catalog, modules=FAKE_EE_MODULES):
+        roi = fake_ee.Geometry(catalog.roi())
+        stats, _ = flood_core.run_cached_analysis(roi, _roi_geojson(catalog), DATES, plan_scenes=False)
+        assert len(evaluations) == 1 and client.stats()['requests'] == 1
+        assert flood_core.run_cached_analysis(roi, _roi_geojson(catalog), DATES, plan_scenes=False)[0] == stats
+    assert len(evaluations) == 1 and client.stats()['requests'] == 1
+    assert ('server profile' in caplog.text) == profile
+
+
+def test_stats_callback_goes_through_the_client(catalog, monkeypatch):
+    client = ee_client.EEClient(rate=1000, backoff=0.001)
+    monkeypatch.setattr(ee_client, 'get_client', lambda: client)
+    arrived, done = [], threading.Event()
+    with fake_ee.use_fake_ee(catalog):
+        results = flood_core.run_flood_analysis(fake_ee.Geometry(catalog.roi()), *DATES)
+        flood_core.fetch_stats(results, callback=lambda stats, error: arrived.append((stats, error)) or done.set())
+        assert done.wait(10)
+        expected = results['stats'].getInfo()
+    assert arrived == [(expected, None)]
+    assert client.stats()['requests'] == 1
@@ -0,0 +1,115 @@
+import logging
+import re
+import threading
+import types
+
+import ee
+import pytest
+
+import ee_client
+import instrumentation
+from instrumentation import stage, track_run
+
+
+@pytest.fixture
+def cloud_calls(monkeypatch):
+    """Stub ee.data._execute_cloud_call under a fresh hook; returns the calls it received."""
+    calls = []
+
+    def execute(call, num_retries=None):
+        calls.append(call)
+        return {'result': 'x' * 10}
+
+    monkeypatch.setattr(ee.data, '_execute_cloud_call', execute)
+    monkeypatch.setattr(instrumentation, '_hooked', False)
+    instrumentation.install_ee_hook()
+    return calls
+
+
+def _request(body):
+    return ee.data._execute_cloud_call(types.SimpleNamespace(body=body))
+
+
+def test_stage_times_and_counts_calls(cloud_calls, monkeypatch):
+    ticks = iter(range(100))
+    monkeypatch.setattr(instrumentation.time, 'perf_counter', lambda: float(next(ticks)))
+    with track_run('test') as metrics:
+        _request('abcd')
+        with stage('outer'):
+            _request('ab')
+            with stage('inner'):
+                _request('a')
+                _request('a')
+    outer, inner = metrics.stages
+    assert (outer['stage'], outer['parent'], inner['stage'], inner['parent']) == ('outer', None, 'inner', 'outer')
+    assert outer['ee_calls'] == 1 and outer['request_bytes'] == 2
+    assert inner['ee_calls'] == 2 and inner['request_bytes'] == 2
+    assert metrics.outside['ee_calls'] == 1 and metrics.outside['request_bytes'] == 4
+    assert inner['response_bytes'] == 2 * len('{"result": "xxxxxxxxxx"}')
+    assert metrics.totals()['ee_calls'] == 4 == len(cloud_calls)
+    assert 0 < inner['seconds'] < outer['seconds'] < metrics.seconds
+
+
+def test_concurrent_runs_count_their_own_calls(cloud_calls):
+    client = ee_client.EEClient(rate=1000, backoff=0.001)
+    barrier = threading.Barrier(2)
+    runs = {}
+
+    def session(name, calls):
+        with track_run(name) as metrics, stage('work'):
+            barrier.wait()
+            for _ in range(calls):
+                client.call(lambda: _request('{}'))
+        runs[name] = metrics
+
+    threads = [threading.Thread(target=session, args=(f'run{n}', n)) for n in (2, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [runs[name].by_stage()[0]['ee_calls'] for name in ('run2', 'run5')] == [2, 5]
+    assert len(cloud_calls) == 7
+
+
+def test_calls_outside_a_run_are_not_recorded(cloud_calls):
+    _request('{}')
+    with stage('orphan') as record:
+        _request('{}')
+    assert record is None and len(cloud_calls) == 2
+
+
+def test_missing_hook_target_warns_once(monkeypatch, caplog):
+    monkeypatch.delattr(ee.data, '_execute_cloud_call')
+    monkeypatch.setattr(instrumentation, '_hooked', False)
+    with caplog.at_level(logging.WARNING, logger='instrumentation'):
+        instrumentation.install_ee_hook()
+        with track_run('unhooked') as metrics, stage('work'):
+            pass
+    assert caplog.text.count('_execute_cloud_call not found') == 1
+    assert metrics.totals()['ee_calls'] == 0 and metrics.seconds is not None
+
+
+def test_prometheus_text_format(cloud_calls, tmp_path):
+    runs = []
+    for name, tiles in (('single', 1), ('tiled', 3)):
+        with track_run(name) as metrics:
+            for _ in range(tiles):
+                with stage('tile'):
+                    _request('{}')
+        runs.append(metrics)
+    path = tmp_path / 'metrics' / 'flood.prom'
+    instrumentation.write_prometheus(str(path), runs)
+
+    lines = path.read_text().splitlines()
+    samples = {}
+    for i, line in enumerate(lines):
+        if line.startswith('# HELP '):
+            assert lines[i + 1] == f"# TYPE {line.split()[2]} gauge"
+        elif not line.startswith('# TYPE '):
+            match = re.fullmatch(r'([a-z_]+)\{((?:[a-z]+="[^"]*",?)+)\} (\S+)', line)
+            assert match, line
+            samples[(match.group(1), match.group(2))] = float(match.group(3))
+    assert samples[('flood_stage_ee_calls', 'run="tiled",stage="tile"')] == 3
+    assert samples[('flood_stage_ee_calls', 'run="single",stage="tile"')] == 1
+    assert samples[('flood_run_ee_calls', 'run="tiled"')] == 3
+    assert not list(path.parent.glob('*.tmp'))
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+import local_engine
+from synthetic import bimodal_histogram, lee_sliding_window, otsu_threshold_per_bucket, speckled_scene
+
+
+@pytest.mark.parametrize('buckets', [255, 1024, 4096])
+def test_otsu_matches_per_bucket_formulation(buckets):
+    histogram = bimodal_histogram(buckets)
+    assert local_engine.otsu_threshold(histogram) == otsu_threshold_per_bucket(histogram)
+
+
+def test_multi_otsu_thresholds_are_ordered():
+    low, high = local_engine.multi_otsu_threshold(bimodal_histogram(1024))
+    assert low < high
+
+
+@pytest.mark.parametrize('window', [3, 5, 7, 9])
+def test_summed_area_lee_matches_sliding_window(window):
+    scene = speckled_scene(np.empty((300, 300), dtype=np.float32))
+    scene[:5, :7] = np.nan
+    radius = window // 2
+    np.testing.assert_allclose(local_engine.refined_lee_filter(scene, radius), lee_sliding_window(scene, radius),
+                               atol=1e-4, equal_nan=True)
@@ -0,0 +1,91 @@
+import json
+import sys
+import types
+
+import pytest
+
+import ee_client
+import map_layers
+from map_layers import Layer, TileUrlCache, add_layers
+
+
+class FakeMap:
+    def __init__(self):
+        self.layers = []
+
+    def add_tile_layer(self, url, name, attribution, opacity=1.0, shown=True):
+        self.layers.append((name, url, opacity))
+
+
+@pytest.fixture
+def map_ids(monkeypatch):
+    """Stub ee with JSON-serializable graphs; returns the list of getMapId requests."""
+    requests = []
+
+    class Image:
+        def __init__(self, graph):
+            self.graph = graph
+
+        def getMapId(self, vis_params):
+            requests.append((self.graph, vis_params))
+            fetcher = types.SimpleNamespace(url_format=f'https://tiles/{len(requests)}/{{z}}/{{x}}/{{y}}')
+            return {'tile_fetcher': fetcher}
+
+    serializer = types.SimpleNamespace(toJSON=lambda obj: json.dumps(obj, sort_keys=True))
+    monkeypatch.setitem(sys.modules, 'ee', types.SimpleNamespace(Image=Image, serializer=serializer))
+    client = ee_client.EEClient(rate=1000, backoff=0.001)
+    monkeypatch.setattr(ee_client, 'get_client', lambda: client)
+    return requests
+
+
+def test_keyed_on_graph_and_vis_params(map_ids):
+    cache = TileUrlCache()
+    vis = {'min': 0, 'max': 1}
+    url = cache.tile_url({'band': 'VV'}, vis)
+    assert cache.tile_url({'band': 'VV'}, dict(vis)) == url
+    assert cache.tile_url({'band': 'VH'}, vis) != url
+    assert cache.tile_url({'band': 'VV'}, {'min': 0, 'max': 2}) != url
+    assert len(map_ids) == 3
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'entries': 3}
+
+
+def test_entries_expire_after_ttl(map_ids, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(map_layers, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    cache = TileUrlCache(ttl=60)
+    first = cache.tile_url({'band': 'VV'}, {})
+    now[0] += 59
+    assert cache.tile_url({'band': 'VV'}, {}) == first
+    now[0] += 2
+    assert cache.tile_url({'band': 'VV'}, {}) != first
+    assert len(map_ids) == 2
+
+
+def test_least_recently_used_entry_is_evicted(map_ids):
+    cache = TileUrlCache(max_entries=2)
+    cache.tile_url({'id': 1}, {})
+    cache.tile_url({'id': 2}, {})
+    cache.tile_url({'id': 1}, {})
+    cache.tile_url({'id': 3}, {})
+    assert cache.stats()['entries'] == 2
+    cache.tile_url({'id': 1}, {})
+    cache.tile_url({'id': 2}, {})
+    assert [graph['id'] for graph, _ in map_ids] == [1, 2, 3, 2]
+
+
+def test_add_layers_requests_only_selected(map_ids):
+    layers = [
+        Layer('Before', {'id': 'before'}, {'min': -25, 'max': 0}, True),
+        Layer('After', {'id': 'after'}, {'min': -25, 'max': 0}, False),
+        Layer('Flood', {'id': 'flood'}, {'palette': ['blue'], 'opacity': 0.6}, True),
+    ]
+    m = FakeMap()
+    add_layers(m, layers, TileUrlCache())
+    assert [name for name, _, _ in m.layers] == ['Before', 'Flood']
+    assert m.layers[1][2] == 0.6
+    assert map_ids[1] == ({'id': 'flood'}, {'palette': ['blue']})
+
+    m = FakeMap()
+    add_layers(m, layers, TileUrlCache(), selected={'After'})
+    assert [name for name, _, _ in m.layers] == ['After']
+    assert [graph['id'] for graph, _ in map_ids] == ['before', 'flood', 'after']
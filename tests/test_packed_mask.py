@@ -0,0 +1,25 @@
+import json
+
+import numpy as np
+
+import local_engine
+import packed_mask
+from synthetic import mask_stack
+
+
+def test_packed_flood_and_polygons_match_dense(tmp_path):
+    size = 1000
+    stack = mask_stack(str(tmp_path), size)
+    packed = {name: packed_mask.PackedMask.from_raster(local_engine.LocalRaster(array, None, None))
+              for name, array in stack.items()}
+    water, permanent, slope = (np.asarray(stack[name]) for name in ('water_cleaned', 'permanent_water', 'slope_mask'))
+    dense_count = int(((water == 1) & np.isfinite(slope) & (permanent == 0)).sum())
+    assert dense_count > 0
+
+    flood = packed['water_cleaned'].updateMask(packed['slope_mask']).And(packed['permanent_water'].Not())
+    assert flood.count() == dense_count
+
+    path = tmp_path / 'flood.geojson'
+    packed_mask.write_polygons(flood, str(path))
+    with open(path) as f:
+        assert sum(feature['properties']['count'] for feature in json.load(f)['features']) == dense_count
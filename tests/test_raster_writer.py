@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import local_engine
+import raster_writer
+
+rasterio = pytest.importorskip('rasterio')
+
+
+@pytest.fixture
+def raster(tmp_path):
+    from affine import Affine
+
+    rng = np.random.default_rng(0)
+    array = local_engine.scratch((700, 900), str(tmp_path), 'sar')
+    array[:] = rng.normal(-12, 4, array.shape).round(1)
+    array[:10, :10] = np.nan
+    array.flush()
+    return local_engine.LocalRaster(array, Affine(0.0001, 0, 30.5, 0, -0.0001, 30.9), 'EPSG:4326')
+
+
+def _assert_reads_back(path, raster):
+    with rasterio.open(path) as src:
+        assert src.transform.almost_equals(raster.transform)
+        np.testing.assert_array_equal(src.read(1), np.asarray(raster.array))
+
+
+def test_cog_reads_back(tmp_path, raster):
+    path = str(tmp_path / 'sar.tif')
+    raster_writer.write_cog(raster, path, chunk_size=256, max_workers=2)
+    _assert_reads_back(path, raster)
+    with rasterio.open(path) as src:
+        assert src.block_shapes == [(256, 256)] and src.compression.name == 'deflate'
+        assert src.overviews(1) == [2, 4]
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_zarr_reads_back(tmp_path, raster):
+    store = str(tmp_path / 'sar.zarr')
+    raster_writer.write_zarr(raster, store, 'sar', chunk_size=256, max_workers=2)
+    _assert_reads_back(f'ZARR:"{store}":/sar', raster)
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache, analysis_key
+
+DATES = ('2023-08-01', '2023-08-20', '2023-09-15', '2023-09-25')
+RING = [[30.9, 30.4], [31.0, 30.4], [31.0, 30.5], [30.9, 30.5], [30.9, 30.4]]
+HOLE = [[30.93, 30.43], [30.93, 30.46], [30.96, 30.46], [30.96, 30.43], [30.93, 30.43]]
+
+
+def _polygon(*rings):
+    return {'type': 'Polygon', 'coordinates': [list(r) for r in rings]}
+
+
+def _key(geometry):
+    return analysis_key(geometry, DATES, params={'scale': 30})
+
+
+@pytest.mark.parametrize('variant', [
+    # Ring started at another vertex, and wound the other way.
+    _polygon(RING[2:-1] + RING[:3], HOLE),
+    _polygon(RING[::-1], HOLE[::-1]),
+    # Coordinates differing below the key precision.
+    _polygon([[x + 1e-9, y - 1e-9] for x, y in RING], HOLE),
+    # The same geometry as a Feature and as a FeatureCollection, with properties.
+    {'type': 'Feature', 'properties': {'name': 'roi'}, 'geometry': _polygon(RING, HOLE)},
+    {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {}, 'geometry': _polygon(RING, HOLE)}
+    ]},
+])
+def test_equivalent_geometries_share_a_key(variant):
+    assert _key(variant) == _key(_polygon(RING, HOLE))
+
+
+def test_different_geometries_and_params_get_different_keys():
+    assert _key(_polygon(RING)) != _key(_polygon(RING, HOLE))
+    assert _key(_polygon([[x + 1e-5, y] for x, y in RING])) != _key(_polygon(RING))
+    assert analysis_key(_polygon(RING), DATES, params={'scale': 10}) != _key(_polygon(RING))
+
+
+def _age(cache, key, seconds_ago):
+    meta = cache.path(key, 'meta.json')
+    mtime = os.path.getmtime(meta) - seconds_ago
+    os.utime(meta, (mtime, mtime))
+
+
+def _entries(cache):
+    return sorted(name for name in os.listdir(cache.root) if cache.get(name) is not None)
+
+
+def test_entry_limit_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=3)
+    for age, key in enumerate(['d', 'c', 'b', 'a']):
+        cache.put(key, {'value': key})
+        _age(cache, key, 100 - age)
+    cache.put('e', {'value': 'e'})
+    # 'd' went when 'a' arrived, 'c' (then the oldest) when 'e' did.
+    assert _entries(cache) == ['a', 'b', 'e']
+
+
+def test_byte_limit_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    payload = {'value': 'x' * 1000}
+    for age, key in enumerate(['c', 'b', 'a']):
+        cache.put(key, payload)
+        _age(cache, key, 100 - age)
+    cache.max_bytes = 2 * os.path.getsize(cache.path('a', 'meta.json')) + 10
+    cache.put('d', payload)
+    assert _entries(cache) == ['a', 'd']
+    assert cache.stats()['bytes'] <= cache.max_bytes
+
+
+def test_get_refreshes_recency(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=2)
+    cache.put('old', {'value': 1})
+    _age(cache, 'old', 100)
+    cache.put('new', {'value': 2})
+    _age(cache, 'new', 50)
+    assert cache.get('old')['stats'] == {'value': 1}
+    cache.put('newest', {'value': 3})
+    assert not os.path.exists(cache.path('new', 'meta.json'))
+    assert cache.get('old') is not None and cache.get('newest') is not None
+
+
+def test_interrupted_put_leaves_no_partial_entry(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    cache.put('key', {'value': 1})
+    source = tmp_path / 'mask.tif'
+    source.write_bytes(b'\0' * 100)
+
+    def interrupted_dump(obj, f):
+        f.write('{"stats": ')
+        raise OSError("disk full")
+
+    monkeypatch.setattr(result_cache.json, 'dump', interrupted_dump)
+    for key in ('key', 'other'):
+        with pytest.raises(OSError):
+            cache.put(key, {'value': 2}, files={'mask.tif': str(source)})
+    monkeypatch.undo()
+
+    assert cache.get('key')['stats'] == {'value': 1}
+    assert cache.get('other') is None
+    assert os.listdir(cache.root) == ['key']
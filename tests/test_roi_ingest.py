@@ -0,0 +1,42 @@
+import io
+import json
+
+import pytest
+
+import roi_ingest
+
+pytest.importorskip('shapely')
+
+
+def _districts(count=3):
+    features = []
+    for i in range(count):
+        x0 = 30.9 + 0.1 * i
+        ring = [[x0, 30.4], [x0 + 0.1, 30.4], [x0 + 0.1, 30.5], [x0, 30.5], [x0, 30.4]]
+        features.append({'type': 'Feature', 'properties': {'name': f"district_{i}", 'code': i},
+                         'geometry': {'type': 'Polygon', 'coordinates': [ring]}})
+    return io.BytesIO(json.dumps({'type': 'FeatureCollection', 'features': features}).encode())
+
+
+def test_upload_dissolves_by_default():
+    result = roi_ingest.ingest_upload(_districts(), 'districts.geojson')
+    assert result['features'] == 3
+    assert result['geojson']['type'] == 'Feature'
+
+
+def test_upload_keeps_features_without_dissolve():
+    result = roi_ingest.ingest_upload(_districts(), 'districts.geojson', dissolve=False)
+    features = result['geojson']['features']
+    assert [f['properties'] for f in features] == [{'name': f"district_{i}", 'code': i} for i in range(3)]
+
+
+def test_app_upload_in_per_feature_mode():
+    app = pytest.importorskip('flood_app_streamlit')
+
+    per_feature = app.load_upload('file-1', 'districts.geojson', 10.0, False, _districts())
+    assert per_feature['geojson']['type'] == 'FeatureCollection'
+    assert [f['properties']['name'] for f in per_feature['geojson']['features']] == [
+        'district_0', 'district_1', 'district_2'
+    ]
+    single = app.load_upload('file-1', 'districts.geojson', 10.0, True, _districts())
+    assert single['geojson']['type'] == 'Feature'
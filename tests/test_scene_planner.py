@@ -0,0 +1,35 @@
+import pytest
+
+import scene_planner
+
+pytest.importorskip('shapely')
+
+ROI = {'type': 'Polygon', 'coordinates': [[[30.8, 30.4], [31.0, 30.4], [31.0, 30.6], [30.8, 30.6], [30.8, 30.4]]]}
+FOOTPRINT = {'type': 'Polygon', 'coordinates': [[[30.5, 30.0], [31.5, 30.0], [31.5, 31.0], [30.5, 31.0],
+                                                  [30.5, 30.0]]]}
+
+
+def _scene(scene_id, time, orbit, orbit_pass='ASCENDING'):
+    return {'id': scene_id, 'time': time, 'orbit': orbit, 'pass': orbit_pass, 'footprint': FOOTPRINT}
+
+
+def test_plan_picks_one_orbit_or_the_requested_one():
+    before = [_scene('b58', 1, 58), _scene('b160', 2, 160)]
+    after = [_scene('a58', 10, 58), _scene('a160', 11, 160)]
+
+    plan = scene_planner.plan_scenes(before, after, ROI)
+    # Equal coverage and scene counts: the latest after-event acquisition wins.
+    assert (plan['orbit'], plan['before'], plan['after']) == (160, ['b160'], ['a160'])
+    plan = scene_planner.plan_scenes(before, after, ROI, orbit=58)
+    assert (plan['orbit'], plan['before'], plan['after']) == (58, ['b58'], ['a58'])
+    assert scene_planner.plan_scenes(before, after, ROI, orbit=131) is None
+
+
+def test_no_plan_without_coverage_in_both_windows():
+    elsewhere = dict(FOOTPRINT, coordinates=[[[x + 2, y] for x, y in FOOTPRINT['coordinates'][0]]])
+    before = [_scene('b58', 1, 58)]
+    after = [dict(_scene('a58', 10, 58), footprint=elsewhere)]
+    assert scene_planner.plan_scenes(before, after, ROI) is None
+    # A point ROI has no area to cover.
+    point = {'type': 'Point', 'coordinates': [30.9, 30.5]}
+    assert scene_planner.plan_scenes(before, [_scene('a58', 10, 58)], point) is None
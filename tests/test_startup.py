@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from synthetic import APP_RUN
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Packages each module must leave unimported: flood_core is used without Streamlit or the mapping
+# stack, and the app imports the mapping stack only when a map or upload needs it.
+DEFERRED_IMPORTS = {
+    'flood_core': ('streamlit', 'geemap', 'folium', 'pandas', 'geopandas'),
+    'flood_app_streamlit': ('geemap', 'folium', 'pandas', 'geopandas'),
+}
+
+
+def _run(code, **env):
+    proc = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                          env=dict(os.environ, **env))
+    assert proc.returncode == 0, proc.stderr
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize('module', sorted(DEFERRED_IMPORTS))
+def test_import_defers_heavy_packages(module):
+    pytest.importorskip(module)
+    deferred = list(DEFERRED_IMPORTS[module])
+    code = f"import json, sys; import {module}; print(json.dumps([m for m in {deferred!r} if m in sys.modules]))"
+    assert _run(code) == []
+
+
+def test_page_renders_without_errors(tmp_path):
+    pytest.importorskip('streamlit.testing.v1')
+    pytest.importorskip('flood_app_streamlit')
+    run = _run(APP_RUN.format(path=os.path.join(ROOT, 'flood_app_streamlit.py')), FLOOD_CACHE_DIR=str(tmp_path))
+    assert run['errors'] == []
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+import fake_ee
+import static_layers
+from static_layers import StaticLayerStore
+
+ASSET_ROOT = 'projects/nile/assets/static'
+
+
+class TaskStates:
+    """status_fn stand-in: reports the state set for each task id, UNKNOWN for any other."""
+
+    def __init__(self):
+        self.states = {}
+        self.polls = []
+
+    def __call__(self, task_id):
+        self.polls.append(task_id)
+        return {'id': task_id, 'state': self.states.get(task_id, 'UNKNOWN')}
+
+
+@pytest.fixture
+def catalog():
+    return fake_ee.synthetic_catalog(64)
+
+
+@pytest.fixture
+def exports(monkeypatch):
+    started = []
+
+    def start_task(task):
+        started.append(task)
+        task.start()
+
+    monkeypatch.setattr(static_layers, 'start_task', start_task)
+    return started
+
+
+def _slope_mask(store, catalog, **params):
+    with fake_ee.use_fake_ee(catalog, modules=('static_layers', 'ee_client')):
+        return store.slope_mask(fake_ee.Geometry(catalog.roi()), catalog.roi(), **params)
+
+
+@pytest.mark.parametrize('ended', ['FAILED', 'CANCELLED', 'UNKNOWN'])
+def test_asset_export_is_polled_sparingly_and_redone_when_it_ends_badly(tmp_path, catalog, exports, monkeypatch,
+                                                                         ended):
+    status = TaskStates()
+    store = StaticLayerStore(str(tmp_path), asset_root=ASSET_ROOT, status_fn=status)
+    built = _slope_mask(store, catalog)
+    assert len(exports) == 1 and exports[0].asset_id.startswith(ASSET_ROOT)
+
+    # A pending task's state is trusted for STATUS_TTL: no poll and no second export.
+    _slope_mask(store, catalog)
+    assert status.polls == [] and len(exports) == 1
+
+    monkeypatch.setattr(static_layers, 'STATUS_TTL', 0)
+    status.states[exports[0].id] = 'RUNNING'
+    _slope_mask(store, catalog)
+    assert status.polls == [exports[0].id] and len(exports) == 1
+
+    status.states[exports[0].id] = ended
+    _slope_mask(store, catalog)
+    assert len(exports) == 2 and exports[1].asset_id == exports[0].asset_id
+
+    status.states[exports[1].id] = 'COMPLETED'
+    loaded = _slope_mask(store, catalog)
+    polls = len(status.polls)
+    _slope_mask(store, catalog)
+    assert len(status.polls) == polls and len(exports) == 2
+    np.testing.assert_array_equal(loaded.bands['slope'], built.bands['slope'])
+
+
+def test_dem_source_and_cutoff_select_separate_layers(tmp_path, catalog, exports):
+    catalog.images['USGS/other_dem'] = catalog.images[fake_ee.DEM_IMAGE]
+    store = StaticLayerStore(str(tmp_path), asset_root=ASSET_ROOT, status_fn=TaskStates())
+    _slope_mask(store, catalog)
+    _slope_mask(store, catalog)
+    _slope_mask(store, catalog, slope_limit=3)
+    _slope_mask(store, catalog, dem_source='USGS/other_dem')
+    assert len({task.asset_id for task in exports}) == len(exports) == 3
+
+
+def test_without_asset_root_layers_are_built_on_the_fly(tmp_path, catalog, exports):
+    store = StaticLayerStore(str(tmp_path), asset_root='', status_fn=TaskStates())
+    mask = _slope_mask(store, catalog)
+    assert exports == []
+    # The synthetic DEM's steep corner is the only masked area.
+    assert 0 < np.mean(mask.bands['slope'] == 0) < 0.1
+
+
+def _write_dem(path, grid, slope):
+    import rasterio
+
+    crs, transform, width, height = grid
+    x = np.arange(width, dtype=np.float32)[None, :].repeat(height, axis=0)
+    with rasterio.open(path, 'w', driver='GTiff', dtype='float32', count=1, width=width, height=height,
+                       crs=crs, transform=transform) as dst:
+        dst.write(x * slope, 1)
+
+
+def test_local_slope_mask_is_stored_once_per_dem_and_cutoff(tmp_path):
+    pytest.importorskip('rasterio')
+    from affine import Affine
+    from rasterio.crs import CRS
+
+    grid = (CRS.from_epsg(32636), Affine(30, 0, 300000, 0, -30, 3400000), 64, 48)
+    dem = str(tmp_path / 'dem.tif')
+    # 2 m rise per 30 m pixel: about 3.8 degrees everywhere.
+    _write_dem(dem, grid, 2)
+    store = StaticLayerStore(str(tmp_path / 'store'))
+
+    def mask(limit):
+        return np.array(store.local_slope_mask(dem, grid, str(tmp_path), slope_limit=limit, block_size=16).array)
+
+    def stored():
+        return sorted(name for name in (tmp_path / 'store').iterdir() if name.suffix == '.tif')
+
+    first = mask(5)
+    assert len(stored()) == 1
+    np.testing.assert_array_equal(mask(5), first)
+    assert len(stored()) == 1
+    assert np.isnan(mask(3)).all() and np.isfinite(first).all()
+    assert len(stored()) == 2
+
+    # A rewritten DEM is a new source: the stored mask for the old file is not reused.
+    _write_dem(dem, grid, 4)
+    assert np.isnan(mask(5)).all()
+    assert len(stored()) == 3
@@ -0,0 +1,75 @@
+import math
+
+import numpy as np
+import pytest
+
+import tiling
+
+rasterio = pytest.importorskip('rasterio')
+
+PIXEL_DEGREES = 0.0003  # ~30 m, the analysis scale
+
+
+def _write_scenes(tmp_path, size=200, seed=0):
+    """Before/after VV GeoTIFFs at 30 m; the after scene's flood is a coin-flip mix of water and land
+    everywhere, so the speckle filter and focalMode results depend on the full filter reach at seams."""
+    from affine import Affine
+
+    rng = np.random.default_rng(seed)
+    transform = Affine(PIXEL_DEGREES, 0, 31.0, 0, -PIXEL_DEGREES, 30.0)
+    y, x = np.mgrid[0:size, 0:size]
+    river = np.abs(x - size / 2 - size / 8 * np.sin(y / (size / 6))) < size / 40
+    patchy = rng.random((size, size)) < 0.5
+
+    def scene(water):
+        power = 10 ** (np.where(water, -21.0, -8.0) / 10) * rng.gamma(4, 1 / 4, water.shape)
+        return (10 * np.log10(power)).astype(np.float32)
+
+    paths = []
+    for name, data in (('before_0', scene(river)), ('before_1', scene(river)), ('after', scene(river | patchy))):
+        path = tmp_path / f"{name}.tif"
+        with rasterio.open(path, 'w', driver='GTiff', dtype='float32', count=1, width=size, height=size,
+                           crs='EPSG:4326', transform=transform) as dst:
+            dst.write(data, 1)
+        paths.append(str(path))
+    west, north = transform.c, transform.f
+    east, south = west + size * PIXEL_DEGREES, north - size * PIXEL_DEGREES
+    roi = {'type': 'Polygon', 'coordinates': [[[west, south], [east, south], [east, north], [west, north],
+                                                [west, south]]]}
+    return roi, paths[:2], paths[2:]
+
+
+def test_pad_for_scale():
+    assert tiling.pad_for_scale(30) == 180
+    assert tiling.pad_for_scale(10) == tiling.PAD_PIXELS * tiling.NATIVE_SCALE
+    assert tiling.pad_for_scale(30, directional_lee=True) == 240
+
+
+def test_make_tiles_pads_by_pad_m():
+    from shapely.geometry import shape
+
+    roi = {'type': 'Polygon', 'coordinates': [[[31.0, 30.0], [31.1, 30.0], [31.1, 30.1], [31.0, 30.1],
+                                                [31.0, 30.0]]]}
+    tile = tiling.make_tiles(roi, 5000, pad_m=180)[0]
+    # The first tile's north and east edges are seams inside the ROI, so the pad is not clipped away.
+    core, padded = shape(tile.core).bounds, shape(tile.padded).bounds
+    assert (padded[3] - core[3]) * 110540 == pytest.approx(180, rel=1e-6)
+    assert (padded[2] - core[2]) * 111320 * math.cos(math.radians(30.05)) == pytest.approx(180, rel=1e-6)
+
+
+def test_tiled_matches_untiled_across_seams(tmp_path):
+    import local_engine
+
+    roi, before, after = _write_scenes(tmp_path)
+    tiled = tiling.run_tiled_flood_analysis_local(roi, before, after, workdir=str(tmp_path), tile_size_m=2000,
+                                                  max_workers=2)
+    assert tiled['tiles'] > 1
+    whole = local_engine.run_flood_analysis_local(roi, before, after, workdir=str(tmp_path),
+                                                  threshold=tiled['threshold'])
+
+    tiled_mask = np.asarray(tiled['flood_mask'].array)
+    whole_mask = np.asarray(whole['flood_mask'].array)
+    assert np.nansum(whole_mask) > 0
+    np.testing.assert_array_equal(np.isnan(tiled_mask), np.isnan(whole_mask))
+    np.testing.assert_array_equal(tiled_mask, whole_mask)
+    assert tiled['flood_area'] == pytest.approx(whole['flood_area'], rel=1e-6)
@@ -0,0 +1,102 @@
+import datetime
+import json
+import logging
+import os
+
+import pytest
+
+import flood_core
+import watcher
+from synthetic import scene_feed
+
+T0 = datetime.datetime(2025, 10, 1, tzinfo=datetime.timezone.utc).timestamp()
+STATS = {'threshold': -15.0, 'flood_area': 2e6, 'roi_area': 1e8}
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'sample_roi.geojson')
+
+
+@pytest.fixture
+def paths(tmp_path):
+    registry = str(tmp_path / 'registry.json')
+    watcher.register_roi('sample', SAMPLE, path=registry)
+    return {'registry_path': registry, 'state_path': str(tmp_path / 'state.json'),
+            'results_path': str(tmp_path / 'results.jsonl')}
+
+
+def _records(paths):
+    with open(paths['results_path']) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_same_day_orbits_are_analysed_separately(paths, monkeypatch):
+    acquired = int((T0 + 86400 + 4 * 3600) * 1000)
+    scenes = [{'id': f"S1A_{orbit}_{frame}", 'time': acquired + orbit * 60000 + frame * 25000, 'orbit': orbit,
+               'pass': 'ASCENDING'} for orbit in (58, 160) for frame in range(2)]
+    calls = []
+
+    def run_cached_analysis(roi, roi_geojson, dates, **kwargs):
+        calls.append(kwargs)
+        return dict(STATS, scenes={'orbit': kwargs['orbit']}), {}
+
+    monkeypatch.setattr(flood_core, 'geojson_to_ee_geometry', lambda geojson: geojson)
+    monkeypatch.setattr(flood_core, 'run_cached_analysis', run_cached_analysis)
+    instance = watcher.AcquisitionWatcher(query_fn=lambda *args: scenes, clock=lambda: T0 + 2 * 86400, **paths)
+    instance.poll_once()
+
+    # The default registry ROI (Menofia) and the sample ROI each get one job per orbit.
+    records = [r for r in _records(paths) if r['roi'] == 'sample']
+    assert sorted((r['orbit'], tuple(r['scenes'])) for r in records) == [
+        (58, ('S1A_58_0', 'S1A_58_1')), (160, ('S1A_160_0', 'S1A_160_1'))
+    ]
+    assert sorted(call['orbit'] for call in calls) == [58, 58, 160, 160]
+    assert all(call['orbit_pass'] == 'ASCENDING' and call['plan_scenes'] for call in calls)
+
+
+def test_orbit_is_part_of_the_analysis_cache_key(monkeypatch):
+    keys = []
+
+    class RecordingCache:
+        def get(self, key):
+            keys.append(key)
+            return {'stats': dict(STATS), 'graphs': {}}
+
+    monkeypatch.setattr(flood_core, 'get_result_cache', RecordingCache)
+    roi_geojson = {'type': 'Polygon', 'coordinates': [[[31.0, 30.0], [31.1, 30.0], [31.1, 30.1], [31.0, 30.0]]]}
+    dates = list(watcher.analysis_dates('2025-10-02'))
+    for orbit in (58, 160, 58):
+        flood_core.run_cached_analysis(None, roi_geojson, dates, orbit_pass='ASCENDING', orbit=orbit)
+    assert keys[0] != keys[1] and keys[0] == keys[2]
+
+
+def test_each_pass_is_analysed_once_across_restart_and_failure(paths, caplog):
+    caplog.set_level(logging.CRITICAL, logger='watcher')  # the injected failure is expected
+    days, interval = 9, 3600
+    feed = scene_feed(T0, days)
+    sim = {'now': T0}
+
+    def query(roi_geojson, start_ms, end_ms, orbit_pass):
+        return [scene for scene, ingest in feed if ingest <= sim['now'] and start_ms <= scene['time'] < end_ms]
+
+    failures = {'S1A_131_002_0'}
+
+    def analyse(roi_geojson, dates, job):
+        if failures & {s['id'] for s in job.scenes}:
+            failures.clear()
+            raise RuntimeError("Computation timed out.")
+        return STATS
+
+    polls = days * 86400 // interval
+    instance = None
+    for poll in range(polls + 1):
+        if instance is None or poll == polls // 2:
+            # A fresh instance on the same files is a restarted service.
+            instance = watcher.AcquisitionWatcher(query_fn=query, analyze_fn=analyse, clock=lambda: sim['now'],
+                                                  **paths)
+        sim['now'] = T0 + poll * interval
+        instance.poll_once()
+
+    records = _records(paths)
+    assert not failures and sum(r['status'] == 'error' for r in records) == 1
+    ok = [(r['roi'], r['day'], r['pass'], r['orbit']) for r in records if r['status'] == 'ok']
+    expected = {(s['time'] // 86400000, s['orbit']) for s, ingest in feed if ingest <= sim['now']}
+    assert len(ok) == len(set(ok)) == 2 * len(expected)
+    assert all(r['latency_s'] >= 0 for r in records if r['status'] == 'ok')
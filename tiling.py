@@ -0,0 +1,203 @@
+"""Split large ROIs into overlap-padded tiles and run them on a bounded worker pool."""
+import collections
+import contextvars
+import functools
+import logging
+import math
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
+from shapely.geometry import MultiPolygon, Polygon, box, mapping, shape
+from shapely.ops import unary_union
+
+import local_engine
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE_M = 20000
+NATIVE_SCALE = 10
+# Lee filter radius (1 px) plus focalMode radius x iterations (1 px x 5), in pixels of the analysis scale.
+PAD_PIXELS = 6
+# The directional Refined Lee reads a 7x7 window: 2 px further than the 3x3 Lee.
+DIRECTIONAL_LEE_EXTRA_PIXELS = 2
+MAX_WORKERS = 4
+RETRIES = 2
+BACKOFF = 1.0
+
+Tile = collections.namedtuple('Tile', ['index', 'core', 'padded'])
+
+
+class TileError(RuntimeError):
+    """A tile kept failing after all retries."""
+
+
+def _roi_shape(geojson_data):
+    gtype = geojson_data.get('type')
+    if gtype == 'FeatureCollection':
+        geoms = [shape(f['geometry']) for f in geojson_data.get('features', []) if f.get('geometry')]
+    elif gtype == 'Feature':
+        geoms = [shape(geojson_data['geometry'])]
+    else:
+        geoms = [shape(geojson_data)]
+    if not geoms:
+        raise ValueError("GeoJSON FeatureCollection has no valid geometries")
+    return unary_union([g.buffer(0) for g in geoms])
+
+
+def _polygonal(geom):
+    if isinstance(geom, (Polygon, MultiPolygon)):
+        return geom
+    parts = [g for g in getattr(geom, 'geoms', []) if isinstance(g, (Polygon, MultiPolygon))]
+    return unary_union(parts) if parts else Polygon()
+
+
+def pad_for_scale(scale=NATIVE_SCALE, directional_lee=False):
+    """Tile padding in metres covering the speckle filter and focalMode reach at ``scale`` m per pixel."""
+    return (PAD_PIXELS + (DIRECTIONAL_LEE_EXTRA_PIXELS if directional_lee else 0)) * scale
+
+
+def make_tiles(geojson_data, tile_size_m=TILE_SIZE_M, pad_m=PAD_PIXELS * NATIVE_SCALE):
+    """Cut the ROI (EPSG:4326 GeoJSON) into a regular grid of tiles.
+
+    ``core`` is the tile cell intersected with the ROI; cores never overlap, so per-tile areas can be
+    summed. ``padded`` grows the cell by ``pad_m`` so neighbourhood filters see real pixels at seams;
+    callers pass pad_for_scale() of the scale the tiles are evaluated at.
+    """
+    roi = _roi_shape(geojson_data)
+    min_lon, min_lat, max_lon, max_lat = roi.bounds
+    lat = math.radians((min_lat + max_lat) / 2)
+    dlat = tile_size_m / 110540
+    dlon = tile_size_m / (111320 * max(math.cos(lat), 1e-6))
+    pad_lat = pad_m / 110540
+    pad_lon = pad_m / (111320 * max(math.cos(lat), 1e-6))
+
+    origin_lon = math.floor(min_lon / dlon) * dlon
+    origin_lat = math.floor(min_lat / dlat) * dlat
+    cols = max(1, math.ceil((max_lon - origin_lon) / dlon))
+    rows = max(1, math.ceil((max_lat - origin_lat) / dlat))
+
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            x0, y0 = origin_lon + col * dlon, origin_lat + row * dlat
+            core = _polygonal(roi.intersection(box(x0, y0, x0 + dlon, y0 + dlat)))
+            if core.is_empty or core.area == 0:
+                continue
+            padded = _polygonal(roi.intersection(
+                box(x0 - pad_lon, y0 - pad_lat, x0 + dlon + pad_lon, y0 + dlat + pad_lat)
+            ))
+            tiles.append(Tile(len(tiles), mapping(core), mapping(padded)))
+    return tiles
+
+
+def _in_context(context, worker, tile):
+    # A Context can only be entered by one thread at a time, so each call runs in its own copy.
+    return context.copy().run(worker, tile)
+
+
+def run_tiles(tiles, worker, max_workers=MAX_WORKERS, use_processes=False, retries=RETRIES, backoff=BACKOFF):
+    """Run ``worker(tile)`` for every tile on a bounded pool and return results in tile order.
+
+    Threads suit Earth Engine requests; processes suit the CPU-bound local path (the worker must then
+    be picklable). Failed tiles are resubmitted with exponential backoff up to ``retries`` times.
+    Thread workers run in a copy of the caller's context, so instrumentation stages attach to its run.
+    """
+    if not use_processes:
+        worker = functools.partial(_in_context, contextvars.copy_context(), worker)
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    results = {}
+    attempts = collections.Counter()
+    with executor_cls(max_workers=max_workers) as executor:
+        pending = {executor.submit(worker, tile): tile for tile in tiles}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                tile = pending.pop(future)
+                try:
+                    results[tile.index] = future.result()
+                except Exception as e:
+                    attempts[tile.index] += 1
+                    if attempts[tile.index] > retries:
+                        raise TileError(f"Tile {tile.index} failed after {retries} retries: {e}") from e
+                    delay = backoff * 2 ** (attempts[tile.index] - 1)
+                    logger.warning("tile %d failed (%s), retrying in %.1fs", tile.index, e, delay)
+                    time.sleep(delay)
+                    pending[executor.submit(worker, tile)] = tile
+    return [results[tile.index] for tile in sorted(tiles, key=lambda t: t.index)]
+
+
+def merge_areas(areas):
+    """Exactly rounded sum, so the merged area does not depend on tile completion order."""
+    return math.fsum(areas)
+
+
+def _local_tile_worker(tile, before_paths, after_paths, dem_path, threshold, workdir):
+    try:
+        results = local_engine.run_flood_analysis_local(
+            tile.padded, before_paths, after_paths, dem_path=dem_path, workdir=workdir,
+            threshold=threshold, area_roi=tile.core
+        )
+    except local_engine.NoOverlapError:
+        return None
+    rasters = {}
+    for name in ('before_filtered', 'after_filtered', 'flood_mask'):
+        raster = results[name]
+        raster.array.flush()
+        rasters[name] = (raster.array.filename, raster.shape, raster.transform)
+    return {'flood_area': results['flood_area'], 'roi_area': results['roi_area'], 'rasters': rasters}
+
+
+def _paste_core(out, grid, tile, path, shape, transform, block_size=local_engine.BLOCK_SIZE):
+    src = np.memmap(path, dtype=np.float32, mode='r', shape=shape)
+    res = grid[1].a
+    row_off = round((grid[1].f - transform.f) / res)
+    col_off = round((transform.c - grid[1].c) / res)
+    tile_grid = (grid[0], transform, shape[1], shape[0])
+    for rows, cols in local_engine.iter_blocks(shape, block_size):
+        inside = local_engine.roi_mask([tile.core], tile_grid, rows, cols)
+        r0, c0 = rows.start + row_off, cols.start + col_off
+        r1, c1 = min(rows.stop + row_off, out.shape[0]), min(cols.stop + col_off, out.shape[1])
+        if r0 < 0 or c0 < 0 or r0 >= r1 or c0 >= c1:
+            continue
+        inside = inside[:r1 - r0, :c1 - c0]
+        target = np.asarray(out[r0:r1, c0:c1])
+        target[inside] = np.asarray(src[rows, cols])[:r1 - r0, :c1 - c0][inside]
+        out[r0:r1, c0:c1] = target
+
+
+def run_tiled_flood_analysis_local(roi, before_paths, after_paths, dem_path=None, workdir=None,
+                                   tile_size_m=TILE_SIZE_M, max_workers=MAX_WORKERS, retries=RETRIES):
+    """Tiled, process-parallel run_flood_analysis_local with one global threshold and seam-free merge."""
+    workdir = tempfile.mkdtemp(prefix='flood_tiles_', dir=workdir)
+    threshold = local_engine.estimate_threshold(roi, before_paths, workdir)
+    roi_geoms = local_engine.roi_geometries(roi)
+    grid = local_engine.analysis_grid(list(before_paths) + list(after_paths), roi_geoms)
+    crs, transform, width, height = grid
+    tiles = make_tiles(roi, tile_size_m, pad_m=pad_for_scale(local_engine.pixel_size_m(crs, transform, height)))
+    worker = functools.partial(
+        _local_tile_worker, before_paths=list(before_paths), after_paths=list(after_paths),
+        dem_path=dem_path, threshold=threshold, workdir=workdir
+    )
+    tile_results = run_tiles(tiles, worker, max_workers, use_processes=True, retries=retries)
+
+    merged = {}
+    for name in ('before_filtered', 'after_filtered', 'flood_mask'):
+        out = local_engine.scratch((height, width), workdir, f"merged_{name}")
+        for tile, result in zip(tiles, tile_results):
+            if result is not None:
+                _paste_core(out, grid, tile, *result['rasters'][name])
+        out.flush()
+        merged[name] = local_engine.LocalRaster(out, transform, crs)
+
+    done = [r for r in tile_results if r is not None]
+    return {
+        'before_filtered': merged['before_filtered'],
+        'after_filtered': merged['after_filtered'],
+        'flood_mask': merged['flood_mask'],
+        'threshold': threshold,
+        'flood_area': merge_areas(r['flood_area'] for r in done),
+        'roi_area': local_engine.geodesic_area(roi_geoms),
+        'tiles': len(tiles)
+    }
@@ -0,0 +1,305 @@
+"""Acquisition watcher: analyse new Sentinel-1 passes over registered ROIs as they reach the catalog.
+
+python watcher.py [--once] [--interval 1800] [-j 2]        (python watcher.py --add ID ROI to register)
+
+Each poll asks the catalog, once per registered ROI, for scenes acquired since the ROI's watermark.
+New scenes are grouped by acquisition day, pass and relative orbit, and each group becomes one flood
+analysis (its day is the post-event window, the BEFORE_DAYS before it the pre-event window) on a
+bounded pool. Results are appended to a JSON lines file, and the watermark and the ids of processed
+scenes are saved after every finished job, so a restart repeats nothing. Scenes reach the catalog
+hours after acquisition, so each query starts INGEST_LAG_S before the watermark and skips scenes
+already processed.
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+from flood_cli import _load_roi
+from result_cache import CACHE_DIR
+from scene_planner import INGEST_LAG_S
+
+logger = logging.getLogger(__name__)
+
+WATCH_DIR = os.path.join(CACHE_DIR, 'watcher')
+REGISTRY_PATH = os.path.join(WATCH_DIR, 'registry.json')
+STATE_PATH = os.path.join(WATCH_DIR, 'state.json')
+RESULTS_PATH = os.path.join(WATCH_DIR, 'results.jsonl')
+POLL_INTERVAL = 1800
+MAX_WORKERS = 2
+# One Sentinel-1 repeat cycle, so the pre-event window holds an acquisition from the same orbit.
+BEFORE_DAYS = 12
+# How far back the first poll of a newly registered ROI looks.
+INITIAL_LOOKBACK_S = 2 * 86400
+MENOFIA = {
+    'id': 'menofia',
+    'roi': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'menofia_3km.geojson'),
+    'orbit_pass': 'BOTH',
+}
+
+Job = collections.namedtuple('Job', ['roi_id', 'day', 'orbit_pass', 'orbit', 'scenes'])
+
+
+def load_registry(path=REGISTRY_PATH):
+    """Registered ROIs as dicts with id, roi (GeoJSON path or inline GeoJSON) and orbit_pass.
+
+    A missing registry starts with the shipped Menofia buffer.
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return [dict(MENOFIA)]
+
+
+def _write_json(path, payload):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(payload, f, indent=1)
+    os.replace(tmp, path)
+
+
+def register_roi(roi_id, roi, orbit_pass='BOTH', path=REGISTRY_PATH):
+    """Add or replace an ROI in the registry; returns the registry."""
+    rois = [r for r in load_registry(path) if r['id'] != roi_id]
+    rois.append({'id': roi_id, 'roi': roi, 'orbit_pass': orbit_pass})
+    _write_json(path, rois)
+    return rois
+
+
+def _iso(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def analysis_dates(day):
+    """(before_start, before_end, after_start, after_end) for an acquisition day 'YYYY-MM-DD'."""
+    after = datetime.strptime(day, '%Y-%m-%d')
+    return tuple(d.strftime('%Y-%m-%d') for d in (
+        after - timedelta(days=BEFORE_DAYS), after, after, after + timedelta(days=1)
+    ))
+
+
+def group_scenes(roi_id, scenes):
+    """One Job per (acquisition day, pass, relative orbit): adjacent frames of a pass are analysed together."""
+    groups = collections.defaultdict(list)
+    for scene in scenes:
+        groups[(_iso(scene['time'])[:10], scene['pass'], scene['orbit'])].append(scene)
+    return [Job(roi_id, day, orbit_pass, orbit, sorted(group, key=lambda s: s['time']))
+            for (day, orbit_pass, orbit), group in sorted(groups.items(), key=lambda item: item[0])]
+
+
+class WatchState:
+    """Per-ROI watermark (ms) and processed scene ids, saved atomically on every change."""
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._state = json.load(f)
+        except (OSError, ValueError):
+            self._state = {}
+
+    def _roi(self, roi_id):
+        return self._state.setdefault(roi_id, {'watermark': None, 'seen': {}})
+
+    def watermark(self, roi_id):
+        with self._lock:
+            return self._roi(roi_id)['watermark']
+
+    def seen(self, roi_id, scene_id):
+        with self._lock:
+            return scene_id in self._roi(roi_id)['seen']
+
+    def mark_done(self, roi_id, scenes):
+        with self._lock:
+            self._roi(roi_id)['seen'].update({s['id']: s['time'] for s in scenes})
+            _write_json(self.path, self._state)
+
+    def advance(self, roi_id, watermark):
+        """Raise the watermark and forget scene ids too old to be returned by a query again."""
+        with self._lock:
+            entry = self._roi(roi_id)
+            entry['watermark'] = max(entry['watermark'] or watermark, watermark)
+            horizon = entry['watermark'] - INGEST_LAG_S * 1000
+            entry['seen'] = {k: t for k, t in entry['seen'].items() if t >= horizon}
+            _write_json(self.path, self._state)
+
+
+def query_catalog(roi_geojson, start_ms, end_ms, orbit_pass):
+    """Scenes over the ROI acquired in [start_ms, end_ms), from the Earth Engine catalog."""
+    import flood_core
+    import scene_planner
+
+    roi = flood_core.geojson_to_ee_geometry(roi_geojson)
+    return scene_planner.query_scenes(roi, _iso(start_ms), _iso(end_ms), orbit_pass)
+
+
+def analyse(roi_geojson, dates, job):
+    """Stats of the cached flood analysis for a job (scenes planned within the job's pass and relative orbit)."""
+    import flood_core
+
+    roi = flood_core.geojson_to_ee_geometry(roi_geojson)
+    stats, _ = flood_core.run_cached_analysis(roi, roi_geojson, list(dates), orbit_pass=job.orbit_pass,
+                                              plan_scenes=True, orbit=job.orbit)
+    return stats
+
+
+def latency_summary(records):
+    """Count, median, 95th percentile and maximum of acquisition-to-result latency (s) of ok records."""
+    latencies = sorted(r['latency_s'] for r in records if r['status'] == 'ok')
+    if not latencies:
+        return {'jobs': 0}
+    return {
+        'jobs': len(latencies),
+        'median_s': latencies[len(latencies) // 2],
+        'p95_s': latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        'max_s': latencies[-1],
+    }
+
+
+class AcquisitionWatcher:
+    """Polls the catalog for the registered ROIs and runs new scene groups on a bounded pool.
+
+    ``query_fn(roi_geojson, start_ms, end_ms, orbit_pass)`` returns scene dicts (id, time, orbit,
+    pass) and ``analyze_fn(roi_geojson, dates, job)`` a stats dict with threshold, flood_area and
+    roi_area; both default to Earth Engine and can be replaced by fakes. ``clock`` returns Unix seconds.
+    """
+
+    def __init__(self, registry_path=REGISTRY_PATH, state_path=STATE_PATH, results_path=RESULTS_PATH,
+                 max_workers=MAX_WORKERS, query_fn=query_catalog, analyze_fn=analyse, clock=time.time):
+        self.registry_path = registry_path
+        self.results_path = results_path
+        self.max_workers = max_workers
+        self.state = WatchState(state_path)
+        self.query_fn = query_fn
+        self.analyze_fn = analyze_fn
+        self.clock = clock
+        self.queries = 0
+        self._results_lock = threading.Lock()
+
+    def new_jobs(self, entry, roi_geojson):
+        now_ms = int(self.clock() * 1000)
+        watermark = self.state.watermark(entry['id'])
+        start = now_ms - INITIAL_LOOKBACK_S * 1000 if watermark is None else watermark - INGEST_LAG_S * 1000
+        scenes = self.query_fn(roi_geojson, start, now_ms, entry.get('orbit_pass', 'BOTH'))
+        self.queries += 1
+        return group_scenes(entry['id'], [s for s in scenes if not self.state.seen(entry['id'], s['id'])])
+
+    def _run_job(self, roi_geojson, job):
+        start = time.perf_counter()
+        dates = analysis_dates(job.day)
+        stats = self.analyze_fn(roi_geojson, dates, job)
+        acquired = max(s['time'] for s in job.scenes) / 1000
+        return {
+            'roi': job.roi_id, 'day': job.day, 'pass': job.orbit_pass, 'orbit': job.orbit,
+            'scenes': [s['id'] for s in job.scenes], 'acquired': _iso(acquired * 1000), 'dates': dates,
+            'status': 'ok', 'threshold': stats['threshold'], 'flood_area_km2': (stats['flood_area'] or 0) / 1e6,
+            'roi_area_km2': stats['roi_area'] / 1e6, 'processing_s': round(time.perf_counter() - start, 3),
+            'latency_s': round(self.clock() - acquired, 3),
+        }
+
+    def _append(self, record):
+        with self._results_lock:
+            os.makedirs(os.path.dirname(self.results_path) or '.', exist_ok=True)
+            with open(self.results_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def poll_once(self):
+        """Query every ROI, run its new scene groups and persist results and state; returns the records."""
+        base_dir = os.path.dirname(os.path.abspath(self.registry_path))
+        jobs = []
+        roi_geojsons = {}
+        for entry in load_registry(self.registry_path):
+            try:
+                roi_geojsons[entry['id']] = _load_roi(entry['roi'], base_dir)
+                jobs += self.new_jobs(entry, roi_geojsons[entry['id']])
+            except Exception as e:
+                logger.error("catalog query for ROI %s failed: %s", entry['id'], e)
+        records = []
+        done = collections.defaultdict(list)
+        failed = collections.defaultdict(list)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._run_job, roi_geojsons[job.roi_id], job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    logger.error("analysis of %s %s failed: %s", job.roi_id, job.day, e)
+                    failed[job.roi_id] += [s['time'] for s in job.scenes]
+                    record = {'roi': job.roi_id, 'day': job.day, 'scenes': [s['id'] for s in job.scenes],
+                              'status': 'error', 'error': str(e)}
+                else:
+                    self.state.mark_done(job.roi_id, job.scenes)
+                    done[job.roi_id] += [s['time'] for s in job.scenes]
+                self._append(record)
+                records.append(record)
+        for roi_id, times in done.items():
+            # Failed scenes stay above the watermark so the next poll retries them.
+            watermark = max(times)
+            if failed[roi_id]:
+                watermark = min(watermark, min(failed[roi_id]) - 1)
+            self.state.advance(roi_id, watermark)
+        return records
+
+    def run(self, interval=POLL_INTERVAL, stop=None):
+        """Poll every ``interval`` seconds until ``stop`` (a threading.Event) is set."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            start = time.perf_counter()
+            records = self.poll_once()
+            if records:
+                logger.info("poll: %s", json.dumps(latency_summary(records)))
+            stop.wait(max(0.0, interval - (time.perf_counter() - start)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse new Sentinel-1 acquisitions over registered ROIs.")
+    parser.add_argument('--registry', default=REGISTRY_PATH, help="ROI registry JSON (default: %(default)s)")
+    parser.add_argument('--state', default=STATE_PATH, help="watermark state JSON (default: %(default)s)")
+    parser.add_argument('--results', default=RESULTS_PATH, help="JSON lines results file (default: %(default)s)")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL, help="seconds between polls (default: %(default)s)")
+    parser.add_argument('-j', '--workers', type=int, default=MAX_WORKERS, help="concurrent analyses (default: %(default)s)")
+    parser.add_argument('--once', action='store_true', help="poll once and exit")
+    parser.add_argument('--add', nargs=2, metavar=('ID', 'ROI'), help="register an ROI (GeoJSON path) and exit")
+    parser.add_argument('--orbit-pass', default='BOTH', help="pass watched for --add (default: %(default)s)")
+    parser.add_argument('--list', action='store_true', help="print the registry and exit")
+    parser.add_argument('--project', help="Google Cloud project for Earth Engine")
+    parser.add_argument('--key-file', help="service account JSON key file")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log polls and per-stage timings")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    if args.add:
+        register_roi(args.add[0], os.path.abspath(args.add[1]), args.orbit_pass, args.registry)
+    if args.add or args.list:
+        json.dump(load_registry(args.registry), sys.stdout, indent=1)
+        print()
+        return 0
+
+    import flood_core
+    flood_core.initialize(project=args.project, key_file=args.key_file)
+
+    watcher = AcquisitionWatcher(args.registry, args.state, args.results, args.workers)
+    if args.once:
+        records = watcher.poll_once()
+        print(json.dumps(latency_summary(records)))
+        return 1 if any(r['status'] != 'ok' for r in records) else 0
+    try:
+        watcher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())